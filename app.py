@@ -1,4 +1,3 @@
-from classification import classify_channel
 """
 Flask backend for FIMI Operations classification and analysis platform.
 
@@ -9,29 +8,83 @@ Supports:
 - Mapping relationships between channels
 """
 
+import time
+_import_started = time.perf_counter()
+
+from classification import classify_channel, invalidate_catalog, get_engine
+from classification import indicator_types, link_new_type, relink_deleted_type
+import channel_classification
+import ingest
+import stix_export
+import reports
+import report_cache
+import prompts
+import ratelimit
+import batch_reports
+import pagination
+import revisions
+import search
+import artifacts
+import compression
+import events
+import metrics
+import serialization
+import simulation
+import timeline
+
 from flask import send_file,  Flask, request, jsonify
-from flask import send_file,  render_template
- 
-from openai import OpenAI
-import sqlite3
+from flask import send_file,  render_template, g, has_request_context, Response
 from flask_cors import CORS
+import db
+import migrations
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
 from CONF import MODEL, API_KEY, BASE_URL 
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=[pagination.CURSOR_HEADER])
 
 DB_FILE = 'fimi_ops.db'
 
 def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = db.acquire(DB_FILE)
+    if has_request_context():
+        g.setdefault('db_connections', []).append((conn, conn.checkout))
     return conn
 
+@app.teardown_request
+def release_db(exc):
+    # Hand back connections a route did not close itself, e.g. on an early return or error.
+    # The checkout makes this a no-op for connections the route closed and someone else acquired since.
+    for conn, checkout in g.pop('db_connections', []):
+        conn.close(checkout)
+
+# Per-route latency and SQL counts, see metrics.py
+@app.before_request
+def start_request_metrics():
+    metrics.request_started()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    elapsed, queries, query_seconds = metrics.request_finished(route, request.method, response.status_code)
+    response.headers['Server-Timing'] = (f'db;dur={query_seconds * 1000:.1f};desc="{queries} queries", '
+                                         f'app;dur={elapsed * 1000:.1f}')
+    return response
+
+# gzip/brotli by Accept-Encoding, see compression.py
+@app.after_request
+def compress_response(response):
+    return compression.compress(response, request.accept_encodings)
+
 def init_db():
     with open('schema.sql', 'r') as f:
         schema = f.read()
     conn = get_db()
     conn.executescript(schema)
+    applied = migrations.migrate(conn)
 
     # Only seed indicator_types if empty
     if conn.execute("SELECT COUNT(*) FROM indicator_types").fetchone()[0] == 0:
@@ -60,9 +113,73 @@ def init_db():
             VALUES (?, ?, ?, ?, ?)
         """, indicators)
 
+    # Backfill the materialized classification state for databases created before it existed
+    channel_count = conn.execute("SELECT COUNT(*) FROM channels").fetchone()[0]
+    if conn.execute("SELECT COUNT(*) FROM channel_classification").fetchone()[0] != channel_count:
+        channel_classification.rebuild(conn)
+    # Like the artifact index below, the timeline added by migration 11 is folded in Python
+    elif 11 in applied:
+        channel_classification.rebuild_timeline(conn)
+    # The artifact index is extracted in Python, so the migration that adds it cannot fill it
+    if 9 in applied:
+        artifacts.rebuild(conn)
+
     conn.commit()
     conn.close()
 
+# ------------------------
+# APPLICATION FACTORY
+# ------------------------
+
+def db_ready():
+    """True when the database already has the latest schema and the seeded indicator types."""
+    conn = get_db()
+    try:
+        return (migrations.schema_version(conn) == migrations.LATEST_VERSION
+                and conn.execute("SELECT 1 FROM indicator_types LIMIT 1").fetchone() is not None)
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+@contextmanager
+def init_lock(path):
+    """Serialize init_db() across worker processes starting at the same time (no-op without fcntl)."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{path}.init.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def ensure_db():
+    """init_db() once per deployment: skipped when another process has already done it. Returns whether it ran."""
+    if db_ready():
+        return False
+    with init_lock(DB_FILE):
+        if db_ready():
+            return False
+        init_db()
+        return True
+
+def create_app():
+    """
+    Entry point for WSGI servers, e.g. gunicorn -w 4 'app:create_app()'.
+    The first worker to start on a new or outdated database runs init_db();
+    the others only check the schema version.
+    """
+    start = time.perf_counter()
+    initialized = ensure_db()
+    metrics.log.info("Worker %d ready: imported in %.0f ms, database %s in %.0f ms", os.getpid(),
+                     IMPORT_SECONDS * 1000, "initialized" if initialized else "checked",
+                     (time.perf_counter() - start) * 1000)
+    return app
+
 @app.route('/')
 def root():
     return render_template("index.html")
@@ -70,21 +187,66 @@ def root():
 @app.route('/indicator_types', methods=['GET'])
 def get_indicator_types():
     conn = get_db()
-    rows = conn.execute("SELECT * FROM indicator_types").fetchall()
+    types = indicator_types(conn)
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    return jsonify(types)
 
 
 # ------------------------
 # OPERATIONS
 # ------------------------
 
+# List endpoints are paginated: ?limit=&cursor=&fields= plus filters, see pagination.py
+@app.errorhandler(pagination.PageError)
+def page_error(e):
+    return jsonify({"error": str(e)}), 400
+
+def page_response(body, next_cursor):
+    response = jsonify(body)
+    if next_cursor:
+        response.headers[pagination.CURSOR_HEADER] = next_cursor
+    return response
+
+# Operation read endpoints carry an ETag from the operation's revision, see revisions.py
+response_cache = revisions.ResponseCache()
+
+def revision_response(route, op_id, build, variant=""):
+    """
+    Serve build(conn) for an operation under a strong ETag derived from its
+    revision: 304 if the client already has it, otherwise the cached or
+    freshly serialized body. Revision and data come from one read transaction.
+    """
+    conn = get_db()
+    conn.execute("BEGIN")
+    try:
+        revision = revisions.current(conn, op_id)
+        if revision is None:
+            return build(conn)
+        tag = revisions.etag(route, op_id, revision, variant)
+        # Weak comparison: compressed bodies carry the weak form of the tag
+        if request.if_none_match.contains_weak(tag):
+            response = Response(status=304)
+        else:
+            key = (route, op_id, revision, variant)
+            cached = response_cache.get(key)
+            if cached is None:
+                built = build(conn)
+                cached = (built.get_data(), [(k, v) for k, v in built.headers.items()
+                                             if k not in ('Content-Type', 'Content-Length')])
+                response_cache.put(key, *cached)
+            response = Response(cached[0], mimetype='application/json', headers=list(cached[1]))
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    finally:
+        conn.close()
+
 @app.route('/operations', methods=['GET'])
 def get_operations():
     conn = get_db()
-    rows = conn.execute("SELECT * FROM operations ORDER BY date_created DESC").fetchall()
+    items, next_cursor = pagination.fetch_page(conn, pagination.OPERATIONS_BY_DATE, request.args)
     conn.close()
-    return jsonify([dict(row) for row in rows])
+    return page_response(items, next_cursor)
 
 @app.route('/operations', methods=['POST'])
 def create_operation():
@@ -103,14 +265,34 @@ def create_operation():
 
 @app.route('/operations/<int:op_id>', methods=['GET'])
 def get_operation_detail(op_id):
+    def build(conn):
+        op = conn.execute("SELECT * FROM operations WHERE id = ?", (op_id,)).fetchone()
+        if not op:
+            return jsonify({"error": "Operation not found"}), 404
+        # Channels are paginated like the list endpoints; later pages repeat the operation
+        channels, next_cursor = pagination.fetch_page(conn, pagination.CHANNELS, request.args,
+                                                      "operation_id = ?", (op_id,))
+        return page_response({
+            "operation": dict(op),
+            "channels": channels,
+            "next_cursor": next_cursor
+        }, next_cursor)
+
+    return revision_response('operation', op_id, build, request.query_string.decode())
+
+@app.route('/operations/<int:op_id>/events', methods=['GET'])
+def operation_events(op_id):
+    """Server-Sent Events with the operation's changes as they commit (see events.py)."""
+    subscription = events.get_broker().subscribe(events.topic(op_id))
     conn = get_db()
-    op = conn.execute("SELECT * FROM operations WHERE id = ?", (op_id,)).fetchone()
-    channels = conn.execute("SELECT * FROM channels WHERE operation_id = ?", (op_id,)).fetchall()
+    revision = revisions.current(conn, op_id)
     conn.close()
-    return jsonify({
-        "operation": dict(op),
-        "channels": [dict(c) for c in channels]
-    })
+    if revision is None:
+        subscription.close()
+        return jsonify({"error": "Operation not found"}), 404
+    body = events.stream(subscription, op_id, revision, request.headers.get('Last-Event-ID'))
+    return Response(body, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # ------------------------
 # CHANNELS
@@ -126,8 +308,12 @@ def create_channel():
         VALUES (?, ?, ?, ?, ?)
     """, (data['operation_id'], data['name'], data.get('platform'),
           data.get('url'), data.get('notes')))
-    conn.commit()
     new_id = cur.lastrowid
+    channel_classification.channel_added(conn, new_id, data['operation_id'])
+    artifacts.channel_added(conn, new_id, data.get('url'))
+    revisions.bump(conn, data['operation_id'])
+    conn.commit()
+    events.publish_delta(conn, data['operation_id'], channels=[new_id])
     conn.close()
     return jsonify({"id": new_id})
 
@@ -142,6 +328,23 @@ def get_channel_detail(channel_id):
         "indicators": [dict(i) for i in indicators]
     })
 
+@app.route('/channels/<int:channel_id>/overlaps', methods=['GET'])
+def get_channel_overlaps(channel_id):
+    """Channels and operations sharing a domain, IP, wallet or ASN with this one: ?kind=domain,ip&limit= (see artifacts.py)."""
+    limit = pagination.parse_limit(request.args.get('limit'))
+    kinds = [k.strip() for k in request.args.get('kind', '').split(',') if k.strip()]
+    unknown = [k for k in kinds if k not in artifacts.KINDS]
+    if unknown:
+        return jsonify({"error": f"Unknown kinds {unknown}; available: {', '.join(artifacts.KINDS)}"}), 400
+
+    conn = get_db()
+    try:
+        if not conn.execute("SELECT 1 FROM channels WHERE id = ?", (channel_id,)).fetchone():
+            return jsonify({"error": "Channel not found"}), 404
+        return jsonify(artifacts.overlaps(conn, channel_id, kinds, limit))
+    finally:
+        conn.close()
+
 # ------------------------
 # INDICATORS
 # ------------------------
@@ -150,14 +353,25 @@ def get_channel_detail(channel_id):
 def add_indicator():
     data = request.json
     conn = get_db()
+    type_id = get_engine(conn).type_id(data['name'])
+    # When the indicator was observed, if known; CURRENT_TIMESTAMP format otherwise
+    timestamp = data.get('timestamp') or time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
     cur = conn.cursor()
     cur.execute("""
-        INSERT INTO indicators (channel_id, type, name, weight, confidence, evidence, source_type)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (data['channel_id'], data['type'], data['name'], data['weight'],
-          data['confidence'], data['evidence'], data.get('source_type')))
-    conn.commit()
+        INSERT INTO indicators
+        (channel_id, type, name, indicator_type_id, weight, confidence, evidence, source_type, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (data['channel_id'], data['type'], data['name'], type_id, data['weight'],
+          data['confidence'], data['evidence'], data.get('source_type'), timestamp))
     new_id = cur.lastrowid
+    channel_classification.indicator_added(conn, data['channel_id'], data['type'], data['name'],
+                                           data['weight'], data['confidence'], data['evidence'], type_id,
+                                           timestamp)
+    artifacts.indicator_added(conn, new_id, data['channel_id'], data['evidence'])
+    revisions.bump_for_channels(conn, [data['channel_id']])
+    conn.commit()
+    events.publish_delta(conn, events.operation_of(conn, 'channels', data['channel_id']),
+                         indicators=[new_id], reclassified=[data['channel_id']])
     conn.close()
     return jsonify({"id": new_id})
 
@@ -175,372 +389,384 @@ def add_link():
         VALUES (?, ?, ?, ?, ?, ?)
     """, (data['operation_id'], data['from_channel_id'], data['to_channel_id'],
           data['link_type'], data.get('confidence'), data.get('evidence')))
+    revisions.bump(conn, data['operation_id'])
     conn.commit()
     new_id = cur.lastrowid
+    events.publish_delta(conn, data['operation_id'], links=[new_id])
     conn.close()
     return jsonify({"id": new_id})
 
 @app.route('/links/<int:op_id>', methods=['GET'])
 def get_links(op_id):
     conn = get_db()
-    links = conn.execute("SELECT * FROM channel_links WHERE operation_id = ?", (op_id,)).fetchall()
+    links, next_cursor = pagination.fetch_page(conn, pagination.LINKS, request.args, "operation_id = ?", (op_id,))
+    conn.close()
+    return page_response(links, next_cursor)
+
+@app.route('/graph/<int:op_id>', methods=['GET'])
+def get_graph_analytics(op_id):
+    """Components, coordination clusters, centrality and propagated signals; see graph.py. ?top= cuts the lists."""
+    try:
+        top = max(1, int(request.args.get('top', 20)))
+    except ValueError:
+        return jsonify({"error": "top must be an integer"}), 400
+
+    # Imported here so workers that never serve /graph do not load numpy
+    import graph
+
+    def build(conn):
+        revision = revisions.current(conn, op_id)
+        if revision is None:
+            return jsonify({"error": "Operation not found"}), 404
+        return jsonify(graph.analyze(conn, op_id, revision, top))
+
+    # Propagation follows the classification, so the ETag covers the rule engine too
+    conn = get_db()
+    engine = get_engine(conn)
     conn.close()
-    return jsonify([dict(l) for l in links])
+    return revision_response('graph', op_id, build, f"{engine.fingerprint}:{top}")
 
 @app.route('/channels/<int:channel_id>', methods=['DELETE'])
 def delete_channel(channel_id):
     conn = get_db()
-    conn.execute("DELETE FROM indicators WHERE channel_id = ?", (channel_id,))
-    conn.execute("DELETE FROM channel_links WHERE from_channel_id = ? OR to_channel_id = ?", (channel_id, channel_id))
+    op_id = events.operation_of(conn, 'channels', channel_id)
+    revisions.bump_for_channels(conn, [channel_id])
+    artifact_ids = artifacts.referenced(conn, channel_ids=[channel_id])
+    # Indicators, links and classification state follow via ON DELETE CASCADE
     conn.execute("DELETE FROM channels WHERE id = ?", (channel_id,))
+    artifacts.prune(conn, artifact_ids)
     conn.commit()
+    events.publish_delta(conn, op_id, removed_channels=[channel_id])
     conn.close()
     return '', 204
 
 @app.route('/indicators/<int:indicator_id>', methods=['DELETE'])
 def delete_indicator(indicator_id):
     conn = get_db()
+    indicator = conn.execute("SELECT * FROM indicators WHERE id = ?", (indicator_id,)).fetchone()
+    artifact_ids = artifacts.referenced(conn, indicator_ids=[indicator_id])
     conn.execute("DELETE FROM indicators WHERE id = ?", (indicator_id,))
+    artifacts.prune(conn, artifact_ids)
+    if indicator:
+        channel_classification.indicator_removed(conn, indicator)
+        revisions.bump_for_channels(conn, [indicator['channel_id']])
     conn.commit()
+    if indicator:
+        events.publish_delta(conn, events.operation_of(conn, 'channels', indicator['channel_id']),
+                             removed_indicators=[indicator_id], reclassified=[indicator['channel_id']])
     conn.close()
     return '', 204
 
 @app.route('/links/<int:link_id>', methods=['DELETE'])
 def delete_link(link_id):
     conn = get_db()
+    op_id = events.operation_of(conn, 'channel_links', link_id)
+    revisions.bump_for_link(conn, link_id)
     conn.execute("DELETE FROM channel_links WHERE id = ?", (link_id,))
     conn.commit()
+    events.publish_delta(conn, op_id, removed_links=[link_id])
     conn.close()
     return '', 204
 
 @app.route('/operations/<int:op_id>', methods=['DELETE'])
 def delete_operation(op_id):
     conn = get_db()
-    # Delete everything tied to this operation
-    channel_ids = [row['id'] for row in conn.execute("SELECT id FROM channels WHERE operation_id = ?", (op_id,))]
-    for cid in channel_ids:
-        conn.execute("DELETE FROM indicators WHERE channel_id = ?", (cid,))
-        conn.execute("DELETE FROM channel_links WHERE from_channel_id = ? OR to_channel_id = ?", (cid, cid))
-    conn.execute("DELETE FROM channels WHERE operation_id = ?", (op_id,))
+    artifact_ids = artifacts.referenced(conn, channel_ids=[r[0] for r in conn.execute(
+        "SELECT id FROM channels WHERE operation_id = ?", (op_id,))])
+    # Channels, and everything hanging off them, follow via ON DELETE CASCADE
     conn.execute("DELETE FROM operations WHERE id = ?", (op_id,))
+    artifacts.prune(conn, artifact_ids)
     conn.commit()
     conn.close()
+    events.publish_deleted(op_id)
     return '', 204
 
+# ------------------------
+# SEARCH
+# ------------------------
 
+@app.route('/search', methods=['GET'])
+def search_api():
+    """Ranked full-text search: ?q=&operation_id=&kind=indicator,channel&limit=&cursor= (see search.py)."""
+    limit = pagination.parse_limit(request.args.get('limit'))
+    cursor = request.args.get('cursor')
+    offset = pagination.decode_cursor(cursor, 1)[0] if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise pagination.PageError("Invalid cursor")
+    kinds = [k.strip() for k in request.args.get('kind', '').split(',') if k.strip()]
 
-@app.route('/classify/<int:op_id>', methods=['GET'])
-def classify_operation(op_id):
     conn = get_db()
-    channels = conn.execute("SELECT * FROM channels WHERE operation_id = ?", (op_id,)).fetchall()
-    results = []
-
-    for ch in channels:
-        indicators = conn.execute("SELECT * FROM indicators WHERE channel_id = ?", (ch['id'],)).fetchall()
-
-        score = 0
-        high = medium = low = 0
-        has_public_affiliation = False
-        has_financial = False
-        has_shared_infra = False
-        has_behavioral = False
-        justification = []
-
-        for i in indicators:
-            conf = i['confidence']
-            weight = i['weight']
-            score += weight
-
-            if conf == 'High': high += 1
-            elif conf == 'Medium': medium += 1
-            else: low += 1
-
-            # Check categories
-            if "Public affiliation" in i['name'] or "Self-attribution" in i['name']:
-                has_public_affiliation = True
-            if "Financial" in i['name']:
-                has_financial = True
-            if "Shared infrastructure" in i['name'] or i['type'] == 'technical':
-                has_shared_infra = True
-            if i['type'] == 'behavioral':
-                has_behavioral = True
-
-            justification.append(f"{i['name']} ({conf}) – {i['evidence']}")
-
-        # Classification logic
-        classification = "Unclassified"
-        if has_public_affiliation:
-            classification = "State Official Channel"
-        elif has_public_affiliation or (has_shared_infra and "state media" in ch['notes'].lower()):
-            classification = "State-Controlled Outlet"
-        elif has_financial or (high >= 2 and (has_shared_infra or has_behavioral)):
-            classification = "State-Linked Channel"
-        elif medium >= 2 and has_behavioral:
-            classification = "State-Aligned Channel"
-
-        results.append({
-            "channel_id": ch['id'],
-            "channel_name": ch['name'],
-            "classification": classification,
-            "score": score,
-            "confidence": {
-                "High": high,
-                "Medium": medium,
-                "Low": low
-            },
-            "justification": justification
-        })
-
-    conn.close()
-    return jsonify(results)
-
- 
-# Define the route to generate the report
-@app.route('/generate_report/<int:operation_id>', methods=['POST'])
-def generate_report_api(operation_id):
-    analyst_comments = request.json.get('analyst_comments', '')  # Getting analyst comments from request body
-
-    # Get the LLM report
-    report = generate_llm_report(operation_id, analyst_comments, model=MODEL)
-
-    if report:  # Check if report is generated successfully
-        return jsonify({"report": report}), 200
-    else:
-        return jsonify({"error": "Failed to generate the report."}), 500
-
-# Function to generate the LLM report
+    try:
+        results, more = search.search(conn, request.args.get('q'), request.args.get('operation_id', type=int),
+                                      kinds, limit, offset)
+    except search.SearchError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    return page_response(results, pagination.encode_cursor([offset + limit]) if more else None)
 
- 
-client = OpenAI(
-        api_key=API_KEY,
-        base_url= BASE_URL
-    )
+# ------------------------
+# BULK IMPORT
+# ------------------------
 
-def craft_prompt(operation_id, analyst_comments, model=MODEL):
+@app.route('/bulk_import', methods=['POST'])
+def bulk_import():
+    """Stream an NDJSON body of operations/channels/indicators/links (see ingest.py)."""
     conn = get_db()
+    importer = ingest.Importer(conn, chunk_size=request.args.get('chunk', default=ingest.DEFAULT_CHUNK, type=int))
+    importer.feed(request.stream)
+    events.publish_resync(conn, importer.operations, importer.channels, "bulk import")
+    conn.close()
+    return jsonify(importer.summary())
 
-    # Fetch operation data
-    op = conn.execute("SELECT * FROM operations WHERE id = ?", (operation_id,)).fetchone()
-    if not op:
-        raise Exception(f"Operation with ID {operation_id} not found.")
-
-    # Fetch channels and indicators
-    channels = conn.execute("SELECT * FROM channels WHERE operation_id = ?", (operation_id,)).fetchall()
-
-    # Craft the base content
-    prompt = f"""
-    **Operation Overview**:
-    - Operation Name: {op['name']}
-    - Description: {op['description']}
-    - Suspected Actor: {op['suspected_actor']}
-    - Region: {op['region']}
-    - Time Range: {op['time_range']}
-
-    **Analyst Comments**: {analyst_comments}
-
-    **Channels and Indicators**:
-    """
 
-    # Loop over channels and add indicators
-    for ch in channels:
-        prompt += f"""
-        - Channel: {ch['name']} ({ch['platform']})
-        - URL: {ch['url']}
-        - Notes: {ch['notes']}
-
-        Indicators:
-        """
-        indicators = conn.execute("SELECT * FROM indicators WHERE channel_id = ?", (ch['id'],)).fetchall()
-
-        for i in indicators:
-            prompt += f"""
-            - [{i['type']}] {i['name']} (Confidence: {i['confidence']}, Weight: {i['weight']})
-            - Evidence: {i['evidence']}
-            """
-            if 'source_type' in i and i['source_type']:
-                prompt += f"  Source: {i['source_type']} – "
-            if 'source_entity' in i and i['source_entity']:
-                prompt += f"{i['source_entity']}\n"
-
-        prompt += "\n"
 
+@app.route('/classify/<int:op_id>', methods=['GET'])
+def classify_operation(op_id):
+    # Results also depend on config.json and the indicator type catalog
+    conn = get_db()
+    engine = get_engine(conn)
     conn.close()
+    return revision_response('classify', op_id,
+                             lambda conn: jsonify(channel_classification.read_operation(conn, op_id)),
+                             engine.fingerprint)
 
-    # Craft the system message with instructions
-    system_message = """
-    You are an expert in disinformation analysis and threat operations. 
-    Based on the information provided, generate a detailed report focusing on:
-    1. Identifying the state actor involved.
-    2. Analyzing the channels, including their relevance and connection to the suspected actor.
-    3. Weighing the behavioral and technical indicators (mentioning their confidence levels - high, medium, low).
-    4. Providing actionable recommendations for further steps (e.g., countermeasures).
-    Focus on attribution and evidence. Provide specific recommendations based on the indicators' confidence and relevance to the suspected state actor.
-    """
-
-    # Final prompt
-    return [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}]
+@app.route('/api/simulate', methods=['POST'])
+def simulate_classification():
+    """What-if classification under hypothetical thresholds, weights and indicators (see simulation.py)."""
+    conn = get_db()
+    # One read transaction, so the stored aggregates and the indicators agree
+    conn.execute("BEGIN")
+    try:
+        result = simulation.simulate(conn, request.json or {})
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except simulation.SimulationError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    return json_response(result)
+
+@app.route('/timeline/<int:op_id>', methods=['GET'])
+def classification_timeline(op_id):
+    """Scores and categories of an operation's channels over time: ?start=&end=&bucket=1d (see timeline.py)."""
+    conn = get_db()
+    try:
+        if revisions.current(conn, op_id) is None:
+            return jsonify({"error": "Operation not found"}), 404
+        window = timeline.window(conn, op_id, request.args.get('start'), request.args.get('end'),
+                                 request.args.get('bucket'))
+        engine = get_engine(conn)
+    except timeline.TimelineError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+    return revision_response('timeline', op_id, lambda conn: json_response(timeline.timeline(conn, op_id, window)),
+                             f"{engine.fingerprint}:{window.key}")
 
+ 
+# Reports are generated in the background; see reports.py
+@app.route('/generate_report/<int:operation_id>', methods=['POST'])
+def generate_report_api(operation_id):
+    data = request.json or {}
+    analyst_comments = data.get('analyst_comments', '')  # Getting analyst comments from request body
 
-def generate_llm_report(operation_id, analyst_comments, model=MODEL):
     conn = get_db()
+    op = conn.execute("SELECT id FROM operations WHERE id = ?", (operation_id,)).fetchone()
+    conn.close()
+    if not op:
+        return jsonify({"error": "Operation not found"}), 404
 
-    # Fetch operation data
     try:
-        op = conn.execute("SELECT * FROM operations WHERE id = ?", (operation_id,)).fetchone()
-        if not op:
-            print(f"Operation with ID {operation_id} not found.")
-            return "Operation not found."
-    except Exception as e:
-        print(f"Error fetching operation: {e}")
-        return f"Error fetching operation: {e}"
+        job_id, hit = submit_report(operation_id, analyst_comments, data.get('bypass_cache'))
+    except reports.QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+    if hit:
+        return jsonify(dict(report_jobs.get(job_id), job_id=job_id, cache_key=hit['key'], cached_at=hit['created_at'],
+                            url=f"/reports/{job_id}")), 200
+    return jsonify({"job_id": job_id, "status": "queued", "url": f"/reports/{job_id}"}), 202
+
+def submit_report(operation_id, analyst_comments, bypass_cache=False, batch_id=None):
+    """Queue a report job, or record a finished one straight from the cache; returns (job_id, cache row or None)."""
+    # Identical prompt and model: answer from the cache unless the caller asks for a fresh report
+    if report_cache.enabled() and not bypass_cache:
+        key = report_cache.cache_key(craft_prompt(operation_id, analyst_comments, MODEL), MODEL)
+        conn = get_db()
+        hit = report_cache.get(conn, key)
+        conn.commit()
+        conn.close()
+        if hit:
+            return report_jobs.record_cached(operation_id, analyst_comments, MODEL, hit['report'], batch_id), hit
+    return report_jobs.submit(operation_id, analyst_comments, MODEL, batch_id), None
+
+@app.route('/report_batches', methods=['POST'])
+def create_report_batch():
+    """Reports for many operations at once: {"operation_ids": [...]} (default: all), "analyst_comments", "bypass_cache"."""
+    data = request.json or {}
+    conn = get_db()
+    operation_ids = batch_reports.resolve_operations(conn, data.get('operation_ids'))
+    conn.close()
+    if not operation_ids:
+        return jsonify({"error": "No operations found"}), 404
 
-    # Fetch channels and indicators
     try:
-        channels = conn.execute("SELECT * FROM channels WHERE operation_id = ?", (operation_id,)).fetchall()
-    except Exception as e:
-        print(f"Error fetching channels: {e}")
-        return f"Error fetching channels: {e}"
-
-    messages = craft_prompt(operation_id, analyst_comments, model)
-
-    # Create the message for the LLM
+        report_jobs.reserve(len(operation_ids))
+    except reports.QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "60"}
+    batch_id = batch_reports.new_batch_id()
+    jobs = [{"operation_id": op_id,
+             "job_id": submit_report(op_id, data.get('analyst_comments', ''), data.get('bypass_cache'), batch_id)[0]}
+            for op_id in operation_ids]
+    return jsonify({"batch_id": batch_id, "jobs": jobs, "url": f"/report_batches/{batch_id}"}), 202
+
+@app.route('/report_batches/<batch_id>', methods=['GET'])
+def get_report_batch(batch_id):
+    conn = get_db()
+    summary = batch_reports.batch_summary(conn, batch_id)
+    conn.close()
+    if summary is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(summary)
+
+@app.route('/reports/<int:job_id>', methods=['GET'])
+def get_report_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Report job not found"}), 404
+    if request.args.get('stream', type=int):
+        # Plain text, flushed token by token until the job finishes
+        return Response(report_jobs.follow(job_id), mimetype='text/plain')
+    return jsonify(job)
 
-    try:
-        # Use the OpenAI client method for completions
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages
-        )
+# Function to generate the LLM report
 
-        # Correctly access the generated content
-        report_content = response.choices[0].message.content  # Correct access
-        print(f"Generated Report: {report_content}")  # Debugging
-        return report_content
+# The OpenAI SDK takes most of the import time, so it is loaded and the client built on the first report
+client = None
+_client_lock = threading.Lock()
 
-    except Exception as e:
-        print(f"Error during LLM request: {e}")
-        return f"Failed to generate the report. Error: {e}"
+def get_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI
+                # Retries are handled by ratelimit.call, so they respect the rate limits
+                client = OpenAI(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
+    return client
 
+def transient_errors():
+    from openai import RateLimitError, APIConnectionError, InternalServerError
+    return (RateLimitError, APIConnectionError, InternalServerError)
 
+def craft_prompt(operation_id, analyst_comments, model=MODEL):
+    """Return the request plan for an operation's report (see prompts.build_plan)."""
+    conn = get_db()
+    loaded = prompts.load_operation(conn, operation_id)
+    conn.close()
+    if loaded is None:
+        raise LookupError(f"Operation with ID {operation_id} not found.")
+    op, channels = loaded
+    return prompts.build_plan(op, channels, analyst_comments)
+
+
+def complete(messages, model=MODEL, max_tokens=None, on_token=None):
+    """One chat completion, rate limited and retried; streamed to on_token when given."""
+    options = {"timeout": reports.reports_config().get("timeout", reports.DEFAULT_TIMEOUT)}
+    if max_tokens:
+        options["max_tokens"] = max_tokens
+    prompt_tokens = sum(prompts.estimate_tokens(m["content"]) for m in messages)
+    tokens = prompt_tokens + (max_tokens or 0)
+    llm, retry_on = get_client(), transient_errors()
+
+    if on_token is None:
+        def call():
+            start = time.perf_counter()
+            try:
+                response = llm.chat.completions.create(model=model, messages=messages, **options)
+            except Exception:
+                metrics.llm_call(model, time.perf_counter() - start, outcome="error")
+                raise
+            content = response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            metrics.llm_call(model, time.perf_counter() - start,
+                             getattr(usage, "prompt_tokens", None) or prompt_tokens,
+                             getattr(usage, "completion_tokens", None) or prompts.estimate_tokens(content or ""))
+            return content
+
+        return ratelimit.call(call, tokens, retry_on)
+
+    def stream():
+        parts = []
+        start = time.perf_counter()
+        try:
+            for chunk in llm.chat.completions.create(model=model, messages=messages, stream=True, **options):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_token(chunk.choices[0].delta.content)
+        except Exception as e:
+            metrics.llm_call(model, time.perf_counter() - start, prompt_tokens,
+                             prompts.estimate_tokens("".join(parts)), outcome="error")
+            if parts and isinstance(e, retry_on):
+                # Tokens already went out to the client; a retry would repeat them
+                raise RuntimeError(f"Stream interrupted: {e}") from e
+            raise
+        # Streamed responses carry no usage block, so both sides are estimates
+        metrics.llm_call(model, time.perf_counter() - start, prompt_tokens, prompts.estimate_tokens("".join(parts)))
+        return "".join(parts)
+
+    return ratelimit.call(stream, tokens, retry_on)
+
+
+def generate_llm_report(operation_id, analyst_comments, model=MODEL, on_token=None):
+    """Return the report text, raising on failure. on_token receives streamed text as it arrives."""
+    plan = craft_prompt(operation_id, analyst_comments, model)
+    report_content = prompts.run_plan(
+        plan, lambda messages, **kwargs: complete(messages, model=model, **kwargs), on_token=on_token)
+    metrics.log.info("Generated report for operation %s: %d characters (%d chunks)",
+                     operation_id, len(report_content), len(plan.get('map', ())) or 1)
+
+    if report_cache.enabled():
+        conn = get_db()
+        report_cache.put(conn, report_cache.cache_key(plan, model), model, report_content)
+        conn.commit()
+        conn.close()
+    return report_content
+
+
+report_jobs = reports.JobQueue(get_db, generate_llm_report)
 
 
 @app.route("/export_stix/<int:operation_id>")
 def export_stix(operation_id):
-    import uuid
-    from flask import jsonify
-
-    conn = sqlite3.connect("fimi_ops.db")
-    cursor = conn.cursor()
-
-    # Load the operation
-    cursor.execute("SELECT * FROM operations WHERE id = ?", (operation_id,))
-    op = cursor.fetchone()
-    if not op:
-        return jsonify({"error": "Operation not found"}), 404
-
-    op_id, op_name, op_desc, op_actor, op_region, op_range, *_ = op
-    print(f"[STIX Export] Operation loaded: {op_name}")
-
-    # Campaign object
-    campaign = {
-        "type": "campaign",
-        "id": f"campaign--{uuid.uuid4()}",
-        "name": op_name,
-        "description": op_desc,
-        "aliases": [op_actor],
-        "first_seen": "2022-01-01T00:00:00.000Z",
-        "objective": "Attributed influence operation",
-        "created": "2025-01-01T00:00:00.000Z",
-        "modified": "2025-01-01T00:00:00.000Z"
-    }
+    return stream_stix_bundle([operation_id])
 
-    # Channels (as identity objects)
-    cursor.execute("SELECT * FROM channels WHERE operation_id = ?", (operation_id,))
-    channels = cursor.fetchall()
-    print(f"[STIX Export] Channels found: {len(channels)}")
-
-    channel_objs = []
-    channel_map = {}
-
-    for ch in channels:
-        ch_id, _, name, platform, url, notes = ch
-        ident_id = f"identity--{uuid.uuid4()}"
-        channel_map[ch_id] = ident_id
-        ident = {
-            "type": "identity",
-            "id": ident_id,
-            "name": name,
-            "identity_class": "organization",
-            "sectors": [platform],
-            "contact_information": url,
-            "description": notes,
-            "created": "2025-01-01T00:00:00.000Z",
-            "modified": "2025-01-01T00:00:00.000Z"
-        }
-        channel_objs.append(ident)
-
-    # Indicators
-    cursor.execute("SELECT * FROM indicators WHERE channel_id IN (SELECT id FROM channels WHERE operation_id = ?)", (operation_id,))
-    indicators = cursor.fetchall()
-    print(f"[STIX Export] Indicators found: {len(indicators)}")
-
-    indicator_objs = []
-    for ind in indicators:
-        ind_id, ch_id, group_type, name, weight, confidence, evidence, source_type, *rest = ind
-        timestamp = rest[0] if rest else "2025-01-01T00:00:00.000Z"
-
-        # Clean up values
-        clean_name = name if isinstance(name, str) else f"Indicator-{ind_id}"
-        conf = confidence.lower() if confidence else "medium"
-
-        indicator_obj = {
-            "type": "indicator",
-            "id": f"indicator--{uuid.uuid4()}",
-            "labels": [group_type, name],
-            "name": clean_name,
-            "description": evidence,
-            "confidence": conf,
-            "valid_from": timestamp,
-            "pattern": f"[x-fimi:indicator = '{clean_name}']",
-            "created": "2025-01-01T00:00:00.000Z",
-            "modified": "2025-01-01T00:00:00.000Z"
-        }
-        indicator_objs.append(indicator_obj)
-
-    # Relationships
-    cursor.execute("SELECT * FROM channel_links WHERE operation_id = ?", (operation_id,))
-    links = cursor.fetchall()
-    print(f"[STIX Export] Links found: {len(links)}")
-
-    rel_objs = []
-    for link in links:
-        link_id, op_id, from_ch, to_ch, link_type, link_conf, link_evid = link
-        if from_ch not in channel_map or to_ch not in channel_map:
-            continue
-        rel = {
-            "type": "relationship",
-            "id": f"relationship--{uuid.uuid4()}",
-            "relationship_type": link_type,
-            "description": link_evid,
-            "source_ref": channel_map[from_ch],
-            "target_ref": channel_map[to_ch],
-            "confidence": link_conf.lower() if link_conf else "medium",
-            "created": "2025-01-01T00:00:00.000Z",
-            "modified": "2025-01-01T00:00:00.000Z"
-        }
-        rel_objs.append(rel)
-
-    conn.close()
-
-    # Final STIX bundle
-    bundle = {
-        "type": "bundle",
-        "id": f"bundle--{uuid.uuid4()}",
-        "objects": [campaign] + channel_objs + indicator_objs + rel_objs
-    }
-
-    print("[STIX Export] Bundle ready with total objects:", len(bundle["objects"]))
-    return jsonify(bundle)
+@app.route("/export_stix")
+def export_stix_bundle():
+    """Several operations in one bundle: /export_stix?operations=1,2,3"""
+    try:
+        operation_ids = [int(x) for x in request.args.get('operations', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({"error": "operations must be a comma-separated list of ids"}), 400
+    if not operation_ids:
+        return jsonify({"error": "No operations given"}), 400
+    return stream_stix_bundle(operation_ids)
+
+def stream_stix_bundle(operation_ids):
+    # Not tracked in g: the connection must outlive the request and is closed once the stream ends
+    conn = db.acquire(DB_FILE)
+    missing = stix_export.missing_operations(conn, operation_ids)
+    if missing:
+        conn.close()
+        return jsonify({"error": "Operation not found", "missing": missing}), 404
+    metrics.log.info("STIX export: streaming bundle for operations %s", sorted(set(operation_ids)))
+
+    def generate():
+        try:
+            yield from stix_export.iter_bundle(conn, operation_ids)
+        finally:
+            conn.close()
+
+    return Response(generate(), mimetype='application/json')
 
 @app.route('/config')
 def config():
@@ -550,37 +776,52 @@ def config():
 @app.route('/api/indicator_types', methods=['GET'])
 def api_get_indicator_types():
     conn = get_db()
-    rows = conn.execute("SELECT * FROM indicator_types").fetchall()
+    types = indicator_types(conn)
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    return jsonify(types)
+
+def catalog_changed(conn, channel_ids):
+    """Reclassify the channels whose indicators were relinked by an indicator_types change (not yet committed)."""
+    invalidate_catalog()
+    if channel_ids:
+        channel_classification.rebuild_channels(conn, channel_ids)
+        revisions.bump_for_channels(conn, channel_ids)
 
 @app.route('/api/indicator_types', methods=['POST'])
 def api_add_indicator_type():
     data = request.json
     conn = get_db()
-    conn.execute("""
+    cur = conn.execute("""
         INSERT INTO indicator_types (group_type, category, subtype, default_weight, default_confidence)
         VALUES (?, ?, ?, ?, ?)
     """, (data['group_type'], data['category'], data['subtype'], data['default_weight'], data['default_confidence']))
+    channel_ids = link_new_type(conn, cur.lastrowid, data['subtype'])
+    catalog_changed(conn, channel_ids)
     conn.commit()
+    events.publish_resync(conn, channel_ids=channel_ids, reason="indicator types changed")
     conn.close()
+    invalidate_catalog()
     return jsonify({"status": "ok"})
 
 @app.route('/api/indicator_types/<int:indicator_id>', methods=['DELETE'])
 def api_delete_indicator_type(indicator_id):
     conn = get_db()
+    channel_ids = relink_deleted_type(conn, indicator_id)
     conn.execute("DELETE FROM indicator_types WHERE id = ?", (indicator_id,))
+    catalog_changed(conn, channel_ids)
     conn.commit()
+    events.publish_resync(conn, channel_ids=channel_ids, reason="indicator types changed")
     conn.close()
+    invalidate_catalog()
     return jsonify({"status": "deleted"})
 
 # --- API: Operations ---
 @app.route('/api/operations', methods=['GET'])
 def api_get_operations():
     conn = get_db()
-    rows = conn.execute("SELECT * FROM operations").fetchall()
+    items, next_cursor = pagination.fetch_page(conn, pagination.OPERATIONS_BY_ID, request.args)
     conn.close()
-    return jsonify([dict(r) for r in rows])
+    return page_response(items, next_cursor)
 
 @app.route('/api/operations/<int:operation_id>', methods=['PUT'])
 def api_update_operation(operation_id):
@@ -588,59 +829,101 @@ def api_update_operation(operation_id):
     conn = get_db()
     conn.execute("""
         UPDATE operations SET
-        name = ?, description = ?, suspected_actor = ?, region = ?, time_range = ?
+        name = ?, description = ?, suspected_actor = ?, region = ?, time_range = ?,
+        revision = revision + 1
         WHERE id = ?
     """, (data['name'], data['description'], data['suspected_actor'], data['region'], data['time_range'], operation_id))
     conn.commit()
+    events.publish_delta(conn, operation_id, operation=True)
     conn.close()
     return jsonify({"status": "updated"})
 
 @app.route('/api/operations_data/<int:operation_id>', methods=['GET'])
 def get_operation_data(operation_id):
-    import sqlite3
+    return revision_response('operations_data', operation_id, lambda conn: build_operation_data(conn, operation_id))
+
+def operation_view(conn, operation_id):
+    """The operation with all its channels, indicators and links as JSON fragments, or None."""
+    operation = serialization.row_json(conn, "SELECT * FROM operations WHERE id = ?", (operation_id,))
+    if operation is None:
+        return None
+    return {
+        "operation": operation,
+        "channels": serialization.rows_json(
+            conn, "SELECT * FROM channels WHERE operation_id = ? ORDER BY id", (operation_id,)),
+        "indicators": serialization.rows_json(conn, """
+            SELECT i.* FROM indicators i JOIN channels c ON c.id = i.channel_id
+            WHERE c.operation_id = ? ORDER BY i.id
+        """, (operation_id,)),
+        "channel_links": serialization.rows_json(
+            conn, "SELECT * FROM channel_links WHERE operation_id = ? ORDER BY id", (operation_id,)),
+    }
 
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def json_response(body):
+    return Response(serialization.compose(body), mimetype='application/json')
 
-    # Get operation
-    operation = cursor.execute("SELECT * FROM operations WHERE id = ?", (operation_id,)).fetchone()
-    if not operation:
+def build_operation_data(conn, operation_id):
+    view = operation_view(conn, operation_id)
+    if view is None:
         return jsonify({"error": "Operation not found"}), 404
+    return json_response(view)
 
-    # Get channels
-    channels = cursor.execute("SELECT * FROM channels WHERE operation_id = ?", (operation_id,)).fetchall()
-    channel_ids = [row["id"] for row in channels]
+# ------------------------
+# BOOTSTRAP
+# ------------------------
 
-    # Get indicators
-    indicators = []
-    if channel_ids:
-        placeholders = ",".join("?" for _ in channel_ids)
-        indicators = cursor.execute(
-            f"SELECT * FROM indicators WHERE channel_id IN ({placeholders})", channel_ids
-        ).fetchall()
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """Initial page load: the indicator types and the first page of operations (?limit=&fields= as /operations)."""
+    conn = get_db()
+    operations, next_cursor = pagination.fetch_page(conn, pagination.OPERATIONS_BY_DATE, request.args)
+    body = {"indicator_types": indicator_types(conn), "operations": operations, "next_cursor": next_cursor}
+    conn.close()
+    response = json_response(body)
+    if next_cursor:
+        response.headers[pagination.CURSOR_HEADER] = next_cursor
+    return response
 
-    # Get channel links
-    links = cursor.execute(
-        "SELECT * FROM channel_links WHERE operation_id = ?", (operation_id,)
-    ).fetchall()
+@app.route('/api/bootstrap/<int:op_id>', methods=['GET'])
+def bootstrap_operation(op_id):
+    """
+    Everything the operation view needs in one response, from one read
+    transaction: the operation, its channels, indicators and links, the
+    classification results and the revision that live updates start from.
+    """
+    def build(conn):
+        view = operation_view(conn, op_id)
+        if view is None:
+            return jsonify({"error": "Operation not found"}), 404
+        view["classification"] = channel_classification.read_operation(conn, op_id)
+        view["revision"] = revisions.current(conn, op_id)
+        return json_response(view)
 
+    conn = get_db()
+    engine = get_engine(conn)
     conn.close()
+    return revision_response('bootstrap', op_id, build, engine.fingerprint)
 
-    def serialize(rows):
-        return [dict(row) for row in rows]
+# ------------------------
+# METRICS
+# ------------------------
 
-    return jsonify({
-        "operation": dict(operation),
-        "channels": serialize(channels),
-        "indicators": serialize(indicators),
-        "channel_links": serialize(links)
-    })
+metrics.Gauge("fimi_response_cache_bytes", "Size of the cached operation responses.",
+              lambda: response_cache.stats()["bytes"])
+metrics.Gauge("fimi_response_cache_entries", "Number of cached operation responses.",
+              lambda: response_cache.stats()["entries"])
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request, SQL and LLM metrics in the Prometheus text format; see metrics.py."""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 #################################
 #################################
 
+# End of the module body: everything a worker imports to serve requests is loaded
+IMPORT_SECONDS = time.perf_counter() - _import_started
+metrics.Gauge("fimi_worker_import_seconds", "Time this worker took to import the app.", lambda: IMPORT_SECONDS)
+
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,330 @@
+"""
+Shared-infrastructure index: which channels mention the same artifact.
+
+Domains, IP addresses, cryptocurrency wallets and ASNs are extracted from
+indicators.evidence and channels.url, normalized (lowercase domains without
+www., canonical IP notation, AS<number>) and stored once in `artifacts`;
+`artifact_refs` is the inverted index from an artifact to every channel and
+indicator it appears in. The API routes and the bulk importer index new
+rows in the same transaction; deleting an indicator, channel or operation
+drops its references through ON DELETE CASCADE, and the delete routes then
+prune the artifacts those references pointed to if nothing else uses them.
+
+overlaps() answers "who else uses this infrastructure" for one channel
+with indexed lookups on artifact_refs, across all operations.
+
+Channel URLs on social platforms (t.me, x.com, ...) would link every
+account on the platform, so their hosts are skipped; the list is the
+"artifacts" section of config.json.
+
+    python artifacts.py CHANNEL_ID [--limit 20]
+    python artifacts.py --rebuild    # re-extract everything
+    python artifacts.py --check      # compare the index with a fresh extraction
+    python artifacts.py --prune      # drop artifacts without references
+"""
+
+import functools
+import ipaddress
+import json
+import re
+
+import settings
+
+KINDS = ("domain", "ip", "wallet", "asn")
+
+DEFAULT_IGNORE_DOMAINS = [
+    "t.me", "telegram.me", "x.com", "twitter.com", "facebook.com", "instagram.com", "youtube.com",
+    "youtu.be", "tiktok.com", "vk.com", "ok.ru", "linkedin.com", "reddit.com", "rumble.com",
+]
+
+# Dotted names that are file names, not hosts
+FILE_EXTENSIONS = {
+    "pdf", "png", "jpg", "jpeg", "gif", "svg", "webp", "txt", "csv", "json", "xml", "html", "htm",
+    "php", "asp", "aspx", "js", "css", "exe", "dll", "zip", "rar", "doc", "docx", "xls", "xlsx",
+    "ppt", "pptx", "mp3", "mp4", "log",
+}
+
+# Defanged notation used in threat reports: example[.]com, hxxps://
+DEFANGED = [(re.compile(r"\[\.\]|\(\.\)|\[dot\]", re.I), "."), (re.compile(r"\bhxxp", re.I), "http")]
+
+# One pass over the text finds every kind except IPv6; the alternative that matched names the kind
+ARTIFACT = re.compile(r"""(?<![\w.-])(?:
+     (?P<eth>0[xX][0-9a-fA-F]{40})\b                                  # Ethereum and EVM chains
+    |(?P<bech32>(?i:bc1[ac-hj-np-z02-9]{8,87}))\b                      # Bitcoin bech32
+    |(?P<base58>[13][a-km-zA-HJ-NP-Z1-9]{25,34}|T[1-9A-HJ-NP-Za-km-z]{33})\b   # Bitcoin base58, Tron
+    |(?P<ipv4>(?:\d{1,3}\.){3}\d{1,3})(?!\w|\.\d)
+    |(?P<domain>(?i:(?:[a-z0-9-]{1,63}\.)+(?P<tld>[a-z]{2,24})))(?![\w-]|\.\w)
+    |AS(?:N\s?)?(?P<asn>\d{1,10})\b
+)""", re.X)
+IPV6 = re.compile(r"(?<![\w:])[0-9a-f]{0,4}(?::[0-9a-f]{0,4}){2,7}(?![\w:])", re.I)
+HOST = re.compile(r"(?:[a-z0-9-]{1,63}\.)+[a-z]{2,24}", re.I)
+URL_HOST = re.compile(r"^(?:[a-z][a-z0-9+.-]*:)?//(?:[^@/?#]*@)?(\[[^\]]+\]|[^:/?#]+)", re.I)
+
+
+def ignored_domains():
+    return set(settings.get_config().get("artifacts", {}).get("ignore_domains", DEFAULT_IGNORE_DOMAINS))
+
+
+# ------------------------
+# EXTRACTION
+# ------------------------
+
+def normalize_domain(name):
+    name = name.lower().rstrip(".")
+    return name[4:] if name.startswith("www.") else name
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_ip(text):
+    """Canonical notation for a public address, None for anything else (private ranges are not shared infrastructure)."""
+    try:
+        ip = ipaddress.ip_address(text.strip("[]"))
+    except ValueError:
+        return None
+    return ip.compressed if ip.is_global else None
+
+
+def extract(text):
+    """Set of (kind, value) artifacts mentioned in free text."""
+    if not text:
+        return set()
+    if "[" in text or "(" in text or "hxxp" in text.lower():
+        for pattern, replacement in DEFANGED:
+            text = pattern.sub(replacement, text)
+
+    found = set()
+    for m in ARTIFACT.finditer(text):
+        kind = m.lastgroup
+        if kind == "domain":
+            name = m.group("domain")
+            if m.group("tld").lower() not in FILE_EXTENSIONS and ".-" not in name and "-." not in name:
+                found.add(("domain", normalize_domain(name)))
+        elif kind == "ipv4":
+            ip = normalize_ip(m.group(0))
+            if ip:
+                found.add(("ip", ip))
+        elif kind == "asn":
+            found.add(("asn", f"AS{int(m.group('asn'))}"))
+        else:
+            # Hex and bech32 addresses are case-insensitive, base58 ones are not
+            found.add(("wallet", m.group(0) if kind == "base58" else m.group(0).lower()))
+    if text.count(":") >= 2:
+        for m in IPV6.finditer(text):
+            ip = normalize_ip(m.group(0))
+            if ip:
+                found.add(("ip", ip))
+    return found
+
+
+def extract_url(url, ignore=None):
+    """The host of a channel URL as a domain or IP artifact, unless it is a platform in `ignore`."""
+    if not url:
+        return set()
+    m = URL_HOST.match(url.strip()) or URL_HOST.match("//" + url.strip())
+    host = m.group(1) if m else ""
+    ip = normalize_ip(host)
+    if ip:
+        return {("ip", ip)}
+    if not HOST.fullmatch(host):
+        return set()
+    domain = normalize_domain(host)
+    if domain in (ignore if ignore is not None else ignored_domains()):
+        return set()
+    return {("domain", domain)}
+
+
+# ------------------------
+# INDEX MAINTENANCE
+# ------------------------
+
+def _store(conn, refs):
+    """refs: (kind, value, channel_id, indicator_id) tuples."""
+    if not refs:
+        return 0
+    pairs = sorted({(kind, value) for kind, value, _, _ in refs})
+    conn.executemany("INSERT OR IGNORE INTO artifacts (kind, value) VALUES (?, ?)", pairs)
+    cur = conn.cursor()
+    cur.row_factory = None
+    ids = {(kind, value): artifact_id for artifact_id, kind, value in cur.execute("""
+        SELECT a.id, a.kind, a.value FROM json_each(?) j
+        JOIN artifacts a ON a.kind = json_extract(j.value, '$[0]') AND a.value = json_extract(j.value, '$[1]')
+    """, (json.dumps(pairs),))}
+    conn.executemany("INSERT INTO artifact_refs (artifact_id, channel_id, indicator_id) VALUES (?, ?, ?)",
+                     [(ids[kind, value], channel_id, indicator_id) for kind, value, channel_id, indicator_id in refs])
+    return len(refs)
+
+
+def index_channels(conn, rows):
+    """Index the URL host of each (channel_id, url) row."""
+    ignore = ignored_domains()
+    return _store(conn, [(kind, value, channel_id, None)
+                         for channel_id, url in rows for kind, value in sorted(extract_url(url, ignore))])
+
+
+def index_indicators(conn, rows):
+    """Index the evidence of each (indicator_id, channel_id, evidence) row."""
+    return _store(conn, [(kind, value, channel_id, indicator_id)
+                         for indicator_id, channel_id, evidence in rows for kind, value in sorted(extract(evidence))])
+
+
+def channel_added(conn, channel_id, url):
+    index_channels(conn, [(channel_id, url)])
+
+
+def indicator_added(conn, indicator_id, channel_id, evidence):
+    index_indicators(conn, [(indicator_id, channel_id, evidence)])
+
+
+def referenced(conn, channel_ids=(), indicator_ids=()):
+    """Ids of the artifacts the given channels or indicators refer to, e.g. before deleting them."""
+    return [row[0] for row in conn.execute("""
+        SELECT DISTINCT artifact_id FROM artifact_refs
+        WHERE channel_id IN (SELECT value FROM json_each(:channels))
+           OR indicator_id IN (SELECT value FROM json_each(:indicators))
+    """, {"channels": json.dumps(list(channel_ids)), "indicators": json.dumps(list(indicator_ids))})]
+
+
+def prune(conn, artifact_ids=None):
+    """Drop artifacts nobody references any more, all or among `artifact_ids`; returns how many."""
+    if artifact_ids is None:
+        return conn.execute("""
+            DELETE FROM artifacts WHERE NOT EXISTS (SELECT 1 FROM artifact_refs WHERE artifact_id = artifacts.id)
+        """).rowcount
+    if not artifact_ids:
+        return 0
+    return conn.execute("""
+        DELETE FROM artifacts WHERE id IN (SELECT value FROM json_each(?))
+            AND NOT EXISTS (SELECT 1 FROM artifact_refs WHERE artifact_id = artifacts.id)
+    """, (json.dumps(list(artifact_ids)),)).rowcount
+
+
+def rebuild(conn, batch=50000):
+    """Re-extract the whole index from channels and indicators; returns the number of references."""
+    conn.execute("DELETE FROM artifact_refs")
+    conn.execute("DELETE FROM artifacts")
+    count = index_channels(conn, conn.execute("SELECT id, url FROM channels WHERE url IS NOT NULL").fetchall())
+    cur = conn.execute("SELECT id, channel_id, evidence FROM indicators WHERE evidence IS NOT NULL")
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            return count
+        count += index_indicators(conn, rows)
+
+
+def check(conn):
+    """Return (kind, value, channel_id, indicator_id) references that are missing (+) or stale (-)."""
+    ignore = ignored_domains()
+    expected = {(kind, value, channel_id, None)
+                for channel_id, url in conn.execute("SELECT id, url FROM channels")
+                for kind, value in extract_url(url, ignore)}
+    expected |= {(kind, value, channel_id, indicator_id)
+                 for indicator_id, channel_id, evidence in conn.execute("SELECT id, channel_id, evidence FROM indicators")
+                 for kind, value in extract(evidence)}
+    indexed = {tuple(row) for row in conn.execute("""
+        SELECT a.kind, a.value, r.channel_id, r.indicator_id FROM artifact_refs r JOIN artifacts a ON a.id = r.artifact_id
+    """)}
+    return sorted([("+",) + ref for ref in expected - indexed] + [("-",) + ref for ref in indexed - expected],
+                  key=str)
+
+
+# ------------------------
+# OVERLAP LOOKUP
+# ------------------------
+
+def overlaps(conn, channel_id, kinds=None, limit=100):
+    """
+    Every channel and operation sharing an artifact with `channel_id`: the
+    channel's shared artifacts with how widely each is used, the other
+    channels (most shared artifacts first, up to `limit`) and the operations
+    they belong to.
+    """
+    mine = "SELECT artifact_id FROM artifact_refs WHERE channel_id = ?"
+    params = [channel_id]
+    if kinds:
+        mine = ("SELECT r.artifact_id FROM artifact_refs r JOIN artifacts a ON a.id = r.artifact_id "
+                f"WHERE r.channel_id = ? AND a.kind IN ({', '.join('?' * len(kinds))})")
+        params += list(kinds)
+    cur = conn.cursor()
+    cur.row_factory = None
+
+    artifacts = [{"kind": kind, "value": value, "channels": n_channels, "operations": n_ops}
+                 for kind, value, n_channels, n_ops in cur.execute(f"""
+        SELECT a.kind, a.value, COUNT(DISTINCT r.channel_id), COUNT(DISTINCT c.operation_id)
+        FROM artifacts a
+        JOIN artifact_refs r ON r.artifact_id = a.id
+        JOIN channels c ON c.id = r.channel_id
+        WHERE a.id IN ({mine}) AND r.channel_id != ?
+        GROUP BY a.id
+        ORDER BY COUNT(DISTINCT r.channel_id), a.kind, a.value
+    """, params + [channel_id])]
+
+    channels = [{"id": other, "name": name, "platform": platform, "operation_id": op_id,
+                 "shared": [{"kind": k, "value": v} for k, v in sorted(json.loads(shared))]}
+                for other, name, platform, op_id, _, shared in cur.execute(f"""
+        SELECT c.id, c.name, c.platform, c.operation_id, COUNT(DISTINCT r.artifact_id),
+               json_group_array(DISTINCT json_array(a.kind, a.value))
+        FROM artifact_refs r
+        JOIN artifacts a ON a.id = r.artifact_id
+        JOIN channels c ON c.id = r.channel_id
+        WHERE r.artifact_id IN ({mine}) AND r.channel_id != ?
+        GROUP BY c.id
+        ORDER BY COUNT(DISTINCT r.artifact_id) DESC, c.id
+        LIMIT ?
+    """, params + [channel_id, limit])]
+
+    operations = [{"id": op_id, "name": name, "channels": n_channels, "artifacts": n_artifacts}
+                  for op_id, name, n_channels, n_artifacts in cur.execute(f"""
+        SELECT o.id, o.name, COUNT(DISTINCT r.channel_id), COUNT(DISTINCT r.artifact_id)
+        FROM artifact_refs r
+        JOIN channels c ON c.id = r.channel_id
+        JOIN operations o ON o.id = c.operation_id
+        WHERE r.artifact_id IN ({mine}) AND r.channel_id != ?
+        GROUP BY o.id
+        ORDER BY COUNT(DISTINCT r.channel_id) DESC, o.id
+    """, params + [channel_id])]
+
+    return {
+        "channel_id": channel_id,
+        "artifacts": artifacts,
+        "channels": channels,
+        "channel_count": sum(op["channels"] for op in operations),
+        "operations": operations,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Shared-infrastructure index across operations.")
+    parser.add_argument('channel', type=int, nargs='?', help="print the overlaps of this channel")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--prune', action='store_true', help="drop artifacts no channel or indicator refers to")
+    args = parser.parse_args()
+
+    conn = get_db()
+    if args.prune:
+        count = prune(conn)
+        conn.commit()
+        print(f"Pruned {count} unreferenced artifacts.")
+    if args.rebuild:
+        start = time.perf_counter()
+        count = rebuild(conn)
+        conn.commit()
+        print(f"Indexed {count} artifact references in {time.perf_counter() - start:.1f}s.")
+    problems = []
+    if args.check:
+        problems = check(conn)
+        for row in problems[:20]:
+            print(" ".join(str(v) for v in row))
+        print("Artifact index OK." if not problems else
+              f"{len(problems)} references out of sync; run with --rebuild.")
+    if args.channel is not None:
+        print(json.dumps(overlaps(conn, args.channel, limit=args.limit), indent=2))
+    conn.close()
+    sys.exit(1 if problems else 0)
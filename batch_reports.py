@@ -0,0 +1,142 @@
+"""
+Report generation for many operations at once.
+
+A batch is a set of report_jobs rows sharing a batch_id. The jobs go
+through the regular job queue, so the pool size bounds concurrency and
+every model call passes the rate limits and retries in ratelimit.py.
+Operations whose prompt is unchanged are answered from the report cache.
+
+    python batch_reports.py [--operations 1,2,3] [--concurrency 4] [--output results.jsonl] [--bypass-cache]
+
+The CLI writes one JSON line per operation as soon as its report is done,
+then prints per-operation latency percentiles and overall throughput.
+"""
+
+import json
+import uuid
+
+
+def new_batch_id():
+    return uuid.uuid4().hex
+
+
+def resolve_operations(conn, operation_ids=None):
+    """The given ids that exist, in order, or every operation when none are given."""
+    if not operation_ids:
+        return [r[0] for r in conn.execute("SELECT id FROM operations ORDER BY id")]
+    existing = {r[0] for r in conn.execute(
+        "SELECT id FROM operations WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(operation_ids),))}
+    return [op_id for op_id in dict.fromkeys(operation_ids) if op_id in existing]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def latency_stats(durations_ms, wall_seconds):
+    return {
+        "p50_ms": percentile(durations_ms, 50),
+        "p95_ms": percentile(durations_ms, 95),
+        "max_ms": max(durations_ms, default=None),
+        "reports_per_minute": round(len(durations_ms) * 60 / wall_seconds, 2) if wall_seconds else None,
+    }
+
+
+def batch_summary(conn, batch_id):
+    rows = conn.execute("""
+        SELECT id, operation_id, status, cached, duration_ms, error,
+               (julianday(finished_at) - julianday(created_at)) * 86400 AS elapsed
+        FROM report_jobs WHERE batch_id = ? ORDER BY id
+    """, (batch_id,)).fetchall()
+    if not rows:
+        return None
+
+    counts = dict.fromkeys(("queued", "running", "done", "failed"), 0)
+    for row in rows:
+        counts[row["status"]] += 1
+    window = conn.execute("""
+        SELECT (julianday(MAX(finished_at)) - julianday(MIN(created_at))) * 86400
+        FROM report_jobs WHERE batch_id = ?
+    """, (batch_id,)).fetchone()[0]
+
+    return {
+        "batch_id": batch_id,
+        "total": len(rows),
+        "counts": counts,
+        "cached": sum(row["cached"] for row in rows),
+        "finished": counts["done"] + counts["failed"] == len(rows),
+        "latency": latency_stats([row["duration_ms"] for row in rows if row["status"] == "done" and not row["cached"]],
+                                 window),
+        "jobs": [{"job_id": row["id"], "operation_id": row["operation_id"], "status": row["status"],
+                  "cached": bool(row["cached"]), "duration_ms": row["duration_ms"], "error": row["error"]}
+                 for row in rows],
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import queue
+    import sys
+    import time
+
+    import app as server
+    import reports
+
+    parser = argparse.ArgumentParser(description="Generate reports for many operations.")
+    parser.add_argument('--operations', help="comma-separated operation ids (default: all)")
+    parser.add_argument('--comments', default="", help="analyst comments for every report")
+    parser.add_argument('--concurrency', type=int, help="parallel report jobs (default: reports.workers)")
+    parser.add_argument('--bypass-cache', action='store_true')
+    parser.add_argument('--output', help="JSON lines file for the results (default: stdout)")
+    args = parser.parse_args()
+
+    conn = server.get_db()
+    requested = [int(x) for x in args.operations.split(',')] if args.operations else None
+    operation_ids = resolve_operations(conn, requested)
+    conn.close()
+    if not operation_ids:
+        sys.exit("No operations found.")
+
+    jobs = reports.JobQueue(server.get_db, server.generate_llm_report, workers=args.concurrency,
+                            max_pending=len(operation_ids))
+    server.report_jobs = jobs
+    finished = queue.Queue()
+    jobs.add_listener(finished.put)
+
+    batch_id = new_batch_id()
+    start = time.perf_counter()
+    remaining = set()
+    for op_id in operation_ids:
+        job_id, hit = server.submit_report(op_id, args.comments, args.bypass_cache, batch_id)
+        if hit:
+            finished.put(job_id)
+        remaining.add(job_id)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    durations = []
+    failed = 0
+    while remaining:
+        job_id = finished.get()
+        if job_id not in remaining:
+            continue
+        remaining.discard(job_id)
+        job = jobs.get(job_id)
+        if job["status"] == "done" and not job["cached"]:
+            durations.append(job["duration_ms"])
+        failed += job["status"] == "failed"
+        out.write(json.dumps({key: job[key] for key in
+                              ("operation_id", "id", "status", "cached", "duration_ms", "error", "report")}) + "\n")
+        out.flush()
+        print(f"[{len(operation_ids) - len(remaining)}/{len(operation_ids)}] operation {job['operation_id']}: "
+              f"{job['status']}", file=sys.stderr)
+    wall = time.perf_counter() - start
+    jobs.shutdown()
+    if out is not sys.stdout:
+        out.close()
+
+    stats = latency_stats(durations, wall)
+    print(json.dumps(dict(batch_id=batch_id, operations=len(operation_ids), failed=failed,
+                          seconds=round(wall, 2), **stats), indent=2), file=sys.stderr)
@@ -0,0 +1,75 @@
+"""
+Benchmark for the shared-infrastructure index (artifacts.py).
+
+Fills a fresh database like bench_search (indicator evidence naming random
+domains, IP addresses and wallets, channel URLs on the same domains), times
+a full artifacts.rebuild() and then GET /channels/<id>/overlaps for random
+channels, printing p50/p95 latency and the average number of overlapping
+channels and operations found.
+
+    python benchmarks/bench_artifacts.py [--indicators 1000000] [--queries 500]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import artifacts  # noqa: E402
+from bench_ingest import fresh_db  # noqa: E402
+from bench_search import populate  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=20000)
+    parser.add_argument('--indicators', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+    rnd = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'artifacts.db')
+        with redirect_stdout(io.StringIO()):
+            conn = fresh_db(path)
+        populate(conn, args.operations, args.channels, args.indicators)
+
+        start = time.perf_counter()
+        refs = artifacts.rebuild(conn)
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        n_artifacts = conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        print(f"rebuild: {refs} references to {n_artifacts} artifacts from {args.indicators} indicators "
+              f"in {elapsed:.1f}s ({args.indicators / elapsed:,.0f} indicators/s)")
+        conn.close()
+
+        server.DB_FILE = path
+        client = server.app.test_client()
+        for label, query in (("all kinds", {}), ("wallets only", {"kind": "wallet"})):
+            timings, channels, operations = [], 0, 0
+            for _ in range(args.queries):
+                channel_id = rnd.randint(1, args.channels)
+                start = time.perf_counter()
+                body = client.get(f'/channels/{channel_id}/overlaps', query_string=query).get_json()
+                timings.append((time.perf_counter() - start) * 1000)
+                channels += body["channel_count"]
+                operations += len(body["operations"])
+            print(f"overlaps, {label:<13} p50 {percentile(timings, 50):>6.1f}ms  p95 {percentile(timings, 95):>6.1f}ms  "
+                  f"{channels / args.queries:.0f} channels in {operations / args.queries:.0f} operations on average")
+        server.db.reset_pools()
+
+
+if __name__ == '__main__':
+    main()
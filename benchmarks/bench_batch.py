@@ -0,0 +1,89 @@
+"""
+Batch report generation against the local mock model.
+
+Creates a database with --operations operations, starts the mock API with a
+share of 429/500 failures, and runs one batch through POST /report_batches.
+Polls GET /report_batches/<id> until every job is finished, then prints
+the batch summary, the retries the mock saw and the peak request rate in
+any 60 second window, which must stay within --rpm.
+
+    python benchmarks/bench_batch.py [--operations 40] [--workers 8] [--rpm 120] [--fail-rate 0.1]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+from openai import OpenAI  # noqa: E402
+
+import app as server  # noqa: E402
+import ingest  # noqa: E402
+import reports  # noqa: E402
+import settings  # noqa: E402
+from bench_ingest import fresh_db, generate  # noqa: E402
+from mock_openai import start_server  # noqa: E402
+
+
+def peak_rate(stamps, window=60.0):
+    stamps = sorted(stamps)
+    peak, first = 0, 0
+    for last, stamp in enumerate(stamps):
+        while stamp - stamps[first] >= window:
+            first += 1
+        peak = max(peak, last - first + 1)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=40)
+    parser.add_argument('--channels', type=int, default=400, help="channels across all operations")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rpm', type=int, default=120)
+    parser.add_argument('--tpm', type=int, default=1000000)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--fail-rate', type=float, default=0.1)
+    args = parser.parse_args()
+
+    # In-process overrides of the "reports" limits; config.json on disk is left alone
+    limits = {"requests_per_minute": args.rpm, "tokens_per_minute": args.tpm, "retry_backoff": 0.2}
+    settings.get_config().setdefault("reports", {}).update(limits)
+
+    mock, base_url = start_server(latency=args.latency, tokens=150, fail_rate=args.fail_rate)
+    server.client = OpenAI(api_key="mock", base_url=base_url, max_retries=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = fresh_db(os.path.join(tmp, 'batch.db'))
+        settings.get_config()["reports"].update(limits)
+        ingest.import_lines(conn, generate(args.channels, 3, args.operations))
+        conn.close()
+        server.report_jobs = reports.JobQueue(server.get_db, server.generate_llm_report, workers=args.workers)
+
+        client = server.app.test_client()
+        start = time.perf_counter()
+        batch = client.post('/report_batches', json={"analyst_comments": "weekly", "bypass_cache": True}).get_json()
+        while True:
+            summary = client.get(batch["url"]).get_json()
+            if summary["finished"]:
+                break
+            time.sleep(0.2)
+        wall = time.perf_counter() - start
+        server.report_jobs.shutdown()
+
+    summary.pop("jobs")
+    print(json.dumps(summary, indent=2))
+    print(f"wall {wall:.1f}s, {summary['counts']['done'] * 60 / wall:.1f} reports/min; mock saw "
+          f"{mock.state.requests} requests, {mock.state.failures} injected failures, "
+          f"peak {peak_rate(mock.state.started)} requests in 60s (limit {args.rpm})")
+    mock.shutdown()
+
+
+if __name__ == '__main__':
+    main()
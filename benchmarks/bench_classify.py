@@ -0,0 +1,115 @@
+"""
+Benchmark for /classify: per-channel queries vs. the single-join engine.
+
+Builds a throwaway database from schema.sql and the migrations for a range
+of channel counts, checks that both code paths return identical results and
+prints timings.
+
+    python benchmarks/bench_classify.py [--channels 100,1000,5000] [--per-channel 10]
+"""
+
+import argparse
+import io
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import migrations  # noqa: E402
+from classification import aggregate_channels, classify_operation_channels, exposure_results, get_engine, invalidate_catalog  # noqa: E402
+
+SUBTYPES = [
+    ('technical', 'Public affiliation', 'Self-attribution', 3, 'High'),
+    ('technical', 'Financial records', 'Funding links', 3, 'High'),
+    ('technical', 'Shared infrastructure', 'IP addresses', 2, 'High'),
+    ('technical', 'Shared infrastructure', 'Hosting services', 2, 'Medium'),
+    ('behavioral', 'Systematic interaction', 'Copy-pasting', 1, 'Medium'),
+    ('behavioral', 'Coordinated messaging', 'Time synchronization', 1, 'Medium'),
+    ('behavioral', 'Inauthentic media', 'AI-generated profiles', 1, 'Low'),
+]
+
+
+def build_db(path, n_channels, per_channel, seed=0):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with open('schema.sql') as f:
+        conn.executescript(f.read())
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn)
+    conn.executemany("""
+        INSERT INTO indicator_types (group_type, category, subtype, default_weight, default_confidence)
+        VALUES (?, ?, ?, ?, ?)
+    """, SUBTYPES)
+    conn.execute("INSERT INTO operations (name) VALUES ('bench')")
+    op_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO channels (operation_id, name, platform, url, notes) VALUES (?, ?, ?, ?, ?)",
+        [(op_id, f"channel-{n}", "web", f"https://example{n}.test",
+          "state media outlet" if n % 7 == 0 else "notes") for n in range(n_channels)])
+    channel_ids = [r[0] for r in conn.execute("SELECT id FROM channels WHERE operation_id = ?", (op_id,))]
+    rows = []
+    for cid in channel_ids:
+        for _ in range(rnd.randint(0, per_channel * 2)):
+            type_id = rnd.randrange(len(SUBTYPES))
+            group, _, name, weight, conf = SUBTYPES[type_id]
+            rows.append((cid, group, name, type_id + 1, weight, conf, "evidence", "OSINT"))
+    conn.executemany("""
+        INSERT INTO indicators (channel_id, type, name, indicator_type_id, weight, confidence, evidence, source_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    return conn, op_id, len(rows)
+
+
+def classify_per_channel(conn, op_id):
+    """The original N+1 access pattern: one indicator query per channel."""
+    engine = get_engine(conn)
+    aggregates = []
+    for ch in conn.execute("SELECT id, operation_id, name, notes FROM channels WHERE operation_id = ?",
+                           (op_id,)).fetchall():
+        rows = [tuple(ch) + (None,) * 7]
+        for i in conn.execute("SELECT id, type, indicator_type_id, name, weight, confidence, evidence FROM indicators "
+                              "WHERE channel_id = ?", (ch['id'],)).fetchall():
+            rows.append(tuple(ch) + tuple(i))
+        aggregates.extend(aggregate_channels(rows, engine))
+    return exposure_results(engine, aggregates)
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', default='100,1000,5000')
+    parser.add_argument('--per-channel', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'channels':>9} {'indicators':>11} {'per-channel':>12} {'single-join':>12} {'speedup':>8}")
+    for n in [int(x) for x in args.channels.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn, op_id, n_ind = build_db(os.path.join(tmp, 'bench.db'), n, args.per_channel)
+            conn.row_factory = sqlite3.Row
+            invalidate_catalog()
+            old_t, old = timed(lambda: classify_per_channel(conn, op_id), args.repeat)
+            new_t, new = timed(lambda: classify_operation_channels(conn, op_id), args.repeat)
+            conn.close()
+        assert old == new, "engine output diverged from the per-channel baseline"
+        print(f"{n:>9} {n_ind:>11} {old_t * 1000:>10.1f}ms {new_t * 1000:>10.1f}ms {old_t / new_t:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark for coordination-graph analytics (graph.py).
+
+Builds one operation with --channels channels and a random link graph of
+each requested size, then times a cold GET /graph/<id> (adjacency index
+built from the database), a warm one with the serialized response dropped
+(index and derived results reused, classification re-read) and a
+conditional GET.
+
+    python benchmarks/bench_graph.py [--links 10000,100000,300000] [--channels 20000]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import channel_classification  # noqa: E402
+import graph  # noqa: E402
+import migrations  # noqa: E402
+from bench_classify import build_db  # noqa: E402
+
+CONFIDENCES = ["High", "Medium", "Low", None]
+
+
+def add_links(conn, op_id, n_links, seed=0):
+    rnd = random.Random(seed)
+    ids = [r[0] for r in conn.execute("SELECT id FROM channels WHERE operation_id = ?", (op_id,))]
+    conn.executemany("""
+        INSERT INTO channel_links (operation_id, from_channel_id, to_channel_id, link_type, confidence)
+        VALUES (?, ?, ?, 'reposting', ?)
+    """, [(op_id, rnd.choice(ids), rnd.choice(ids), rnd.choice(CONFIDENCES)) for _ in range(n_links)])
+    conn.commit()
+
+
+def timed_get(client, url, headers=None):
+    start = time.perf_counter()
+    response = client.get(url, headers=headers or {})
+    return (time.perf_counter() - start) * 1000, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--links', default='10000,100000,300000')
+    parser.add_argument('--channels', type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'links':>8} {'cold':>9} {'warm':>9} {'304':>8} {'components':>11} {'clusters':>9} {'propagated':>11}")
+    for n_links in [int(x) for x in args.links.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.db')
+            conn, op_id, _ = build_db(path, args.channels, 2)
+            conn.row_factory = sqlite3.Row
+            with open(os.devnull, 'w') as quiet:
+                stdout, sys.stdout = sys.stdout, quiet
+                migrations.migrate(conn)
+                sys.stdout = stdout
+            channel_classification.rebuild(conn)
+            add_links(conn, op_id, n_links)
+            conn.close()
+
+            server.DB_FILE = path
+            graph._cache.clear()
+            server.response_cache.clear()
+            client = server.app.test_client()
+            cold, response = timed_get(client, f'/graph/{op_id}')
+            # Same revision, serialized response dropped: the adjacency index and its results are reused
+            server.response_cache.clear()
+            warm, response = timed_get(client, f'/graph/{op_id}')
+            conditional, _ = timed_get(client, f'/graph/{op_id}', {"If-None-Match": response.headers["ETag"]})
+            result = response.get_json()
+            server.db.reset_pools()
+        print(f"{n_links:>8} {cold:>7.0f}ms {warm:>7.0f}ms {conditional:>6.1f}ms {result['components']['count']:>11} "
+              f"{result['coordination_clusters']['count']:>9} {result['propagated']['count']:>11}")
+
+
+if __name__ == '__main__':
+    main()
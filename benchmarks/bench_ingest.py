@@ -0,0 +1,131 @@
+"""
+Benchmark for bulk NDJSON import.
+
+Generates a synthetic import (operations, channels, indicators, links) and
+loads it into a fresh database twice: once the way the per-record API
+routes do it (one INSERT + commit + classification update per record) and
+once through ingest.Importer. Checks that the materialized classification
+state matches a full recompute afterwards.
+
+    python benchmarks/bench_ingest.py [--channels 5000] [--per-channel 10] [--chunk 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import channel_classification  # noqa: E402
+import db  # noqa: E402
+import ingest  # noqa: E402
+from bench_classify import SUBTYPES  # noqa: E402
+from classification import invalidate_catalog  # noqa: E402
+
+TARGET_ROWS_PER_SECOND = 50000
+
+
+def generate(n_channels, per_channel, operations=1, seed=0):
+    rnd = random.Random(seed)
+    lines = []
+    for o in range(operations):
+        lines.append(json.dumps({"kind": "operation", "key": f"op{o}", "name": f"bench-{o}", "region": "EU"}))
+    for n in range(n_channels):
+        op = f"op{n % operations}"
+        lines.append(json.dumps({"kind": "channel", "key": f"c{n}", "operation": op, "name": f"channel-{n}",
+                                 "platform": "web", "url": f"https://example{n}.test",
+                                 "notes": "state media outlet" if n % 7 == 0 else "notes"}))
+        for _ in range(rnd.randint(0, per_channel * 2)):
+            group, _, name, weight, conf = rnd.choice(SUBTYPES)
+            lines.append(json.dumps({"kind": "indicator", "channel": f"c{n}", "type": group, "name": name,
+                                     "weight": weight, "confidence": conf, "evidence": "evidence",
+                                     "source_type": "OSINT"}))
+        if n >= operations:
+            lines.append(json.dumps({"kind": "link", "operation": op, "from": f"c{n}", "to": f"c{n - operations}",
+                                     "link_type": "reposting", "confidence": "Medium"}))
+    return lines
+
+
+def fresh_db(path):
+    db.reset_pools()
+    server.DB_FILE = path
+    invalidate_catalog()
+    server.init_db()
+    return db.acquire(path)
+
+
+def import_per_record(conn, lines):
+    """The API route pattern: every record is its own transaction."""
+    keys = {}
+    for line in lines:
+        r = json.loads(line)
+        cur = conn.cursor()
+        if r["kind"] == "operation":
+            cur.execute("INSERT INTO operations (name, region) VALUES (?, ?)", (r["name"], r["region"]))
+            keys[r["key"]] = cur.lastrowid
+        elif r["kind"] == "channel":
+            op_id = keys[r["operation"]]
+            cur.execute("INSERT INTO channels (operation_id, name, platform, url, notes) VALUES (?, ?, ?, ?, ?)",
+                        (op_id, r["name"], r["platform"], r["url"], r["notes"]))
+            keys[r["key"]] = cur.lastrowid
+            channel_classification.channel_added(conn, cur.lastrowid, op_id)
+        elif r["kind"] == "indicator":
+            channel_id = keys[r["channel"]]
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+            cur.execute("""
+                INSERT INTO indicators (channel_id, type, name, weight, confidence, evidence, source_type, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (channel_id, r["type"], r["name"], r["weight"], r["confidence"], r["evidence"], r["source_type"],
+                  timestamp))
+            channel_classification.indicator_added(conn, channel_id, r["type"], r["name"], r["weight"],
+                                                   r["confidence"], r["evidence"], timestamp=timestamp)
+        else:
+            cur.execute("""
+                INSERT INTO channel_links (operation_id, from_channel_id, to_channel_id, link_type, confidence)
+                VALUES (?, ?, ?, ?, ?)
+            """, (keys[r["operation"]], keys[r["from"]], keys[r["to"]], r["link_type"], r["confidence"]))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', type=int, default=5000)
+    parser.add_argument('--per-channel', type=int, default=10)
+    parser.add_argument('--operations', type=int, default=1)
+    parser.add_argument('--chunk', type=int, default=ingest.DEFAULT_CHUNK)
+    parser.add_argument('--skip-baseline', action='store_true', help="only time the bulk importer")
+    args = parser.parse_args()
+
+    lines = generate(args.channels, args.per_channel, args.operations)
+    print(f"{len(lines)} records ({args.channels} channels, {args.operations} operations)")
+
+    runs = [("bulk import", lambda conn: ingest.import_lines(conn, lines, args.chunk))]
+    if not args.skip_baseline:
+        runs.insert(0, ("per-record", lambda conn: import_per_record(conn, lines)))
+
+    print(f"{'path':>12} {'seconds':>9} {'rows/s':>10} {'errors':>7} {'consistent':>11}")
+    for name, fn in runs:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = fresh_db(os.path.join(tmp, 'ingest.db'))
+            start = time.perf_counter()
+            summary = fn(conn)
+            elapsed = time.perf_counter() - start
+            consistent = not channel_classification.check(conn)
+            conn.close()
+            db.reset_pools()
+        errors = len(summary["errors"]) if summary else 0
+        print(f"{name:>12} {elapsed:>9.2f} {len(lines) / elapsed:>10.0f} {errors:>7} {str(consistent):>11}")
+
+    print(f"target: {TARGET_ROWS_PER_SECOND} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark for report prompt building: per-channel queries and += vs. one
+join and join-based assembly.
+
+    python benchmarks/bench_prompt.py [--channels 100,1000,5000] [--per-channel 10]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import migrations  # noqa: E402
+import prompts  # noqa: E402
+from bench_classify import build_db, timed  # noqa: E402
+
+
+def concat_prompt(conn, op_id, analyst_comments):
+    """The previous craft_prompt body: one indicator query per channel, grown with +=."""
+    op = conn.execute("SELECT * FROM operations WHERE id = ?", (op_id,)).fetchone()
+    channels = conn.execute("SELECT * FROM channels WHERE operation_id = ?", (op_id,)).fetchall()
+    prompt = f"**Operation Overview**: {op['name']} {op['description']}\n**Analyst Comments**: {analyst_comments}\n"
+    for ch in channels:
+        prompt += f"- Channel: {ch['name']} ({ch['platform']})\n- URL: {ch['url']}\n- Notes: {ch['notes']}\n"
+        for i in conn.execute("SELECT * FROM indicators WHERE channel_id = ?", (ch['id'],)).fetchall():
+            prompt += f"  - [{i['type']}] {i['name']} (Confidence: {i['confidence']}, Weight: {i['weight']})\n"
+            prompt += f"    Evidence: {i['evidence']}\n"
+    return prompt
+
+
+def planned_prompt(conn, op_id, analyst_comments):
+    op, channels = prompts.load_operation(conn, op_id)
+    return prompts.build_plan(op, channels, analyst_comments)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', default='100,1000,5000')
+    parser.add_argument('--per-channel', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'channels':>9} {'indicators':>11} {'concat':>10} {'planned':>10} {'requests':>9} {'max tokens':>11}")
+    for n in [int(x) for x in args.channels.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn, op_id, n_ind = build_db(os.path.join(tmp, 'bench.db'), n, args.per_channel)
+            conn.row_factory = sqlite3.Row
+            with open(os.devnull, 'w') as quiet:
+                stdout, sys.stdout = sys.stdout, quiet
+                migrations.migrate(conn)  # indexes, so the per-channel baseline is not a strawman
+                sys.stdout = stdout
+            old_t, _ = timed(lambda: concat_prompt(conn, op_id, "comments"), args.repeat)
+            new_t, plan = timed(lambda: planned_prompt(conn, op_id, "comments"), args.repeat)
+            conn.close()
+        requests = plan.get("map") or [plan["messages"]]
+        largest = max(sum(prompts.estimate_tokens(m["content"]) for m in messages) for messages in requests)
+        print(f"{n:>9} {n_ind:>11} {old_t * 1000:>8.1f}ms {new_t * 1000:>8.1f}ms {len(requests):>9} {largest:>11}")
+
+
+if __name__ == '__main__':
+    main()
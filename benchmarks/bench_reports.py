@@ -0,0 +1,100 @@
+"""
+Report generation vs. the rest of the API, against the local mock model.
+
+Simulates a server with a fixed number of request workers. A handful of
+"generate report" requests arrive together with a stream of cheap
+GET /operations requests. In sync mode every report request holds a
+worker for the whole model call (the old behaviour); in queued mode it
+only enqueues a job. Prints the latency of the cheap requests and how many
+model calls ran against the mock at once.
+
+    python benchmarks/bench_reports.py [--workers 4] [--reports 8] [--latency 2]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+from openai import OpenAI  # noqa: E402
+
+import app as server  # noqa: E402
+import ingest  # noqa: E402
+import reports  # noqa: E402
+from bench_ingest import fresh_db, generate  # noqa: E402
+from load_test import percentile  # noqa: E402
+from mock_openai import start_server  # noqa: E402
+
+
+def run(mode, args, base_url):
+    server.client = OpenAI(api_key="mock", base_url=base_url)
+    server.report_jobs = reports.JobQueue(server.get_db, server.generate_llm_report, workers=args.llm_workers)
+    client = server.app.test_client()
+
+    def report_request(op_id):
+        if mode == "sync":
+            server.generate_llm_report(op_id, "benchmark")
+        else:
+            res = client.post(f'/generate_report/{op_id}', json={"analyst_comments": "benchmark"})
+            return res.get_json()["job_id"]
+
+    def cheap_request(queued_at):
+        client.get('/operations')
+        return time.perf_counter() - queued_at
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        report_futures = [pool.submit(report_request, 1 + n % args.operations) for n in range(args.reports)]
+        cheap_futures = []
+        for _ in range(args.requests):
+            cheap_futures.append(pool.submit(cheap_request, time.perf_counter()))
+            time.sleep(0.01)
+        latencies = [f.result() for f in cheap_futures]
+        job_ids = [f.result() for f in report_futures]
+
+    if mode == "queued":
+        jobs = [server.report_jobs.wait(job_id) for job_id in job_ids]
+        assert all(job["status"] == "done" for job in jobs), [job["error"] for job in jobs]
+        server.report_jobs.shutdown()
+
+    return {
+        "mode": mode,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "total": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help="simulated request workers")
+    parser.add_argument('--llm-workers', type=int, default=2, help="report job pool size")
+    parser.add_argument('--reports', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help="cheap requests sent alongside")
+    parser.add_argument('--operations', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=2.0, help="mock model latency in seconds")
+    args = parser.parse_args()
+
+    mock, base_url = start_server(latency=args.latency, tokens=200, token_delay=0.002)
+    print(f"{'mode':>7} {'cheap p50':>10} {'cheap p95':>10} {'total':>8} {'max concurrent LLM calls':>25}")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = fresh_db(os.path.join(tmp, 'reports.db'))
+        ingest.import_lines(conn, generate(200, 5, args.operations))
+        conn.close()
+        for mode in ("sync", "queued"):
+            mock.state.max_in_flight = 0
+            r = run(mode, args, base_url)
+            print(f"{r['mode']:>7} {r['p50']:>8.1f}ms {r['p95']:>8.1f}ms {r['total']:>7.1f}s "
+                  f"{mock.state.max_in_flight:>25}")
+    mock.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark for full-text search (search.py).
+
+Fills a fresh database with --operations operations and --indicators
+indicators whose evidence mentions random domains, IP addresses and
+wallets, inserted through the sync triggers. Then runs GET /search for
+selective terms (one domain, IP or wallet), for a common word, globally and
+scoped to one operation, and prints p50/p95 latency per query type.
+
+    python benchmarks/bench_search.py [--indicators 1000000] [--queries 200]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+from bench_classify import SUBTYPES  # noqa: E402
+from bench_ingest import fresh_db  # noqa: E402
+from load_test import percentile  # noqa: E402
+
+WORDS = "observed reposted coordinated hosting registrar payment shared account article cluster".split()
+
+
+def populate(conn, n_operations, n_channels, n_indicators, seed=0):
+    rnd = random.Random(seed)
+    domains = [f"news-{n}.example{n % 97}.com" for n in range(n_indicators // 20)]
+    ips = [".".join(str(rnd.randint(1, 254)) for _ in range(4)) for _ in range(n_indicators // 20)]
+    wallets = ["bc1q" + "".join(rnd.choice("0123456789abcdefghjkmnpqrstuvwxyz") for _ in range(38))
+               for _ in range(n_indicators // 50)]
+
+    conn.executemany("INSERT INTO operations (name, description) VALUES (?, ?)",
+                     [(f"operation {n}", " ".join(rnd.choices(WORDS, k=12))) for n in range(n_operations)])
+    conn.executemany("INSERT INTO channels (operation_id, name, url, notes) VALUES (?, ?, ?, ?)",
+                     [(1 + n % n_operations, f"channel {n}", f"https://{rnd.choice(domains)}/{n}",
+                       " ".join(rnd.choices(WORDS, k=8))) for n in range(n_channels)])
+    conn.commit()
+
+    start, batch = time.perf_counter(), []
+    for n in range(n_indicators):
+        group, _, name, weight, confidence = rnd.choice(SUBTYPES)
+        evidence = (f"{' '.join(rnd.choices(WORDS, k=6))} {rnd.choice(domains)} resolves to {rnd.choice(ips)}, "
+                    f"paid from {rnd.choice(wallets)}")
+        batch.append((1 + n % n_channels, group, name, weight, confidence, evidence))
+        if len(batch) == 50000 or n == n_indicators - 1:
+            conn.executemany("INSERT INTO indicators (channel_id, type, name, weight, confidence, evidence) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            conn.commit()
+            batch = []
+    return time.perf_counter() - start, domains, ips, wallets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=20000)
+    parser.add_argument('--indicators', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    rnd = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with redirect_stdout(io.StringIO()):
+            conn = fresh_db(os.path.join(tmp, 'search.db'))
+        elapsed, domains, ips, wallets = populate(conn, args.operations, args.channels, args.indicators)
+        print(f"inserted {args.indicators} indicators through the search triggers in {elapsed:.1f}s "
+              f"({args.indicators / elapsed:,.0f} rows/s)")
+        conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+        conn.commit()
+        conn.close()
+
+        client = server.app.test_client()
+        cases = {
+            "domain": lambda: {"q": rnd.choice(domains)},
+            "ip": lambda: {"q": rnd.choice(ips)},
+            "wallet": lambda: {"q": rnd.choice(wallets)},
+            "wallet prefix": lambda: {"q": rnd.choice(wallets)[:12] + "*"},
+            "domain, scoped": lambda: {"q": rnd.choice(domains), "operation_id": rnd.randint(1, args.operations)},
+            "common word": lambda: {"q": rnd.choice(WORDS), "limit": 20},
+            "common word, scoped": lambda: {"q": rnd.choice(WORDS), "limit": 20,
+                                            "operation_id": rnd.randint(1, args.operations)},
+        }
+        print(f"{'query':<20} {'p50':>9} {'p95':>9} {'results':>8}")
+        for label, make in cases.items():
+            timings, found = [], 0
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                response = client.get('/search', query_string=make())
+                timings.append((time.perf_counter() - start) * 1000)
+                found += len(response.get_json())
+            print(f"{label:<20} {percentile(timings, 50):>7.1f}ms {percentile(timings, 95):>7.1f}ms "
+                  f"{found / args.queries:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Worker cold start: time to import app.py and to get through create_app().
+
+Starts --runs fresh interpreters for each step and reports the median
+wall time of `import app`, of create_app() on a new database (which runs
+init_db()) and on an already initialized one (schema version check only),
+and of get_client(), the lazy OpenAI import paid by the first report.
+Then lists the slowest top-level imports from python -X importtime.
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+STEPS = {
+    "import app": "t = time.perf_counter(); import app",
+    "create_app, new db": "import app; app.DB_FILE = DB; os.path.exists(DB) and os.remove(DB); "
+                          "t = time.perf_counter(); app.create_app()",
+    "create_app, ready db": "import app; app.DB_FILE = DB; t = time.perf_counter(); app.create_app()",
+    "first get_client()": "import app; t = time.perf_counter(); app.get_client()",
+}
+
+
+def run_step(code, db_path):
+    script = (f"import io, os, sys, time, contextlib\nsys.path.insert(0, {ROOT!r})\nDB = {db_path!r}\n"
+              f"with contextlib.redirect_stdout(io.StringIO()):\n    {code}\n"
+              "print((time.perf_counter() - t) * 1000)")
+    out = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top):
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            rows.append((int(parts[1]) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'startup.db')
+        print(f"{'step':<22} {'median':>9} {'min':>9}")
+        for label, code in STEPS.items():
+            timings = [run_step(code, db_path) for _ in range(args.runs)]
+            print(f"{label:<22} {statistics.median(timings):>7.0f}ms {min(timings):>7.0f}ms")
+
+    print("\nslowest imports under app (cumulative):")
+    for ms, name in slowest_imports(args.top):
+        print(f"{ms:>8.1f}ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Peak memory of the STIX export: materialized bundle vs. streamed fragments.
+
+Builds throwaway databases of increasing size and measures the tracemalloc
+peak while exporting each one, once by collecting every object into a list
+and serializing it (the old export_stix) and once through
+stix_export.iter_bundle. Also checks that two streamed exports are
+byte-identical.
+
+    python benchmarks/bench_stix.py [--channels 100,1000,5000] [--per-channel 10]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import stix_export  # noqa: E402
+from bench_classify import build_db  # noqa: E402
+
+
+def materialized(conn, op_id):
+    objects = list(stix_export.iter_objects(conn, [op_id]))
+    return len(json.dumps({"type": "bundle", "id": "bundle--x", "objects": objects}))
+
+
+def streamed(conn, op_id):
+    return sum(len(fragment) for fragment in stix_export.iter_bundle(conn, [op_id]))
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--channels', default='100,1000,5000')
+    parser.add_argument('--per-channel', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'channels':>9} {'indicators':>11} {'bundle':>9} {'list peak':>10} {'stream peak':>12} {'stream time':>12}")
+    for n in [int(x) for x in args.channels.split(',')]:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn, op_id, n_ind = build_db(os.path.join(tmp, 'bench.db'), n, args.per_channel)
+            conn.row_factory = sqlite3.Row
+            _, _, list_peak = measure(materialized, conn, op_id)
+            size, elapsed, stream_peak = measure(streamed, conn, op_id)
+            assert "".join(stix_export.iter_bundle(conn, [op_id])) == "".join(stix_export.iter_bundle(conn, [op_id]))
+            conn.close()
+        print(f"{n:>9} {n_ind:>11} {size / 2 ** 20:>7.1f}MB {list_peak:>8.1f}MB {stream_peak:>10.2f}MB "
+              f"{elapsed * 1000:>10.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
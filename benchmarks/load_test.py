@@ -0,0 +1,124 @@
+"""
+Reader/writer load test for the connection pool.
+
+Reader threads hit GET /classify/<op_id> through Flask's test client while a
+writer thread repeatedly holds an exclusive write transaction (inserting
+indicators) for --hold milliseconds, the way a large import or cascade
+delete does once its changes spill out of the page cache. Run once with the
+rollback journal and once with WAL to compare reader latency and
+"database is locked" failures.
+
+    python benchmarks/load_test.py [--readers 8] [--seconds 5] [--hold 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import db  # noqa: E402
+from bench_classify import build_db  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(path, journal_mode, args):
+    db.reset_pools()
+    db._pools[path] = db.ConnectionPool(path, pragmas={"journal_mode": journal_mode,
+                                                       "busy_timeout": args.busy_timeout})
+    server.DB_FILE = path
+    conn, op_id, _ = build_db(path, args.channels, 10)
+    conn.close()
+    server.init_db()
+
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    writes = [0]
+
+    def writer():
+        conn = db.acquire(path)
+        channel_id = conn.execute("SELECT MIN(id) FROM channels").fetchone()[0]
+        conn.close()
+        while not stop.is_set():
+            conn = db.acquire(path)
+            try:
+                conn.execute("BEGIN EXCLUSIVE")
+                conn.executemany("""
+                    INSERT INTO indicators (channel_id, type, name, weight, confidence, evidence)
+                    VALUES (?, 'behavioral', 'Copy-pasting', 1, 'Medium', 'load test')
+                """, [(channel_id,)] * 200)
+                time.sleep(args.hold / 1000)
+                conn.commit()
+                writes[0] += 1
+            except Exception as e:
+                errors.append(f"writer: {e}")
+            finally:
+                conn.close()
+
+    def reader():
+        client = server.app.test_client()
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                res = client.get(f'/classify/{op_id}')
+                if res.status_code != 200:
+                    errors.append(f"reader: HTTP {res.status_code}")
+                    continue
+            except Exception as e:
+                errors.append(f"reader: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    db.reset_pools()
+
+    return {
+        "mode": journal_mode,
+        "reads": len(latencies),
+        "writes": writes[0],
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "max": max(latencies, default=0) * 1000,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--hold', type=float, default=50, help="ms the writer keeps its transaction open")
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--busy-timeout', type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'journal':>8} {'reads':>7} {'writes':>7} {'p50':>9} {'p95':>9} {'max':>9} {'errors':>7}")
+    for mode in ("delete", "wal"):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = run(os.path.join(tmp, f'load-{mode}.db'), mode, args)
+        print(f"{r['mode']:>8} {r['reads']:>7} {r['writes']:>7} {r['p50']:>7.1f}ms {r['p95']:>7.1f}ms "
+              f"{r['max']:>7.1f}ms {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API.
+
+Answers POST /v1/chat/completions (plain and stream=true) with a canned
+report after a configurable delay, so report generation can be exercised
+and load-tested without a real model. Point BASE_URL at it:
+
+    python benchmarks/mock_openai.py [--port 8808] [--latency 2] [--tokens 200] [--token-delay 0.01] [--fail-rate 0.1]
+    # BASE_URL = "http://127.0.0.1:8808/v1"
+
+With --fail-rate a share of requests gets a 429 (with Retry-After) or a
+500 instead, to exercise retries. It can also be started in-process with
+start_server(), as the benchmarks do.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("The", "operation", "shows", "coordinated", "behavior", "across", "channels", "with", "shared",
+         "infrastructure", "and", "state", "media", "amplification.")
+
+
+class MockState:
+    def __init__(self, latency=1.0, tokens=100, token_delay=0.0, fail_rate=0.0, seed=0):
+        self.latency = latency
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+
+    def enter(self):
+        """Count the request; return an error status to answer with, or None."""
+        with self.lock:
+            self.requests += 1
+            self.started.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.fail_rate and self.random.random() < self.fail_rate:
+                self.failures += 1
+                return self.random.choice((429, 500))
+        return None
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def completion_words(n):
+    return [WORDS[i % len(WORDS)] + " " for i in range(n)]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+
+        state = self.state
+        error = state.enter()
+        try:
+            if error == 429:
+                return self._json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                  [("Retry-After", "0.2")])
+            if error:
+                return self._json(500, {"error": {"message": "Internal server error", "type": "server_error"}})
+            time.sleep(state.latency)
+            words = completion_words(min(state.tokens, body.get("max_tokens") or state.tokens))
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            base = {"id": f"chatcmpl-mock-{state.requests}", "created": int(time.time()),
+                    "model": body.get("model", "mock-model")}
+            if body.get("stream"):
+                self._stream(base, words)
+            else:
+                self._json(200, dict(base, object="chat.completion", choices=[{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop"
+                }], usage={"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                           "total_tokens": prompt_tokens + len(words)}))
+        finally:
+            state.leave()
+
+    def _stream(self, base, words):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for word in words:
+            send(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": {"content": word}, "finish_reason": None}])))
+            if self.state.token_delay:
+                time.sleep(self.state.token_delay)
+        send(json.dumps(dict(base, object="chat.completion.chunk", choices=[
+            {"index": 0, "delta": {}, "finish_reason": "stop"}])))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_server(port=0, **options):
+    """Start the mock in a daemon thread; return (server, base_url)."""
+    state = MockState(**options)
+    handler = type("MockHandler", (Handler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8808)
+    parser.add_argument('--latency', type=float, default=2.0, help="seconds before the first token")
+    parser.add_argument('--tokens', type=int, default=200)
+    parser.add_argument('--token-delay', type=float, default=0.01)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="share of requests answered with 429/500")
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, latency=args.latency, tokens=args.tokens, token_delay=args.token_delay,
+                               fail_rate=args.fail_rate)
+    print(f"Mock OpenAI API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
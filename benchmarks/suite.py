@@ -0,0 +1,229 @@
+"""
+Benchmark suite for the main read paths and deletes, with JSON results.
+
+Builds a synthetic database (synthetic.py) in a temporary directory, then
+times through Flask's test client or directly:
+
+- GET /classify/<id>, GET /api/operations_data/<id>, GET /graph/<id>,
+  GET /api/bootstrap/<id> (plain and gzip), GET /timeline/<id> (daily
+  buckets): response caches cleared before every request, so the body is
+  rebuilt
+- GET /export_stix/<id>, streamed body read to the end
+- craft_prompt() for an operation
+- classify_channel() for the indicators of one channel
+- POST /api/simulate with a 50x20 threshold sweep over all operations
+- DELETE /channels/<id> and DELETE /operations/<id> (cascading deletes)
+
+Each case runs --repeat times for p50/p95/mean latency, then once more under
+tracemalloc for its peak Python memory. Results go to a JSON file with the
+git commit and dataset size; --baseline compares against an earlier file
+and --max-regression fails the run if any p95 got slower by that factor.
+
+    python benchmarks/suite.py [--operations 10] [--channels 500] [--repeat 20]
+                               [--output benchmark_results.json] [--baseline old.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import compression  # noqa: E402
+import graph  # noqa: E402
+from classification import classify_channel  # noqa: E402
+from load_test import percentile  # noqa: E402
+from synthetic import create_db  # noqa: E402
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, repeat):
+    """Time `repeat` calls of fn, then one more under tracemalloc for the peak."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "runs": repeat,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "peak_mib": round(peak / 2 ** 20, 2),
+    }
+
+
+def cases(client, conn, read_ops, victim_ops):
+    """name -> zero-argument callable; reads rotate over read_ops, deletes consume the victims."""
+    def rotating(items):
+        state = {"n": 0}
+
+        def take():
+            state["n"] += 1
+            return items[state["n"] % len(items)]
+        return take
+
+    next_read = rotating(read_ops)
+
+    def get(url, headers=None):
+        def run():
+            server.response_cache.clear()
+            compression.cache.clear()
+            graph._cache.clear()
+            response = client.get(url.format(next_read()), headers=headers)
+            response.get_data()
+            assert response.status_code == 200, (url, response.status_code)
+        return run
+
+    channel_indicators = []
+    for channel_id, in conn.execute("SELECT id FROM channels WHERE operation_id = ? ORDER BY id LIMIT 50",
+                                    (read_ops[0],)).fetchall():
+        channel_indicators.append([dict(r) for r in conn.execute("""
+            SELECT t.group_type, t.category, t.subtype, i.weight
+            FROM indicators i
+            JOIN indicator_types t ON t.id = i.indicator_type_id
+            WHERE i.channel_id = ?
+        """, (channel_id,))])
+    next_channel = rotating(channel_indicators)
+
+    # Channels of the first half of the victims go one by one, the rest go with their operation
+    half = max(1, len(victim_ops) // 2)
+    victim_channels = iter([r[0] for r in conn.execute(
+        "SELECT id FROM channels WHERE operation_id IN (SELECT value FROM json_each(?)) ORDER BY id",
+        (json.dumps(victim_ops[:half]),))])
+    victim_operations = iter(victim_ops[half:])
+
+    def simulate(scenario):
+        def run():
+            response = client.post("/api/simulate", json=scenario)
+            response.get_data()
+            assert response.status_code == 200, ("/api/simulate", response.status_code)
+        return run
+
+    def delete(url, victims):
+        def run():
+            response = client.delete(url.format(next(victims)))
+            assert response.status_code == 204, (url, response.status_code)
+        return run
+
+    return {
+        "classify": get("/classify/{}"),
+        "operations_data": get("/api/operations_data/{}"),
+        "graph": get("/graph/{}"),
+        "bootstrap": get("/api/bootstrap/{}"),
+        "bootstrap_gzip": get("/api/bootstrap/{}", {"Accept-Encoding": "gzip"}),
+        "timeline": get("/timeline/{}?bucket=1d"),
+        "export_stix": get("/export_stix/{}"),
+        "craft_prompt": lambda: server.craft_prompt(next_read(), "Benchmark run; no analyst comments."),
+        "classify_channel": lambda: classify_channel(next_channel()),
+        "simulate_sweep": simulate({"sweep": {"State-Linked": list(range(50)), "State-Aligned": list(range(20))}}),
+        "delete_channel": delete("/channels/{}", victim_channels),
+        "delete_operation": delete("/operations/{}", victim_operations),
+    }
+
+
+def compare(results, baseline, max_regression=None):
+    """Print p50/p95 against the baseline; returns the cases whose p95 regressed past max_regression."""
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')})")
+    print(f"{'case':<18} {'p50':>16} {'p95':>16} {'peak':>16}")
+    regressed = []
+    for name, now in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            print(f"{name:<18} {'(new)':>16}")
+            continue
+        ratios = {key: now[key] / before[key] if before[key] else 1.0 for key in ("p50_ms", "p95_ms", "peak_mib")}
+        print(f"{name:<18} " + " ".join(f"{before[key]:>7.1f}->{ratios[key]:>5.2f}x" for key in ratios))
+        if max_regression and ratios["p95_ms"] > max_regression:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=10, help="operations read by the benchmarks")
+    parser.add_argument('--channels', type=int, default=500, help="channels per operation")
+    parser.add_argument('--indicators', type=int, default=10, help="average indicators per channel")
+    parser.add_argument('--links', type=int, default=2, help="average links per channel")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json', help="relative to the repository root")
+    parser.add_argument('--baseline', help="results file of an earlier run to compare with")
+    parser.add_argument('--max-regression', type=float, help="exit 1 if any p95 is this many times the baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Every delete run (including the traced one) needs a victim: channels from one half, operations the other
+        n_victims = 2 * (args.repeat + 1)
+        start = time.perf_counter()
+        conn, counts = create_db(os.path.join(tmp, 'suite.db'), args.operations + n_victims, args.channels,
+                                 args.indicators, args.links, args.seed)
+        conn.row_factory = sqlite3.Row
+        print(", ".join(f"{n} {table}" for table, n in counts.items())
+              + f" generated in {time.perf_counter() - start:.1f}s")
+        ops = [r[0] for r in conn.execute("SELECT id FROM operations ORDER BY id")]
+        read_ops, victim_ops = ops[:args.operations], ops[args.operations:]
+
+        client = server.app.test_client()
+        results = {}
+        print(f"{'case':<18} {'p50':>9} {'p95':>9} {'mean':>9} {'peak':>9}")
+        for name, run in cases(client, conn, read_ops, victim_ops).items():
+            # Keep the routes' progress prints ([STIX Export] ...) out of the table
+            with redirect_stdout(io.StringIO()):
+                result = results[name] = measure(run, args.repeat)
+            print(f"{name:<18} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms {result['mean_ms']:>7.1f}ms "
+                  f"{result['peak_mib']:>6.1f}MiB")
+        conn.close()
+        server.db.reset_pools()
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": {k: getattr(args, k) for k in ("operations", "channels", "indicators", "links", "repeat", "seed")},
+        "dataset": counts,
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print(f"warning: baseline was run with {baseline.get('params')}")
+        regressed = compare(results, baseline, args.max_regression)
+        if regressed:
+            print(f"p95 regressed more than {args.max_regression}x: {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
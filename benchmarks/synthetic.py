@@ -0,0 +1,176 @@
+"""
+Deterministic synthetic data for benchmarks and manual testing at scale.
+
+Fills a database with --operations operations of --channels channels each,
+about --indicators indicators per channel drawn from the seeded
+indicator_types (subtype, group, default weight; mostly the default
+confidence) and about --links links per channel within its operation. Some
+evidence names domains, IP addresses and wallets shared across operations,
+so search and the artifact index have something to find.
+
+The same arguments and --seed always produce the same rows, ids and
+timestamps. The database is created with init_db() and must not contain
+operations yet, unless --append is given; the classification state and the
+artifact index are rebuilt at the end.
+
+    python benchmarks/synthetic.py [--db fimi_ops.db] [--operations 20] [--channels 200]
+                                   [--indicators 10] [--links 2] [--seed 0]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app as server  # noqa: E402
+import artifacts  # noqa: E402
+import channel_classification  # noqa: E402
+import db  # noqa: E402
+from classification import invalidate_catalog  # noqa: E402
+
+EPOCH = datetime(2024, 1, 1)
+REGIONS = ["EU", "Baltics", "Western Balkans", "Sahel", "South Caucasus", "Latin America"]
+ACTORS = ["State media network", "Troll farm", "PR contractor", "Unknown"]
+PLATFORMS = [("Telegram", "https://t.me/{}"), ("X", "https://x.com/{}"), ("Facebook", "https://facebook.com/{}"),
+             ("YouTube", "https://youtube.com/@{}"), ("web", "https://{}.news-{}.example")]
+LINK_TYPES = ["reposting", "cross-referencing", "shared infrastructure", "same administrator", "amplification"]
+CONFIDENCES = ["High", "Medium", "Low"]
+WORDS = ("observed reposted coordinated narrative hosting registrar payment shared account article "
+         "cluster template timing amplification outlet mirror").split()
+
+
+def shared_pools(rnd, n_operations):
+    """Infrastructure reused across operations, sized so most values recur a few times."""
+    size = max(10, n_operations * 5)
+    domains = [f"{rnd.choice(WORDS)}-{n}.example" for n in range(size)]
+    ips = [f"185.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}" for _ in range(size)]
+    wallets = ["0x" + "".join(rnd.choice("0123456789abcdef") for _ in range(40)) for _ in range(size // 2)]
+    return domains, ips, wallets
+
+
+def evidence_text(rnd, subtype, pools):
+    domains, ips, wallets = pools
+    text = f"{subtype}: {' '.join(rnd.choices(WORDS, k=rnd.randint(4, 12)))}"
+    roll = rnd.random()
+    if roll < 0.15:
+        text += f"; {rnd.choice(domains)} resolves to {rnd.choice(ips)}"
+    elif roll < 0.2:
+        text += f"; donations to {rnd.choice(wallets)}"
+    return text
+
+
+def generate(conn, n_operations, n_channels, n_indicators, n_links, seed=0):
+    """Insert the synthetic rows in one transaction; returns the number of rows per table."""
+    rnd = random.Random(seed)
+    types = conn.execute("""
+        SELECT id, group_type, subtype, default_weight, default_confidence
+        FROM indicator_types ORDER BY id
+    """).fetchall()
+    if not types:
+        raise RuntimeError("indicator_types is empty; run init_db() first")
+    pools = shared_pools(rnd, n_operations)
+    next_op = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM operations").fetchone()[0]
+    next_channel = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM channels").fetchone()[0]
+
+    operations, channels, indicators, links = [], [], [], []
+    for o in range(n_operations):
+        op_id = next_op + o
+        created = EPOCH + timedelta(hours=op_id)
+        operations.append((op_id, f"Operation {op_id}", " ".join(rnd.choices(WORDS, k=20)), rnd.choice(ACTORS),
+                           rnd.choice(REGIONS), f"{created:%Y-%m}", f"{created:%Y-%m-%d %H:%M:%S}"))
+        op_channels = []
+        for _ in range(n_channels):
+            channel_id = next_channel
+            next_channel += 1
+            platform, url = rnd.choice(PLATFORMS)
+            handle = f"{rnd.choice(WORDS)}_{channel_id}"
+            channels.append((channel_id, op_id, f"@{handle}", platform, url.format(handle, op_id),
+                             " ".join(rnd.choices(WORDS, k=8))))
+            op_channels.append(channel_id)
+            for n in range(rnd.randint(0, n_indicators * 2)):
+                type_id, group, subtype, weight, confidence = rnd.choice(types)
+                if rnd.random() < 0.2:
+                    confidence = rnd.choice(CONFIDENCES)
+                indicators.append((channel_id, group, subtype, type_id, weight, confidence,
+                                   evidence_text(rnd, subtype, pools), rnd.choice(["OSINT", "CTI", "Platform"]),
+                                   f"{created + timedelta(days=rnd.randint(0, 180), minutes=n):%Y-%m-%d %H:%M:%S}"))
+        # A few hub channels attract a third of the links, like amplifier accounts do
+        hubs = op_channels[:max(1, len(op_channels) // 20)]
+        for _ in range(n_links * len(op_channels) if len(op_channels) > 1 else 0):
+            source = rnd.choice(op_channels)
+            target = rnd.choice(hubs if rnd.random() < 0.33 else op_channels)
+            if source != target:
+                links.append((op_id, source, target, rnd.choice(LINK_TYPES), rnd.choice(CONFIDENCES + [None]),
+                              " ".join(rnd.choices(WORDS, k=6))))
+
+    conn.executemany("""
+        INSERT INTO operations (id, name, description, suspected_actor, region, time_range, date_created)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, operations)
+    conn.executemany("INSERT INTO channels (id, operation_id, name, platform, url, notes) VALUES (?, ?, ?, ?, ?, ?)",
+                     channels)
+    conn.executemany("""
+        INSERT INTO indicators
+        (channel_id, type, name, indicator_type_id, weight, confidence, evidence, source_type, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, indicators)
+    conn.executemany("""
+        INSERT INTO channel_links (operation_id, from_channel_id, to_channel_id, link_type, confidence, evidence)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, links)
+    channel_classification.rebuild(conn)
+    artifacts.rebuild(conn)
+    conn.commit()
+    return {"operations": len(operations), "channels": len(channels),
+            "indicators": len(indicators), "links": len(links)}
+
+
+def create_db(path, n_operations, n_channels, n_indicators, n_links, seed=0, append=False, quiet=True):
+    """init_db() at `path` and fill it; returns (pooled connection, row counts)."""
+    db.reset_pools()
+    server.DB_FILE = path
+    invalidate_catalog()
+    if quiet:
+        with redirect_stdout(io.StringIO()):
+            server.init_db()
+    else:
+        server.init_db()
+    conn = db.acquire(path)
+    if not append and conn.execute("SELECT 1 FROM operations LIMIT 1").fetchone():
+        conn.close()
+        raise RuntimeError(f"{path} already has operations; use --append to add to it")
+    return conn, generate(conn, n_operations, n_channels, n_indicators, n_links, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=server.DB_FILE)
+    parser.add_argument('--operations', type=int, default=20)
+    parser.add_argument('--channels', type=int, default=200, help="channels per operation")
+    parser.add_argument('--indicators', type=int, default=10, help="average indicators per channel")
+    parser.add_argument('--links', type=int, default=2, help="average links per channel")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--append', action='store_true', help="add to a database that already has operations")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        conn, counts = create_db(args.db, args.operations, args.channels, args.indicators, args.links,
+                                 args.seed, args.append, quiet=False)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    conn.close()
+    print(f"{args.db}: " + ", ".join(f"{n} {table}" for table, n in counts.items())
+          + f" in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+Materialized per-channel classification state.
+
+The channel_classification table holds each channel's running score,
+confidence and group counts, signal bitmask and justification lines. The
+API routes update it in the same transaction as the indicator/channel
+change, so /classify is a single indexed read. rebuild() recomputes the
+table from the raw indicators and must always agree with the incremental
+state.
+
+channel_timeline holds the same aggregates as prefix sums over time: one
+row per channel and distinct indicator timestamp, with the running totals
+as of that moment. Timestamps are normalized with SQLite's datetime();
+indicators without a parseable one count from the start (at = ''). An
+indicator arriving in time order appends a row; a backdated one also adds
+its deltas to the channel's later rows. timeline.py serves it.
+
+    python channel_classification.py [--operation ID] [--check]
+"""
+
+import json
+
+from classification import (
+    CHANNEL_INDICATOR_COLUMNS, aggregate_channels, exposure_results, get_engine, justification_line
+)
+
+
+def channel_added(conn, channel_id, operation_id):
+    conn.execute(
+        "INSERT OR IGNORE INTO channel_classification (channel_id, operation_id) VALUES (?, ?)",
+        (channel_id, operation_id))
+
+
+def _deltas(group_type, weight, confidence):
+    return (weight,
+            confidence == 'High', confidence == 'Medium', confidence not in ('High', 'Medium'),
+            group_type == 'technical', group_type == 'behavioral')
+
+
+def indicator_added(conn, channel_id, group_type, name, weight, confidence, evidence, type_id=None,
+                    timestamp=None):
+    """Fold a new indicator in; `timestamp` is the value stored in its row."""
+    engine = get_engine(conn)
+    mask = engine.linked_mask(group_type, type_id, name)
+    deltas = _deltas(group_type, weight, confidence)
+    conn.execute("""
+        UPDATE channel_classification SET
+            score = score + ?,
+            high = high + ?,
+            medium = medium + ?,
+            low = low + ?,
+            technical = technical + ?,
+            behavioral = behavioral + ?,
+            flags = flags | ?,
+            justification = json_insert(justification, '$[#]', ?)
+        WHERE channel_id = ?
+    """, deltas + (mask, justification_line(name, confidence, evidence), channel_id))
+
+    # Start a row at this timestamp from the channel's state just before it, then add the
+    # indicator to that row and every later one (none, unless it is backdated)
+    at = {"channel_id": channel_id, "timestamp": timestamp}
+    conn.execute(f"""
+        INSERT OR IGNORE INTO channel_timeline
+        (channel_id, at, operation_id, score, high, medium, low, technical, behavioral, flags)
+        SELECT c.id, {TIMELINE_AT}, c.operation_id, COALESCE(t.score, 0), COALESCE(t.high, 0),
+               COALESCE(t.medium, 0), COALESCE(t.low, 0), COALESCE(t.technical, 0),
+               COALESCE(t.behavioral, 0), COALESCE(t.flags, 0)
+        FROM channels c
+        LEFT JOIN (
+            SELECT * FROM channel_timeline WHERE channel_id = :channel_id AND at < {TIMELINE_AT}
+            ORDER BY at DESC LIMIT 1
+        ) t ON t.channel_id = c.id
+        WHERE c.id = :channel_id
+    """, at)
+    conn.execute(f"""
+        UPDATE channel_timeline SET
+            score = score + :score,
+            high = high + :high,
+            medium = medium + :medium,
+            low = low + :low,
+            technical = technical + :technical,
+            behavioral = behavioral + :behavioral,
+            flags = flags | :flags
+        WHERE channel_id = :channel_id AND at >= {TIMELINE_AT}
+    """, dict(zip(TIMELINE_COLUMNS, deltas + (mask,)), **at))
+
+
+def indicator_removed(conn, indicator):
+    """Call after deleting `indicator` (a row of the indicators table)."""
+    engine = get_engine(conn)
+    channel_id = indicator['channel_id']
+
+    # Flags and justification cannot be subtracted, so refold the channel's remaining rows
+    flags = 0
+    justification = []
+    for group_type, type_id, name, conf, evidence in conn.execute(
+            "SELECT type, indicator_type_id, name, confidence, evidence FROM indicators WHERE channel_id = ? ORDER BY id",
+            (channel_id,)):
+        flags |= engine.linked_mask(group_type, type_id, name)
+        justification.append(justification_line(name, conf, evidence))
+
+    conn.execute("""
+        UPDATE channel_classification SET
+            score = score - ?,
+            high = high - ?,
+            medium = medium - ?,
+            low = low - ?,
+            technical = technical - ?,
+            behavioral = behavioral - ?,
+            flags = ?,
+            justification = ?
+        WHERE channel_id = ?
+    """, _deltas(indicator['type'], indicator['weight'], indicator['confidence']) + (
+        flags, json.dumps(justification, ensure_ascii=False),
+        channel_id))
+    rebuild_timeline(conn, channel_ids=[channel_id])
+
+
+def operation_removed(conn, operation_id):
+    conn.execute("DELETE FROM channel_classification WHERE operation_id = ?", (operation_id,))
+    conn.execute("DELETE FROM channel_timeline WHERE operation_id = ?", (operation_id,))
+
+
+def read_aggregates(conn, operation_id=None, channel_ids=None):
+    where, params = "WHERE cc.operation_id = ?", (operation_id,)
+    if channel_ids is not None:
+        where, params = "WHERE cc.channel_id IN (SELECT value FROM json_each(?))", (json.dumps(list(channel_ids)),)
+    rows = conn.execute(f"""
+        SELECT cc.channel_id, cc.operation_id, c.name, c.notes, cc.score, cc.high, cc.medium, cc.low,
+               cc.technical, cc.behavioral, cc.flags, cc.justification
+        FROM channel_classification cc
+        JOIN channels c ON c.id = cc.channel_id
+        {where}
+        ORDER BY cc.channel_id
+    """, params)
+
+    return [{
+        "channel_id": channel_id,
+        "operation_id": operation_id,
+        "channel_name": name,
+        "notes": notes,
+        "score": score,
+        "high": high,
+        "medium": medium,
+        "low": low,
+        "technical": technical,
+        "behavioral": behavioral,
+        "flags": flags,
+        "justification": json.loads(justification)
+    } for channel_id, operation_id, name, notes, score, high, medium, low, technical, behavioral, flags, justification
+        in rows]
+
+
+def read_operation(conn, operation_id):
+    """Return /classify results for an operation from the materialized table."""
+    return exposure_results(get_engine(conn), read_aggregates(conn, operation_id))
+
+
+def read_channels(conn, channel_ids):
+    """/classify results for just these channels, e.g. the ones a change touched."""
+    if not channel_ids:
+        return []
+    return exposure_results(get_engine(conn), read_aggregates(conn, channel_ids=channel_ids))
+
+
+def compute(conn, operation_id=None, channel_ids=None):
+    """Fold channel aggregates straight from the indicators table."""
+    where, params = "", ()
+    if operation_id is not None:
+        where, params = "WHERE c.operation_id = ?", (operation_id,)
+    elif channel_ids is not None:
+        where, params = "WHERE c.id IN (SELECT value FROM json_each(?))", (json.dumps(list(channel_ids)),)
+    rows = conn.execute(f"""
+        SELECT {CHANNEL_INDICATOR_COLUMNS}
+        FROM channels c
+        LEFT JOIN indicators i ON i.channel_id = c.id
+        {where}
+        ORDER BY c.id, i.id
+    """, params)
+    return aggregate_channels(rows, get_engine(conn))
+
+
+def _store(conn, aggregates):
+    conn.executemany("""
+        INSERT OR REPLACE INTO channel_classification
+        (channel_id, operation_id, score, high, medium, low, technical, behavioral, flags, justification)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(a["channel_id"], a["operation_id"], a["score"], a["high"], a["medium"], a["low"],
+           a["technical"], a["behavioral"], a["flags"],
+           json.dumps(a["justification"], ensure_ascii=False)) for a in aggregates])
+
+
+def rebuild(conn, operation_id=None):
+    """Recompute the table from scratch, for one operation or for all of them."""
+    aggregates = compute(conn, operation_id)
+    if operation_id is None:
+        conn.execute("DELETE FROM channel_classification")
+    else:
+        operation_removed(conn, operation_id)
+    _store(conn, aggregates)
+    rebuild_timeline(conn, operation_id)
+    return len(aggregates)
+
+
+def rebuild_channels(conn, channel_ids):
+    """Recompute the rows of specific channels, e.g. after a bulk import touched them."""
+    aggregates = compute(conn, channel_ids=channel_ids)
+    _store(conn, aggregates)
+    rebuild_timeline(conn, channel_ids=channel_ids)
+    return len(aggregates)
+
+
+# ------------------------
+# TIMELINE
+# ------------------------
+
+TIMELINE_COLUMNS = ("score", "high", "medium", "low", "technical", "behavioral", "flags")
+# Normalized timestamp of the indicator being added
+TIMELINE_AT = "COALESCE(datetime(:timestamp), '')"
+
+
+def compute_timeline(conn, operation_id=None, channel_ids=None):
+    """
+    Fold channel_timeline rows straight from the indicators table:
+    (channel_id, at, operation_id, *TIMELINE_COLUMNS), ordered by channel and time.
+    """
+    where, params = "", ()
+    if operation_id is not None:
+        where, params = "WHERE c.operation_id = ?", (operation_id,)
+    elif channel_ids is not None:
+        where, params = "WHERE c.id IN (SELECT value FROM json_each(?))", (json.dumps(list(channel_ids)),)
+    engine = get_engine(conn)
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(f"""
+        SELECT c.id, c.operation_id, COALESCE(datetime(i.timestamp), '') AS at,
+               i.type, i.indicator_type_id, i.name, i.weight, i.confidence
+        FROM channels c
+        JOIN indicators i ON i.channel_id = c.id
+        {where}
+        ORDER BY c.id, at, i.id
+    """, params)
+
+    rows = []
+    current = None
+    for channel_id, op_id, at, group_type, type_id, name, weight, confidence in cur:
+        if channel_id != current:
+            current, totals, flags = channel_id, [0] * 6, 0
+        totals = [t + d for t, d in zip(totals, _deltas(group_type, weight, confidence))]
+        flags |= engine.linked_mask(group_type, type_id, name)
+        row = (channel_id, at, op_id, *totals, flags)
+        # Indicators sharing a timestamp collapse into one row
+        if rows and rows[-1][0] == channel_id and rows[-1][1] == at:
+            rows[-1] = row
+        else:
+            rows.append(row)
+    return rows
+
+
+def rebuild_timeline(conn, operation_id=None, channel_ids=None):
+    """Recompute channel_timeline for one operation, specific channels, or everything."""
+    if operation_id is not None:
+        conn.execute("DELETE FROM channel_timeline WHERE operation_id = ?", (operation_id,))
+    elif channel_ids is not None:
+        conn.execute("DELETE FROM channel_timeline WHERE channel_id IN (SELECT value FROM json_each(?))",
+                     (json.dumps(list(channel_ids)),))
+    else:
+        conn.execute("DELETE FROM channel_timeline")
+    rows = compute_timeline(conn, operation_id, channel_ids)
+    conn.executemany(f"""
+        INSERT INTO channel_timeline (channel_id, at, operation_id, {", ".join(TIMELINE_COLUMNS)})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    return len(rows)
+
+
+def read_timeline(conn, operation_id=None):
+    cur = conn.cursor()
+    cur.row_factory = None
+    where, params = ("WHERE operation_id = ?", (operation_id,)) if operation_id is not None else ("", ())
+    cur.execute(f"""
+        SELECT channel_id, at, operation_id, {", ".join(TIMELINE_COLUMNS)} FROM channel_timeline
+        {where} ORDER BY channel_id, at
+    """, params)
+    return cur.fetchall()
+
+
+def check(conn, operation_id=None):
+    """Return the ids of operations whose stored state differs from a full recompute."""
+    expected = {}
+    for agg in compute(conn, operation_id):
+        expected.setdefault(agg["operation_id"], []).append(agg)
+    if operation_id is not None:
+        op_ids = [operation_id]
+    else:
+        op_ids = sorted(set(expected) | {r[0] for r in conn.execute(
+            "SELECT DISTINCT operation_id FROM channel_classification")})
+    stale = [op for op in op_ids if read_aggregates(conn, op) != expected.get(op, [])]
+
+    timeline = {}
+    for row in compute_timeline(conn, operation_id):
+        timeline.setdefault(row[2], []).append(row)
+    stored = {}
+    for row in read_timeline(conn, operation_id):
+        stored.setdefault(row[2], []).append(row)
+    stale.extend(op for op in sorted(set(timeline) | set(stored))
+                 if op not in stale and timeline.get(op) != stored.get(op))
+    return sorted(stale)
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the channel_classification table.")
+    parser.add_argument('--operation', type=int, help="limit to a single operation id")
+    parser.add_argument('--check', action='store_true', help="only compare stored state with a full recompute")
+    args = parser.parse_args()
+
+    conn = get_db()
+    if args.check:
+        stale = check(conn, args.operation)
+        print("channel_classification is consistent." if not stale else f"Stale operations: {stale}")
+    else:
+        count = rebuild(conn, args.operation)
+        conn.commit()
+        print(f"Rebuilt classification state for {count} channels.")
+    conn.close()
@@ -1,75 +1,416 @@
+import hashlib
 import json
-from collections import defaultdict
+import threading
+import time
 
-# Load config from file
-with open("config.json") as f:
-    CONFIG = json.load(f)
+import settings
 
-THRESHOLDS = CONFIG.get("classification_thresholds", {
+# ------------------------
+# RULE ENGINE
+# ------------------------
+
+# Signals a channel can carry, one bit each. Indicator-type categories map onto
+# these by name; "state media" comes from the channel notes. Append only: the
+# bit positions are persisted in channel_classification.flags.
+SIGNALS = (
+    "technical",
+    "behavioral",
+    "state media",
+    "public affiliation",
+    "financial records",
+    "shared infrastructure",
+    "systematic interaction",
+    "coordinated messaging",
+    "inauthentic media",
+    "historical consistency",
+)
+SIGNAL_BITS = {name: 1 << pos for pos, name in enumerate(SIGNALS)}
+
+DEFAULT_THRESHOLDS = {
     "State-Official": 100,
     "State-Controlled": 8,
     "State-Linked": 6,
     "State-Aligned": 3
-})
+}
 
-CONFIDENCE_RULES = CONFIG.get("confidence_logic", {
+DEFAULT_CONFIDENCE_RULES = {
     "high": {"min_tech": 1, "min_beh": 1},
     "medium": {"min_tech": 0, "min_beh": 2},
     "low": {"min_tech": 0, "min_beh": 1}
-})
-
-TECH_INDICATORS = {item["name"] for item in CONFIG.get("technical_indicators", [])}
-BEHAVIORAL_INDICATORS = {item["name"] for item in CONFIG.get("behavioral_indicators", [])}
+}
 
-# Short-circuit rules (hard-coded for now)
-SHORT_CIRCUITS = {
+DEFAULT_SHORT_CIRCUITS = {
     "public affiliation": "State-Official",
     "financial records": "State-Controlled"
 }
 
+UNCLASSIFIED = "Unclassified"
+
+
+def signal_mask(names):
+    mask = 0
+    for name in names:
+        if name.lower() not in SIGNAL_BITS:
+            raise ValueError(f"Unknown classification signal '{name}'")
+        mask |= SIGNAL_BITS[name.lower()]
+    return mask
+
+
+class RuleEngine:
+    """
+    Decision table compiled from config.json and the indicator_types catalog.
+
+    Rules are evaluated in order: short circuits, exposure_rules, then score
+    thresholds. Each rule is (category, all_mask, any_mask, min_high,
+    min_medium, min_score, short_circuit). The signal tests only depend on a
+    channel's mask, so the rules left after them are memoized per mask and
+    evaluating a channel is a handful of integer comparisons.
+    """
+
+    def __init__(self, config, catalog):
+        self.labels = config.get("category_labels", {})
+        # Identifies the decision table, e.g. in ETags of responses computed with it
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [config, [list(row) for row in catalog]], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+        rules = []
+        for name, category in config.get("short_circuits", DEFAULT_SHORT_CIRCUITS).items():
+            rules.append((category, 0, signal_mask([name]), 0, 0, 0, True))
+        for rule in config.get("exposure_rules", []):
+            rules.append((rule["category"],
+                          signal_mask(rule.get("all_signals", [])),
+                          signal_mask(rule.get("any_signals", [])),
+                          rule.get("min_high", 0),
+                          rule.get("min_medium", 0),
+                          rule.get("min_score", 0),
+                          False))
+        self.thresholds = dict(config.get("classification_thresholds", DEFAULT_THRESHOLDS))
+        for category, threshold in self.thresholds.items():
+            rules.append((category, 0, 0, 0, 0, threshold, False))
+        self.rules = rules
+        self._candidates = {}
+
+        confidence = config.get("confidence_logic", DEFAULT_CONFIDENCE_RULES)
+        self.high_tech = confidence["high"]["min_tech"]
+        self.high_beh = confidence["high"]["min_beh"]
+        self.medium_beh = confidence["medium"]["min_beh"]
+
+        # Indicator types keyed by id, plus the subtype names free-text indicators carry
+        self.type_masks = {}
+        self.type_weights = {}
+        self.type_ids = {}
+        for type_id, group_type, category, subtype, default_weight in catalog:
+            self.type_masks[type_id] = SIGNAL_BITS.get(group_type, 0) | SIGNAL_BITS.get(category.lower(), 0)
+            self.type_weights[type_id] = default_weight
+            self.type_ids.setdefault(subtype.lower(), type_id)
+        self._name_masks = {}
+
+    def type_id(self, name):
+        """The indicator_types id an indicator with this name links to (lowest id among equal subtypes)."""
+        return self.type_ids.get(name.lower()) if name else None
+
+    def linked_mask(self, group_type, type_id, name):
+        """Signal bits of an indicator row; by type id when it is linked, else from its name."""
+        mask = self.type_masks.get(type_id)
+        if mask is None:
+            return self.indicator_mask(group_type, name)
+        return mask | SIGNAL_BITS.get(group_type, 0)
+
+    def indicator_mask(self, group_type, name):
+        key = (group_type, name)
+        mask = self._name_masks.get(key)
+        if mask is None:
+            mask = SIGNAL_BITS.get(group_type, 0)
+            type_id = self.type_id(name)
+            if type_id is not None:
+                mask |= self.type_masks[type_id]
+            elif name:
+                # Indicators named after a category rather than a catalog subtype
+                mask |= SIGNAL_BITS.get(name.lower(), 0)
+            self._name_masks[key] = mask
+        return mask
+
+    def channel_mask(self, flags, notes):
+        if notes and "state media" in notes.lower():
+            flags |= SIGNAL_BITS["state media"]
+        return flags
+
+    def _rules_for(self, mask):
+        candidates = self._candidates.get(mask)
+        if candidates is None:
+            candidates = tuple(
+                (category, min_high, min_medium, min_score, short_circuit)
+                for category, all_mask, any_mask, min_high, min_medium, min_score, short_circuit in self.rules
+                if mask & all_mask == all_mask and (not any_mask or mask & any_mask))
+            self._candidates[mask] = candidates
+        return candidates
+
+    def fixed_category(self, mask, score, high, medium):
+        """Category from the rules before the score thresholds, or None if the channel falls through to them."""
+        candidates = self._rules_for(mask)
+        # Threshold rules test no signals, so they are always the last len(thresholds) candidates
+        for category, min_high, min_medium, min_score, _ in candidates[:len(candidates) - len(self.thresholds)]:
+            if high >= min_high and medium >= min_medium and score >= min_score:
+                return category
+        return None
+
+    def confidence(self, technical, behavioral):
+        if technical >= self.high_tech and behavioral >= self.high_beh:
+            return "High"
+        if behavioral >= self.medium_beh:
+            return "Medium"
+        return "Low"
+
+    def evaluate(self, mask, score, high, medium, technical, behavioral):
+        """Return (category, confidence, short_circuit) for one channel."""
+        for category, min_high, min_medium, min_score, short_circuit in self._rules_for(mask):
+            if high >= min_high and medium >= min_medium and score >= min_score:
+                if short_circuit:
+                    return category, "High", True
+                return category, self.confidence(technical, behavioral), False
+        return UNCLASSIFIED, self.confidence(technical, behavioral), False
+
+    def classify_batch(self, aggregates):
+        """Evaluate a list of channel aggregates (see aggregate_channels) in one call."""
+        evaluate = self.evaluate
+        channel_mask = self.channel_mask
+        return [evaluate(channel_mask(a["flags"], a.get("notes")), a["score"], a["high"], a["medium"],
+                         a["technical"], a["behavioral"]) for a in aggregates]
+
+    def label(self, category):
+        return self.labels.get(category, category)
+
+
+_engine_lock = threading.Lock()
+_engine_state = {"config": None, "types": None, "revision": None, "checked": None, "catalog": None, "engine": None}
+
+TYPE_COLUMNS = ("id", "group_type", "category", "subtype", "default_weight", "default_confidence")
+
+
+def invalidate_catalog():
+    """Drop the cached indicator types and the compiled engine after indicator_types changes."""
+    with _engine_lock:
+        _engine_state["types"] = None
+        _engine_state["catalog"] = None
+        _engine_state["engine"] = None
+
+
+def catalog_revision(conn):
+    """Bumped by triggers on every change to indicator_types, by any process (migration 12)."""
+    return conn.execute("SELECT revision FROM catalog_revision").fetchone()[0]
+
+
+def _check_catalog(conn):
+    """
+    Invalidate the cached catalog if indicator_types changed in another
+    process. Like config.json's mtime, the revision is read at most once
+    every settings.CHECK_INTERVAL seconds.
+    """
+    state = _engine_state
+    checked = state["checked"]
+    now = time.monotonic()
+    if state["types"] is None or (checked is not None and now - checked < settings.CHECK_INTERVAL):
+        return
+    state["checked"] = now
+    if catalog_revision(conn) != state["revision"]:
+        invalidate_catalog()
+
+
+def _load_types(conn):
+    # Read the revision first: a change in between leaves it stale and the next check reloads
+    _engine_state["revision"] = catalog_revision(conn)
+    _engine_state["checked"] = time.monotonic()
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(f"SELECT {', '.join(TYPE_COLUMNS)} FROM indicator_types ORDER BY id")
+    return [dict(zip(TYPE_COLUMNS, row)) for row in cur.fetchall()]
+
+
+def indicator_types(conn):
+    """The indicator_types rows as dicts, cached until invalidate_catalog() or a change in another process."""
+    _check_catalog(conn)
+    types = _engine_state["types"]
+    if types is None:
+        with _engine_lock:
+            if _engine_state["types"] is None:
+                _engine_state["types"] = _load_types(conn)
+            types = _engine_state["types"]
+    return types
+
+
+def link_new_type(conn, type_id, subtype):
+    """After adding an indicator type: link the unlinked indicators named after it; returns their channel ids."""
+    channel_ids = [r[0] for r in conn.execute(
+        "SELECT DISTINCT channel_id FROM indicators WHERE indicator_type_id IS NULL AND lower(name) = lower(?)",
+        (subtype,))]
+    if channel_ids:
+        conn.execute(
+            "UPDATE indicators SET indicator_type_id = ? WHERE indicator_type_id IS NULL AND lower(name) = lower(?)",
+            (type_id, subtype))
+    return channel_ids
+
+
+def relink_deleted_type(conn, type_id):
+    """
+    Before deleting an indicator type: move its indicators to a remaining
+    type with the same subtype, if any; returns their channel ids.
+    """
+    channel_ids = [r[0] for r in conn.execute(
+        "SELECT DISTINCT channel_id FROM indicators WHERE indicator_type_id = ?", (type_id,))]
+    if channel_ids:
+        conn.execute("""
+            UPDATE indicators SET indicator_type_id = (
+                SELECT MIN(t.id) FROM indicator_types t
+                WHERE t.id != :id AND lower(t.subtype) = (SELECT lower(subtype) FROM indicator_types WHERE id = :id)
+            )
+            WHERE indicator_type_id = :id
+        """, {"id": type_id})
+    return channel_ids
+
+
+def get_engine(conn=None):
+    """
+    Return the compiled engine, recompiling only when config.json changed on
+    disk or the catalog was invalidated or changed. Pass a connection so the
+    catalog can be checked and (re)loaded; without one the engine only knows
+    the indicator groups.
+    """
+    config = settings.get_config()
+    state = _engine_state
+    if conn is not None:
+        _check_catalog(conn)
+    if state["engine"] is not None and state["config"] is config and (state["catalog"] is not None or conn is None):
+        return state["engine"]
+
+    with _engine_lock:
+        if state["catalog"] is None and conn is not None:
+            if state["types"] is None:
+                state["types"] = _load_types(conn)
+            state["catalog"] = [(t["id"], t["group_type"], t["category"], t["subtype"], t["default_weight"])
+                                for t in state["types"]]
+            state["engine"] = None
+        if state["engine"] is None or state["config"] is not config:
+            state["engine"] = RuleEngine(config, state["catalog"] or [])
+            state["config"] = config
+        return state["engine"]
+
+
 def classify_channel(indicators):
-    score = 0
-    tech_count = 0
-    beh_count = 0
-    applied_short_circuit = None
+    engine = get_engine()
+    agg = {"score": 0, "high": 0, "medium": 0, "technical": 0, "behavioral": 0, "flags": 0}
 
     for ind in indicators:
-        name = ind["subtype"]
         weight = int(ind["weight"])
         group = ind["group_type"]
 
-        score += weight
-        if group == "technical":
-            tech_count += 1
-        elif group == "behavioral":
-            beh_count += 1
-
-        if name in SHORT_CIRCUITS:
-            applied_short_circuit = SHORT_CIRCUITS[name]
+        agg["score"] += weight
+        if group in ("technical", "behavioral"):
+            agg[group] += 1
+        agg["flags"] |= engine.indicator_mask(group, ind["subtype"])
+        if ind.get("category"):
+            agg["flags"] |= engine.indicator_mask(group, ind["category"])
 
-    if applied_short_circuit:
+    category, conf, short_circuit = engine.classify_batch([agg])[0]
+    if short_circuit:
         return {
-            "category": applied_short_circuit,
-            "confidence": "High",
-            "rationale": f"Short-circuit match on '{applied_short_circuit}' via indicator"
+            "category": category,
+            "confidence": conf,
+            "rationale": f"Short-circuit match on '{category}' via indicator"
         }
 
-    category = "Unclassified"
-    for cat, threshold in THRESHOLDS.items():
-        if score >= threshold:
-            category = cat
-            break
-
-    conf = "Low"
-    if tech_count >= CONFIDENCE_RULES["high"]["min_tech"] and beh_count >= CONFIDENCE_RULES["high"]["min_beh"]:
-        conf = "High"
-    elif beh_count >= CONFIDENCE_RULES["medium"]["min_beh"]:
-        conf = "Medium"
-
-    rationale = f"Score = {score}; {tech_count} tech, {beh_count} behavioral indicators"
+    rationale = f"Score = {agg['score']}; {agg['technical']} tech, {agg['behavioral']} behavioral indicators"
 
     return {
         "category": category,
         "confidence": conf,
         "rationale": rationale
     }
+
+
+# ------------------------
+# EXPOSURE MATRIX
+# ------------------------
+
+def justification_line(name, confidence, evidence):
+    return f"{name} ({confidence}) – {evidence}"
+
+
+# Columns expected by aggregate_channels(), ordered by channel id then indicator id
+CHANNEL_INDICATOR_COLUMNS = """
+    c.id, c.operation_id, c.name, c.notes,
+    i.id, i.type, i.indicator_type_id, i.name, i.weight, i.confidence, i.evidence
+"""
+
+
+def aggregate_channels(rows, engine):
+    """Fold channel/indicator join rows into one running aggregate per channel."""
+    type_masks = engine.type_masks
+    indicator_mask = engine.indicator_mask
+    channels = []
+    current = None
+    for ch_id, op_id, ch_name, notes, ind_id, group_type, type_id, name, weight, conf, evidence in rows:
+        if current is None or current["channel_id"] != ch_id:
+            current = {
+                "channel_id": ch_id,
+                "operation_id": op_id,
+                "channel_name": ch_name,
+                "notes": notes,
+                "score": 0,
+                "high": 0,
+                "medium": 0,
+                "low": 0,
+                "technical": 0,
+                "behavioral": 0,
+                "flags": 0,
+                "justification": []
+            }
+            channels.append(current)
+        if ind_id is None:
+            continue
+
+        current["score"] += weight
+        if conf == 'High':
+            current["high"] += 1
+        elif conf == 'Medium':
+            current["medium"] += 1
+        else:
+            current["low"] += 1
+        if group_type in ("technical", "behavioral"):
+            current[group_type] += 1
+        if type_id in type_masks:
+            current["flags"] |= type_masks[type_id] | SIGNAL_BITS.get(group_type, 0)
+        else:
+            current["flags"] |= indicator_mask(group_type, name)
+        current["justification"].append(justification_line(name, conf, evidence))
+
+    return channels
+
+
+def exposure_results(engine, aggregates):
+    """Shape channel aggregates as returned by /classify."""
+    return [{
+        "channel_id": agg["channel_id"],
+        "channel_name": agg["channel_name"],
+        "classification": engine.label(category),
+        "confidence_level": confidence,
+        "score": agg["score"],
+        "confidence": {
+            "High": agg["high"],
+            "Medium": agg["medium"],
+            "Low": agg["low"]
+        },
+        "justification": agg["justification"]
+    } for agg, (category, confidence, _) in zip(aggregates, engine.classify_batch(aggregates))]
+
+
+def classify_operation_channels(conn, operation_id):
+    """Classify every channel of an operation from a single ordered join."""
+    engine = get_engine(conn)
+    rows = conn.execute(f"""
+        SELECT {CHANNEL_INDICATOR_COLUMNS}
+        FROM channels c
+        LEFT JOIN indicators i ON i.channel_id = c.id
+        WHERE c.operation_id = ?
+        ORDER BY c.id, i.id
+    """, (operation_id,))
+    return exposure_results(engine, aggregate_channels(rows, engine))
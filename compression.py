@@ -0,0 +1,86 @@
+"""
+gzip/brotli response compression, negotiated by Accept-Encoding.
+
+app.py passes every response through compress(). JSON, text and HTML
+bodies of at least "min_bytes" are compressed with brotli when the client
+accepts it and the brotli package is installed, with gzip otherwise.
+Streamed responses (report tokens, event streams, the STIX export) and
+files pass through untouched. A body with an ETag is the same for
+everyone at that ETag, so its compressed form is kept in an LRU keyed by
+(ETag, encoding) and the ETag is made weak, as a different byte sequence
+now carries it. Fast levels are the default: a new revision pays for one
+compression of what can be a multi-megabyte bootstrap body, where gzip -6
+takes about four times as long as -1 for a third less output. Settings
+are in the "compression" section of config.json.
+"""
+
+import gzip
+
+import revisions
+import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_BYTES = 1024
+DEFAULT_GZIP_LEVEL = 1
+DEFAULT_BROTLI_QUALITY = 4
+DEFAULT_CACHE_BYTES = 16 * 2 ** 20
+
+COMPRESSIBLE = ("application/json", "text/")
+
+cache = revisions.ResponseCache(DEFAULT_CACHE_BYTES)
+
+
+def compression_config():
+    return settings.get_config().get("compression", {})
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None for a werkzeug Accept-Encoding header."""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def encode(body, encoding, config):
+    if encoding == "br":
+        return brotli.compress(body, quality=config.get("brotli_quality", DEFAULT_BROTLI_QUALITY))
+    return gzip.compress(body, compresslevel=config.get("gzip_level", DEFAULT_GZIP_LEVEL), mtime=0)
+
+
+def compress(response, accept_encodings):
+    """Compress `response` in place if it is worth it and the client accepts an encoding."""
+    config = compression_config()
+    if (not config.get("enabled", True) or response.direct_passthrough or response.is_streamed
+            or response.status_code != 200 or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE)):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < config.get("min_bytes", DEFAULT_MIN_BYTES):
+        return response
+
+    tag, weak = response.get_etag()
+    if tag:
+        cached = cache.get((tag, encoding))
+        if cached is None:
+            compressed = encode(body, encoding, config)
+            cache.put((tag, encoding), compressed)
+        else:
+            compressed = cached[0]
+        if not weak:
+            response.set_etag(tag, weak=True)
+    else:
+        compressed = encode(body, encoding, config)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,176 @@
+"""
+SQLite connection pool.
+
+Connections are opened once with WAL journaling and the pragmas from the
+"database" section of config.json, then reused. Calling close() on a pooled
+connection rolls back anything uncommitted and hands it back to the pool
+instead of closing it, so callers keep the usual get/close pattern. Every
+acquire() starts a new checkout; close(checkout) from a holder of an earlier
+checkout does nothing, so a stale reference cannot hand back a connection
+that someone else is using.
+
+Every statement run on a pooled connection, directly or through one of its
+cursors, is timed and counted by metrics.query_done().
+"""
+
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+import settings
+
+DEFAULT_POOL_SIZE = 8
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+    "temp_store": "memory",
+    "busy_timeout": 5000,
+    "foreign_keys": 1
+}
+
+ALLOWED_PRAGMAS = {"journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout",
+                   "foreign_keys", "wal_autocheckpoint"}
+PRAGMA_VALUE = re.compile(r"^-?\w+$")
+
+
+def database_config():
+    return settings.get_config().get("database", {})
+
+
+def pragma_statements(pragmas):
+    statements = []
+    for name, value in pragmas.items():
+        if name not in ALLOWED_PRAGMAS or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Unsupported pragma {name} = {value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times the statement up to its first row; rows fetched later are not included
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.query_done(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.query_done(sql, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            metrics.query_done(sql_script, time.perf_counter() - start)
+
+
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    checkout = 0
+    checked_out = False
+
+    # sqlite3.Connection.execute() and friends do not go through cursor(), so route them explicitly
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def close(self, checkout=None):
+        if self.pool is None:
+            return super().close()
+        # Already handed back, or handed back and acquired again by another caller
+        if not self.checked_out or checkout not in (None, self.checkout):
+            return
+        if self.in_transaction:
+            self.rollback()
+        self.pool.release(self, checkout)
+
+
+class ConnectionPool:
+    def __init__(self, path, size=None, pragmas=None):
+        config = database_config()
+        self.path = path
+        self.size = size if size is not None else config.get("pool_size", DEFAULT_POOL_SIZE)
+        self.pragmas = dict(DEFAULT_PRAGMAS, **config.get("pragmas", {}))
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for statement in pragma_statements(self.pragmas):
+            conn.execute(statement)
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        conn.checkout += 1
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn, checkout=None):
+        with self._lock:
+            if not conn.checked_out or checkout not in (None, conn.checkout):
+                return
+            conn.checked_out = False
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.pool = None
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.pool = None
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+
+def acquire(path):
+    return get_pool(path).acquire()
+
+
+def reset_pools():
+    """Close every idle connection, e.g. after changing pragmas in config.json."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
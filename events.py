@@ -0,0 +1,236 @@
+"""
+Live exposure-matrix updates, pushed per operation as Server-Sent Events.
+
+After a mutation commits, the route calls publish_delta() with the ids it
+touched. The changed channels, indicators and links and the touched
+channels' new classification are read back and published as one "delta"
+event on the operation's topic. GET /operations/<id>/events streams that
+topic, so the page applies the changes in place instead of re-fetching
+/classify and /api/operations_data. A "resync" event asks the client to
+reload everything (bulk imports, catalog changes, a client that fell
+behind), "deleted" means the operation is gone. Event ids are operation
+revisions (see revisions.py), so a reconnecting client whose Last-Event-ID
+is not the current revision gets a resync.
+
+Pub/sub is behind a small interface (subscribe, publish, has_subscribers)
+on preformatted SSE messages. LocalBroker fans out to the streams of this
+process. "broker" in the "events" section of config.json can name a
+"module:Class" instead, e.g. one backed by a broker on localhost that
+every worker process shares; it is constructed with that section on first
+use. Each open stream holds a server thread, so run with a threaded
+server.
+"""
+
+import importlib
+import json
+import queue
+import threading
+
+import channel_classification
+import revisions
+import settings
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_KEEPALIVE = 15
+RETRY_MS = 3000
+
+
+def events_config():
+    return settings.get_config().get("events", {})
+
+
+def topic(operation_id):
+    return f"operation:{operation_id}"
+
+
+def format_event(name, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {name}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+# ------------------------
+# BROKERS
+# ------------------------
+
+class Subscription:
+    """One stream's queue of SSE messages; a subscriber that falls behind gets a resync instead."""
+
+    def __init__(self, broker, topic, size):
+        self.broker, self.topic = broker, topic
+        self.queue = queue.Queue(size)
+        self.lost = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.lost = True
+
+    def get(self, timeout):
+        """The next message, or None after `timeout` seconds without one."""
+        if self.lost:
+            self.lost = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return format_event("resync", {"reason": "missed events"})
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process fan-out; only reaches streams served by the same worker process."""
+
+    def __init__(self, config=None):
+        self.queue_size = (config or {}).get("queue_size", DEFAULT_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def has_subscribers(self, topic):
+        return topic in self._subscribers
+
+    def publish(self, topic, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+
+_broker_lock = threading.Lock()
+_broker = None
+
+
+def load_broker(config):
+    name = config.get("broker", "local")
+    if name == "local":
+        return LocalBroker(config)
+    module, _, cls = name.partition(":")
+    return getattr(importlib.import_module(module), cls)(config)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = load_broker(events_config())
+    return _broker
+
+
+def set_broker(broker):
+    """Replace the broker, e.g. in a deployment script; streams already open keep the old one."""
+    global _broker
+    with _broker_lock:
+        _broker = broker
+
+
+# ------------------------
+# PUBLISHING
+# ------------------------
+
+def _rows(conn, table, column, ids):
+    if not ids:
+        return []
+    cur = conn.execute(f"SELECT * FROM {table} WHERE {column} IN (SELECT value FROM json_each(?)) ORDER BY id",
+                       (json.dumps(sorted(set(ids))),))
+    return [dict(row) for row in cur]
+
+
+def operation_of(conn, table, row_id):
+    """operation_id of a channel or channel_links row, or None; look it up before deleting the row."""
+    row = conn.execute(f"SELECT operation_id FROM {table} WHERE id = ?", (row_id,)).fetchone()
+    return row[0] if row else None
+
+
+def publish_delta(conn, operation_id, channels=(), indicators=(), links=(), reclassified=(),
+                  removed_channels=(), removed_indicators=(), removed_links=(), operation=False):
+    """
+    Publish what a committed mutation changed in an operation. channels,
+    indicators and links are ids of added rows, reclassified the channels
+    whose classification may have changed (added channels are included);
+    operation=True sends the operation row too.
+    """
+    broker = get_broker()
+    if operation_id is None or not broker.has_subscribers(topic(operation_id)):
+        return
+    revision = revisions.current(conn, operation_id)
+    if revision is None:
+        return
+    data = {
+        "operation_id": operation_id,
+        "revision": revision,
+        "operation": _rows(conn, "operations", "id", [operation_id])[0] if operation else None,
+        "channels": _rows(conn, "channels", "id", channels),
+        "indicators": _rows(conn, "indicators", "id", indicators),
+        "links": _rows(conn, "channel_links", "id", links),
+        "classification": channel_classification.read_channels(conn, set(reclassified) | set(channels)),
+        "removed_channels": list(removed_channels),
+        "removed_indicators": list(removed_indicators),
+        "removed_links": list(removed_links),
+    }
+    broker.publish(topic(operation_id), format_event("delta", data, revision))
+
+
+def publish_resync(conn, operation_ids=(), channel_ids=(), reason="changed"):
+    """Ask the clients of these operations (and of the operations owning channel_ids) to reload."""
+    broker = get_broker()
+    operation_ids = set(operation_ids)
+    if channel_ids:
+        operation_ids.update(r[0] for r in conn.execute(
+            "SELECT DISTINCT operation_id FROM channels WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(sorted(set(channel_ids))),)))
+    for operation_id in operation_ids:
+        if broker.has_subscribers(topic(operation_id)):
+            revision = revisions.current(conn, operation_id)
+            broker.publish(topic(operation_id), format_event("resync", {"reason": reason}, revision))
+
+
+def publish_deleted(operation_id):
+    get_broker().publish(topic(operation_id), format_event("deleted", {"operation_id": operation_id}))
+
+
+# ------------------------
+# STREAMING
+# ------------------------
+
+def stream(subscription, operation_id, revision, last_event_id=None):
+    """
+    SSE body for one client. Subscribe before reading `revision`, so no
+    event committed in between is lost; a client resuming from an older
+    event id is told to resync.
+    """
+    keepalive = events_config().get("keepalive_seconds", DEFAULT_KEEPALIVE)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        if last_event_id is not None and last_event_id != str(revision):
+            yield format_event("resync", {"reason": "reconnected"}, revision)
+        yield format_event("ready", {"operation_id": operation_id, "revision": revision}, revision)
+        while True:
+            message = subscription.get(keepalive)
+            # Comment lines keep proxies from timing out and let the server notice closed connections
+            yield message if message is not None else ": keepalive\n\n"
+            if message is not None and message.startswith("event: deleted"):
+                return
+    finally:
+        subscription.close()
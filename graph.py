@@ -0,0 +1,334 @@
+"""
+Coordination-graph analytics over channel_links.
+
+The links of an operation are loaded once into an undirected, weighted
+adjacency index (CSR arrays over channel positions) and cached per
+operation under its revision, so any link or channel change rebuilds it
+on next use. From the index:
+
+- connected components, and coordination clusters (components over
+  high-confidence links only), both by union-find
+- weighted degree and PageRank centrality rankings
+- signal propagation: channels within max_hops high-confidence links of a
+  channel classified into one of the seed categories (State-Official,
+  State-Controlled by default) are flagged with the seed they reach
+
+Link confidence maps to an edge weight through the "graph" section of
+config.json; repeated links between the same pair add up.
+
+    python graph.py OPERATION_ID [--top 20]
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import settings
+from classification import get_engine
+
+DEFAULT_CONFIDENCE_WEIGHTS = {"High": 3.0, "Medium": 2.0, "Low": 1.0}
+DEFAULT_UNRATED_WEIGHT = 1.0
+DEFAULT_HIGH_CONFIDENCE = ["High"]
+DEFAULT_SEED_CATEGORIES = ["State-Official", "State-Controlled"]
+DEFAULT_MAX_HOPS = 1
+DEFAULT_CACHE_SIZE = 16
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-9
+
+
+def graph_config():
+    return settings.get_config().get("graph", {})
+
+
+# ------------------------
+# UNION-FIND
+# ------------------------
+
+def union_find(n, src, dst):
+    """Component index (0..k-1, by first appearance) for each of n nodes joined by the edge lists."""
+    parent = list(range(n))
+    for a, b in zip(src, dst):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a != b:
+            if a < b:
+                parent[b] = a
+            else:
+                parent[a] = b
+
+    labels, roots = [0] * n, {}
+    for node in range(n):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        labels[node] = roots.setdefault(root, len(roots))
+    return np.array(labels, dtype=np.int64)
+
+
+def groups(labels, min_size=1):
+    """Members (as node positions) of each label with at least min_size nodes, largest first."""
+    order = np.argsort(labels, kind="stable")
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    members = [m for m in np.split(order, bounds) if len(m) >= min_size] if len(order) else []
+    members.sort(key=len, reverse=True)
+    return members
+
+
+# ------------------------
+# ADJACENCY INDEX
+# ------------------------
+
+class Graph:
+    """
+    Adjacency index of one operation. Channels are addressed by position in
+    `channel_ids` (sorted); every link appears in both directions in the CSR
+    arrays `indptr`, `indices`, `weights` and `strong` (high-confidence mask).
+    Derived results are computed on first use and kept with the index.
+    """
+
+    def __init__(self, channel_ids, names, src, dst, weights, strong, config=None):
+        self.config = config
+        self.channel_ids = channel_ids
+        self.names = names
+        self.n = len(channel_ids)
+        self.n_links = len(src)
+        self.src, self.dst, self.link_weights, self.link_strong = src, dst, weights, strong
+
+        heads = np.concatenate([src, dst])
+        tails = np.concatenate([dst, src])
+        order = np.argsort(heads, kind="stable")
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(heads, minlength=self.n))])
+        self.indices = tails[order]
+        self.weights = np.concatenate([weights, weights])[order]
+        self.strong = np.concatenate([strong, strong])[order]
+        self._derived = {}
+        self._lock = threading.RLock()  # derived results build on each other
+
+    def _cached(self, name, compute):
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = compute()
+            return self._derived[name]
+
+    def components(self):
+        return self._cached("components", lambda: union_find(self.n, self.src.tolist(), self.dst.tolist()))
+
+    def clusters(self):
+        """Components over high-confidence links only."""
+        return self._cached("clusters", lambda: union_find(
+            self.n, self.src[self.link_strong].tolist(), self.dst[self.link_strong].tolist()))
+
+    def positions(self):
+        """Channel id -> position."""
+        return self._cached("positions", lambda: {cid: pos for pos, cid in enumerate(self.channel_ids.tolist())})
+
+    def weighted_degree(self):
+        return self._cached("weighted_degree", lambda: (
+            np.bincount(self.src, self.link_weights, minlength=self.n)
+            + np.bincount(self.dst, self.link_weights, minlength=self.n)))
+
+    def pagerank(self):
+        return self._cached("pagerank", self._pagerank)
+
+    def _pagerank(self):
+        n = self.n
+        if n == 0:
+            return np.zeros(0)
+        degree = self.weighted_degree()
+        heads = np.repeat(np.arange(n), np.diff(self.indptr))
+        share = np.divide(self.weights, degree[heads], out=np.zeros(len(self.weights)), where=degree[heads] > 0)
+        dangling = degree == 0
+        rank = np.full(n, 1.0 / n)
+        for _ in range(PAGERANK_ITERATIONS):
+            spread = np.bincount(self.indices, rank[heads] * share, minlength=n)
+            new = (1 - PAGERANK_DAMPING) / n + PAGERANK_DAMPING * (spread + rank[dangling].sum() / n)
+            done = np.abs(new - rank).sum() < PAGERANK_TOLERANCE
+            rank = new
+            if done:
+                break
+        return rank
+
+    def propagate(self, seeds, max_hops):
+        """
+        Breadth-first search from the seed positions over high-confidence
+        links. Returns {position: (hops, seed position)} for every channel
+        reached within max_hops, seeds excluded.
+        """
+        reached = {seed: (0, seed) for seed in seeds}
+        frontier = list(seeds)
+        for hops in range(1, max_hops + 1):
+            next_frontier = []
+            for node in frontier:
+                start, end = self.indptr[node], self.indptr[node + 1]
+                for neighbour in self.indices[start:end][self.strong[start:end]].tolist():
+                    if neighbour not in reached:
+                        reached[neighbour] = (hops, reached[node][1])
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+            if not frontier:
+                break
+        return {node: hit for node, hit in reached.items() if hit[0] > 0}
+
+
+def load_graph(conn, operation_id):
+    config = graph_config()
+    confidence_weights = config.get("confidence_weights", DEFAULT_CONFIDENCE_WEIGHTS)
+    high = set(config.get("high_confidence", DEFAULT_HIGH_CONFIDENCE))
+    levels = list(confidence_weights)
+    weight_table = np.array([confidence_weights[c] for c in levels]
+                            + [config.get("unrated_weight", DEFAULT_UNRATED_WEIGHT)])
+    strong_table = np.array([c in high for c in levels] + [False])
+
+    cur = conn.cursor()
+    cur.row_factory = None
+    channels = cur.execute("SELECT id, name FROM channels WHERE operation_id = ? ORDER BY id",
+                           (operation_id,)).fetchall()
+    channel_ids = np.array([c[0] for c in channels], dtype=np.int64)
+    names = [c[1] for c in channels]
+
+    # Confidence is turned into a level index by SQLite so every column is an integer
+    case = " ".join("WHEN ? THEN %d" % n for n in range(len(levels)))
+    rows = cur.execute(f"""
+        SELECT from_channel_id, to_channel_id, CASE confidence {case} ELSE {len(levels)} END
+        FROM channel_links WHERE operation_id = ?
+    """, levels + [operation_id]).fetchall()
+    links = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=3 * len(rows)).reshape(-1, 3)
+
+    # Links whose channels belong to another operation are not part of this graph
+    src, dst = np.searchsorted(channel_ids, links[:, 0]), np.searchsorted(channel_ids, links[:, 1])
+    last = max(len(channel_ids) - 1, 0)
+    valid = (src < len(channel_ids)) & (dst < len(channel_ids))
+    if len(channel_ids):
+        valid &= (channel_ids[np.minimum(src, last)] == links[:, 0]) & (channel_ids[np.minimum(dst, last)] == links[:, 1])
+    codes = links[valid, 2]
+    return Graph(channel_ids, names, src[valid], dst[valid], weight_table[codes], strong_table[codes], config)
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_graph(conn, operation_id, revision):
+    """The operation's adjacency index, rebuilt when its revision or the graph config moved on."""
+    key = (operation_id, revision)
+    with _cache_lock:
+        graph = _cache.get(key)
+        if graph is not None and graph.config is graph_config():
+            _cache.move_to_end(key)
+            return graph
+
+    graph = load_graph(conn, operation_id)
+    with _cache_lock:
+        for stale in [k for k in _cache if k[0] == operation_id]:
+            del _cache[stale]
+        _cache[key] = graph
+        while len(_cache) > graph_config().get("cache_size", DEFAULT_CACHE_SIZE):
+            _cache.popitem(last=False)
+    return graph
+
+
+# ------------------------
+# ANALYSIS
+# ------------------------
+
+def propagate_signals(conn, operation_id, graph, engine, max_hops):
+    """
+    Classify the graph's channels from their materialized aggregates and
+    spread the seed categories; returns (seeds, seed labels, reached).
+    """
+    seed_categories = set(graph_config().get("seed_categories", DEFAULT_SEED_CATEGORIES))
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute("""
+        SELECT cc.channel_id, c.notes, cc.flags, cc.score, cc.high, cc.medium, cc.technical, cc.behavioral
+        FROM channel_classification cc
+        JOIN channels c ON c.id = cc.channel_id
+        WHERE cc.operation_id = ?
+    """, (operation_id,)).fetchall()
+    position = graph.positions()
+    seeds, seed_labels = [], {}
+    for channel_id, notes, flags, score, high, medium, technical, behavioral in rows:
+        category = engine.evaluate(engine.channel_mask(flags, notes), score, high, medium, technical, behavioral)[0]
+        if category in seed_categories and channel_id in position:
+            seeds.append(position[channel_id])
+            seed_labels[position[channel_id]] = engine.label(category)
+    return seeds, seed_labels, graph.propagate(seeds, max_hops)
+
+
+def analyze(conn, operation_id, revision, top=20):
+    """Components, clusters, rankings and propagated signals for /graph/<id>; lists are cut to `top`."""
+    config = graph_config()
+    graph = get_graph(conn, operation_id, revision)
+    ids, names = graph.channel_ids.tolist(), graph.names
+
+    def channel(pos):
+        return {"channel_id": ids[pos], "channel_name": names[pos]}
+
+    def summary(labels, min_size):
+        members = groups(labels, min_size)
+        return {
+            "count": len(members),
+            "sizes": [len(m) for m in members[:top]],
+            "members": [[ids[pos] for pos in sorted(m.tolist())] for m in members[:top]],
+        }
+
+    degree, rank = graph.weighted_degree(), graph.pagerank()
+    by_degree = np.argsort(-degree, kind="stable")[:top].tolist()
+    by_rank = np.argsort(-rank, kind="stable")[:top].tolist()
+
+    engine = get_engine(conn)
+    max_hops = config.get("max_hops", DEFAULT_MAX_HOPS)
+    seeds, seed_labels, reached = graph._cached(("propagated", engine.fingerprint, max_hops),
+                                                lambda: propagate_signals(conn, operation_id, graph, engine, max_hops))
+    propagated = sorted(reached.items(), key=lambda item: (item[1][0], -degree[item[0]], ids[item[0]]))
+
+    return {
+        "operation_id": operation_id,
+        "revision": revision,
+        "channels": graph.n,
+        "links": graph.n_links,
+        "components": summary(graph.components(), 1),
+        "coordination_clusters": summary(graph.clusters(), 2),
+        "rankings": {
+            "weighted_degree": [dict(channel(pos), weighted_degree=float(degree[pos])) for pos in by_degree],
+            "pagerank": [dict(channel(pos), pagerank=round(float(rank[pos]), 6)) for pos in by_rank],
+        },
+        "propagated": {
+            "seeds": len(seeds),
+            "count": len(propagated),
+            "channels": [dict(channel(pos), hops=hops, via=channel(seed), signal=seed_labels[seed])
+                         for pos, (hops, seed) in propagated[:top]],
+        },
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import time
+
+    import revisions
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Coordination-graph analytics for one operation.")
+    parser.add_argument('operation_id', type=int)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = get_db()
+    revision = revisions.current(conn, args.operation_id)
+    if revision is None:
+        raise SystemExit(f"Operation {args.operation_id} not found.")
+    start = time.perf_counter()
+    result = analyze(conn, args.operation_id, revision, args.top)
+    conn.close()
+    print(json.dumps(result, indent=2))
+    print(f"{result['links']} links analyzed in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,367 @@
+"""
+Bulk NDJSON import of operations, channels, indicators and links.
+
+One JSON object per line, with a "kind" field. Records may carry a client
+side "key" and refer to operations/channels created earlier in the same
+import by key, or to existing rows by id:
+
+    {"kind": "operation", "key": "op1", "name": "Op", "region": "EU"}
+    {"kind": "channel", "key": "c1", "operation": "op1", "name": "@acct", "platform": "X"}
+    {"kind": "indicator", "channel": "c1", "type": "technical", "name": "IP addresses",
+     "weight": 2, "confidence": "High", "evidence": "..."}
+    {"kind": "link", "operation": "op1", "from": "c1", "to_channel_id": 42, "link_type": "reposting"}
+
+Records are validated in Python and inserted with executemany, one
+transaction per chunk. Invalid records are reported with their line
+number and skipped; the rest of the import carries on.
+
+    python ingest.py FILE.ndjson [--chunk 5000]
+"""
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+import artifacts
+import channel_classification
+import revisions
+from classification import get_engine
+
+DEFAULT_CHUNK = 5000
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # as CURRENT_TIMESTAMP stores it
+
+KINDS = ("operation", "channel", "indicator", "link")
+GROUP_TYPES = ("technical", "behavioral")
+CONFIDENCES = ("High", "Medium", "Low")
+
+# SQLite INTEGER is a signed 64-bit value
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+class RecordError(ValueError):
+    pass
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    if value is None:
+        if required:
+            raise RecordError(f"missing '{field}'")
+        return None
+    if not isinstance(value, str):
+        raise RecordError(f"'{field}' must be a string")
+    return value
+
+
+def _integer(record, field):
+    value = record.get(field)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise RecordError(f"'{field}' must be an integer")
+    if not MIN_INTEGER <= value <= MAX_INTEGER:
+        raise RecordError(f"'{field}' is out of range")
+    return value
+
+
+def _key(record, field):
+    value = record.get(field)
+    if value is not None and (not isinstance(value, (str, int)) or isinstance(value, bool)):
+        raise RecordError(f"'{field}' must be a string or an integer")
+    return value
+
+
+def _timestamp(record, field):
+    """ISO 8601 text normalized to UTC in the CURRENT_TIMESTAMP format."""
+    value = _text(record, field)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise RecordError(f"'{field}' must be an ISO 8601 date or time") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(TIME_FORMAT)
+
+
+class Importer:
+    def __init__(self, conn, chunk_size=DEFAULT_CHUNK):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.keys = {"operation": {}, "channel": {}}
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.errors = []
+        self.lines = 0
+        # Committed changes, for callers that notify clients (see events.publish_resync)
+        self.operations = set()
+        self.channels = set()
+
+    # ------------------------
+    # INPUT
+    # ------------------------
+
+    def feed(self, lines):
+        """Import an iterable of NDJSON lines (str or bytes)."""
+        chunk = []
+        for line in lines:
+            self.lines += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict) or record.get("kind") not in KINDS:
+                    raise RecordError(f"'kind' must be one of {', '.join(KINDS)}")
+            except ValueError as e:
+                self.errors.append({"line": self.lines, "error": str(e)})
+                continue
+            chunk.append((self.lines, record))
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = []
+        if chunk:
+            self._flush(chunk)
+        return self
+
+    def summary(self):
+        return {
+            "lines": self.lines,
+            "inserted": {kind + "s": n for kind, n in self.counts.items()},
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "keys": self.keys,
+        }
+
+    # ------------------------
+    # REFERENCES
+    # ------------------------
+
+    def _ref(self, record, kind, key_field, id_field, staged, existing):
+        key = _key(record, key_field)
+        if key is not None:
+            if key in staged[kind]:
+                return staged[kind][key]
+            if key in self.keys[kind]:
+                return self.keys[kind][key]
+            raise RecordError(f"unknown {kind} key '{key}'")
+        if record.get(id_field) is None:
+            raise RecordError(f"missing '{key_field}' or '{id_field}'")
+        ref_id = _integer(record, id_field)
+        if ref_id not in existing:
+            raise RecordError(f"{kind} {ref_id} does not exist")
+        return ref_id
+
+    def _stage_key(self, record, kind, new_id, staged):
+        key = _key(record, "key")
+        if key is None:
+            return
+        if key in staged[kind] or key in self.keys[kind]:
+            raise RecordError(f"duplicate {kind} key '{key}'")
+        staged[kind][key] = new_id
+
+    def _existing(self, table, ids):
+        ids = [i for i in ids if isinstance(i, int)]
+        if not ids:
+            return set()
+        rows = self.conn.execute(
+            f"SELECT id FROM {table} WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+        return {r[0] for r in rows}
+
+    def _next_id(self, table):
+        row = self.conn.execute(f"""
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{table}'), 0),
+                       COALESCE((SELECT MAX(id) FROM {table}), 0))
+        """).fetchone()
+        return row[0] + 1
+
+    # ------------------------
+    # CHUNKS
+    # ------------------------
+
+    def _flush(self, chunk):
+        by_kind = {kind: [] for kind in KINDS}
+        for line_no, record in chunk:
+            by_kind[record["kind"]].append((line_no, record))
+
+        conn = self.conn
+        staged = {"operation": {}, "channel": {}}
+        errors = []
+        conn.commit()
+        # Hold the write lock for the whole chunk so pre-assigned ids cannot collide
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing_ops = self._existing("operations", [r.get("operation_id") for _, r in
+                                                         by_kind["channel"] + by_kind["link"]])
+            existing_channels = self._existing("channels", [r.get(f) for _, r in by_kind["indicator"] + by_kind["link"]
+                                                            for f in ("channel_id", "from_channel_id", "to_channel_id")])
+
+            def rows_for(kind, build):
+                rows, line_nos = [], []
+                for line_no, record in by_kind[kind]:
+                    try:
+                        rows.append(build(record))
+                        line_nos.append(line_no)
+                    except RecordError as e:
+                        errors.append({"line": line_no, "error": str(e)})
+                return rows, line_nos
+
+            next_op = self._next_id("operations")
+
+            def build_operation(record):
+                nonlocal next_op
+                row = (next_op, _text(record, "name", True), _text(record, "description"),
+                       _text(record, "suspected_actor"), _text(record, "region"), _text(record, "time_range"))
+                self._stage_key(record, "operation", next_op, staged)
+                next_op += 1
+                return row
+
+            next_channel = self._next_id("channels")
+            new_channels = {}
+
+            def build_channel(record):
+                nonlocal next_channel
+                op_id = self._ref(record, "operation", "operation", "operation_id", staged, existing_ops)
+                row = (next_channel, op_id, _text(record, "name", True), _text(record, "platform"),
+                       _text(record, "url"), _text(record, "notes"))
+                self._stage_key(record, "channel", next_channel, staged)
+                new_channels[next_channel] = op_id
+                next_channel += 1
+                return row
+
+            type_id = get_engine(conn).type_id
+
+            def build_indicator(record):
+                channel_id = self._ref(record, "channel", "channel", "channel_id", staged, existing_channels)
+                group_type = record.get("type")
+                if group_type not in GROUP_TYPES:
+                    raise RecordError(f"'type' must be one of {', '.join(GROUP_TYPES)}")
+                weight = _integer(record, "weight")
+                confidence = record.get("confidence")
+                if confidence is not None and confidence not in CONFIDENCES:
+                    raise RecordError(f"'confidence' must be one of {', '.join(CONFIDENCES)}")
+                name = _text(record, "name", True)
+                return (channel_id, group_type, name, type_id(name), weight, confidence,
+                        _text(record, "evidence"), _text(record, "source_type"), _timestamp(record, "timestamp"))
+
+            def build_link(record):
+                return (self._ref(record, "operation", "operation", "operation_id", staged, existing_ops),
+                        self._ref(record, "channel", "from", "from_channel_id", staged, existing_channels),
+                        self._ref(record, "channel", "to", "to_channel_id", staged, existing_channels),
+                        _text(record, "link_type", True), _text(record, "confidence"), _text(record, "evidence"))
+
+            def prune(kind, table, rows, count):
+                # Rows rejected by the row-by-row fallback must not leave usable keys behind
+                if count == len(rows):
+                    return
+                present = self._existing(table, [row[0] for row in rows])
+                for key, new_id in list(staged[kind].items()):
+                    if new_id not in present:
+                        del staged[kind][key]
+                        new_channels.pop(new_id, None)
+
+            # Dependency order, so records may reference keys defined anywhere earlier in the chunk
+            inserted = {}
+            op_rows, op_lines = rows_for("operation", build_operation)
+            inserted["operation"] = self._insert("""
+                INSERT INTO operations (id, name, description, suspected_actor, region, time_range)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, op_rows, op_lines, errors)
+            prune("operation", "operations", op_rows, inserted["operation"])
+
+            channel_rows, channel_lines = rows_for("channel", build_channel)
+            inserted["channel"] = self._insert("""
+                INSERT INTO channels (id, operation_id, name, platform, url, notes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, channel_rows, channel_lines, errors)
+            prune("channel", "channels", channel_rows, inserted["channel"])
+            indicator_rows, indicator_lines = rows_for("indicator", build_indicator)
+            last_indicator = conn.execute("SELECT COALESCE(MAX(id), 0) FROM indicators").fetchone()[0]
+            inserted["indicator"] = self._insert("""
+                INSERT INTO indicators
+                (channel_id, type, name, indicator_type_id, weight, confidence, evidence, source_type, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, indicator_rows, indicator_lines, errors)
+            link_rows, link_lines = rows_for("link", build_link)
+            inserted["link"] = self._insert("""
+                INSERT INTO channel_links (operation_id, from_channel_id, to_channel_id, link_type, confidence, evidence)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, link_rows, link_lines, errors)
+
+            artifacts.index_channels(conn, [(row[0], row[4]) for row in channel_rows if row[0] in new_channels])
+            # The write lock is held, so every indicator above the previous maximum is from this chunk
+            artifacts.index_indicators(conn, conn.execute(
+                "SELECT id, channel_id, evidence FROM indicators WHERE id > ? AND evidence IS NOT NULL",
+                (last_indicator,)).fetchall())
+
+            touched = set(new_channels) | {row[0] for row in indicator_rows}
+            if touched:
+                channel_classification.rebuild_channels(conn, touched)
+            # Existing operations that gained channels or links get a new revision (and ETag)
+            changed = {row[1] for row in channel_rows} | {row[0] for row in link_rows}
+            if changed:
+                revisions.bump_operations(conn, changed)
+            if indicator_rows:
+                revisions.bump_for_channels(conn, {row[0] for row in indicator_rows})
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            self.errors.extend({"line": line_no, "error": f"chunk rolled back: {e}"} for line_no, _ in chunk)
+            return
+
+        self.operations |= changed
+        self.channels |= touched
+        for kind in staged:
+            self.keys[kind].update(staged[kind])
+        for kind, n in inserted.items():
+            self.counts[kind] += n
+        self.errors.extend(errors)
+
+    def _insert(self, sql, rows, line_nos, errors):
+        """executemany the rows; if the batch fails, retry row by row to isolate the bad ones."""
+        if not rows:
+            return 0
+        conn = self.conn
+        conn.execute("SAVEPOINT bulk_batch")
+        try:
+            conn.executemany(sql, rows)
+            conn.execute("RELEASE bulk_batch")
+            return len(rows)
+        except (sqlite3.Error, OverflowError):
+            conn.execute("ROLLBACK TO bulk_batch")
+            conn.execute("RELEASE bulk_batch")
+
+        inserted = 0
+        for row, line_no in zip(rows, line_nos):
+            try:
+                conn.execute(sql, row)
+                inserted += 1
+            except (sqlite3.Error, OverflowError) as e:
+                errors.append({"line": line_no, "error": str(e)})
+        return inserted
+
+
+def import_lines(conn, lines, chunk_size=DEFAULT_CHUNK):
+    return Importer(conn, chunk_size).feed(lines).summary()
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Bulk import NDJSON records.")
+    parser.add_argument('file', help="NDJSON file, or - for stdin")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help="records per transaction")
+    args = parser.parse_args()
+
+    conn = get_db()
+    start = time.perf_counter()
+    with (sys.stdin if args.file == '-' else open(args.file)) as f:
+        summary = import_lines(conn, f, args.chunk)
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    rows = sum(summary["inserted"].values())
+    print(json.dumps({"inserted": summary["inserted"], "errors": len(summary["errors"]),
+                      "seconds": round(elapsed, 3), "rows_per_second": round(rows / max(elapsed, 1e-9))}, indent=2))
+    for error in summary["errors"][:20]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
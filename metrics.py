@@ -0,0 +1,226 @@
+"""
+Request, SQL and LLM instrumentation, exposed at /metrics.
+
+Every query on a pooled connection (db.py) goes through query_done(), which
+times it, adds it to the request being served on this thread and logs it
+if it takes longer than "slow_query_ms". app.py brackets each request with
+request_started()/request_finished() for the per-route latency and query
+histograms and the slow-request log; complete() reports LLM calls with
+llm_call().
+
+render() returns everything in the Prometheus text format (0.0.4). Log
+lines go to the "fimi" logger, on stderr or in "log_file"; settings are in
+the "metrics" section of config.json.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+import settings
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_SLOW_REQUEST_MS = 1000
+DEFAULT_LOG_LEVEL = "INFO"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+log = logging.getLogger("fimi")
+
+_lock = threading.Lock()
+_local = threading.local()
+_registry = []
+
+
+# ------------------------
+# METRIC TYPES
+# ------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, *label_values):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with _lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with _lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="' + (bound if bound == "+Inf" else _number(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Read when /metrics is scraped: fn returns a number, or {label values tuple: number}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.name, self.help, self.labels, self.fn = name, help, tuple(labels), fn
+        _registry.append(self)
+
+    def samples(self):
+        value = self.fn()
+        values = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        return [f"{self.name}{_labels(self.labels, key)} {_number(v)}" for key, v in values]
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+REQUESTS = Counter("fimi_http_requests_total", "HTTP requests by route, method and status.",
+                   ("route", "method", "status"))
+REQUEST_SECONDS = Histogram("fimi_http_request_duration_seconds", "Time to build the response, by route.",
+                            ("route", "method"))
+REQUEST_QUERIES = Histogram("fimi_http_request_db_queries", "SQL statements executed per request, by route.",
+                            ("route",), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_SECONDS = Counter("fimi_http_request_db_seconds_total", "Time spent in SQL statements, by route.",
+                                ("route",))
+QUERY_SECONDS = Histogram("fimi_db_query_duration_seconds", "Execution time of every SQL statement.")
+SLOW_QUERIES = Counter("fimi_db_slow_queries_total", "SQL statements slower than slow_query_ms.")
+LLM_REQUESTS = Counter("fimi_llm_requests_total", "LLM API calls by model and outcome.", ("model", "outcome"))
+LLM_SECONDS = Histogram("fimi_llm_request_duration_seconds", "LLM API call duration, by model.",
+                        ("model",), LLM_BUCKETS)
+LLM_TOKENS = Counter("fimi_llm_tokens_total", "LLM tokens by model and type (prompt or completion).",
+                     ("model", "type"))
+
+
+# ------------------------
+# SETTINGS AND LOGGING
+# ------------------------
+
+_settings = {"config": None, "slow_query": DEFAULT_SLOW_QUERY_MS / 1000,
+             "slow_request": DEFAULT_SLOW_REQUEST_MS / 1000, "section": None, "handler": None}
+
+
+def metrics_settings():
+    """(slow query seconds, slow request seconds) from config.json; logging is set up on first use."""
+    config = settings.get_config()
+    if config is not _settings["config"]:
+        _settings["config"] = config
+        section = config.get("metrics", {})
+        _settings["slow_query"] = section.get("slow_query_ms", DEFAULT_SLOW_QUERY_MS) / 1000
+        _settings["slow_request"] = section.get("slow_request_ms", DEFAULT_SLOW_REQUEST_MS) / 1000
+        if section != _settings["section"]:
+            _settings["section"] = section
+            configure_logging(section)
+    return _settings["slow_query"], _settings["slow_request"]
+
+
+def configure_logging(section):
+    handler = logging.FileHandler(section["log_file"]) if section.get("log_file") else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    with _lock:
+        if _settings["handler"] is not None:
+            log.removeHandler(_settings["handler"])
+            _settings["handler"].close()
+        _settings["handler"] = handler
+        log.addHandler(handler)
+    log.setLevel(section.get("log_level", DEFAULT_LOG_LEVEL))
+    log.propagate = False
+
+
+# ------------------------
+# RECORDING
+# ------------------------
+
+def query_done(sql, seconds):
+    QUERY_SECONDS.observe(seconds)
+    state = getattr(_local, "request", None)
+    if state is not None:
+        state[1] += 1
+        state[2] += seconds
+    if seconds >= metrics_settings()[0]:
+        SLOW_QUERIES.inc()
+        log.warning("Slow query (%.0f ms): %s", seconds * 1000, " ".join(sql.split())[:500])
+
+
+def request_started():
+    _local.request = [time.perf_counter(), 0, 0.0]  # start, queries, seconds in SQL
+
+
+def request_finished(route, method, status):
+    """Record the request; returns (elapsed seconds, queries, seconds in SQL)."""
+    state, _local.request = getattr(_local, "request", None), None
+    if state is None:
+        return 0.0, 0, 0.0
+    start, queries, query_seconds = state
+    elapsed = time.perf_counter() - start
+    REQUESTS.inc(1, route, method, status)
+    REQUEST_SECONDS.observe(elapsed, route, method)
+    REQUEST_QUERIES.observe(queries, route)
+    REQUEST_QUERY_SECONDS.inc(query_seconds, route)
+    if elapsed >= metrics_settings()[1]:
+        log.warning("Slow request %s %s -> %s: %.0f ms, %d queries (%.0f ms in SQL)",
+                    method, route, status, elapsed * 1000, queries, query_seconds * 1000)
+    return elapsed, queries, query_seconds
+
+
+def llm_call(model, seconds, prompt_tokens=0, completion_tokens=0, outcome="ok"):
+    LLM_REQUESTS.inc(1, model, outcome)
+    LLM_SECONDS.observe(seconds, model)
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, model, "prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, model, "completion")
+
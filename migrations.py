@@ -0,0 +1,379 @@
+"""
+Versioned schema migrations.
+
+schema.sql describes the original (version 0) tables. Every later change is
+an entry in MIGRATIONS; init_db() applies the ones above the database's
+PRAGMA user_version, each in its own transaction.
+
+    python migrations.py            # migrate and print the schema version
+    python migrations.py --explain  # check that hot queries use indexes
+"""
+
+import logging
+
+log = logging.getLogger("fimi")
+
+MIGRATIONS = [
+    (1, "drop orphaned rows, add indexes for operation/channel lookups", """
+        -- Rows left behind by earlier manual deletes would fail the foreign key check
+        DELETE FROM channels WHERE operation_id NOT IN (SELECT id FROM operations);
+        DELETE FROM indicators WHERE channel_id NOT IN (SELECT id FROM channels);
+        DELETE FROM channel_links WHERE operation_id NOT IN (SELECT id FROM operations)
+            OR from_channel_id NOT IN (SELECT id FROM channels)
+            OR to_channel_id NOT IN (SELECT id FROM channels);
+        DELETE FROM channel_classification WHERE channel_id NOT IN (SELECT id FROM channels);
+
+        CREATE INDEX IF NOT EXISTS idx_channels_operation ON channels(operation_id);
+        CREATE INDEX IF NOT EXISTS idx_indicators_channel ON indicators(channel_id);
+        CREATE INDEX IF NOT EXISTS idx_channel_links_operation ON channel_links(operation_id);
+        CREATE INDEX IF NOT EXISTS idx_channel_links_from ON channel_links(from_channel_id);
+        CREATE INDEX IF NOT EXISTS idx_channel_links_to ON channel_links(to_channel_id);
+    """),
+
+    (2, "rebuild foreign keys with ON DELETE CASCADE", """
+        CREATE TABLE channels_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            platform TEXT,
+            url TEXT,
+            notes TEXT,
+            FOREIGN KEY (operation_id) REFERENCES operations(id) ON DELETE CASCADE
+        );
+        INSERT INTO channels_new (id, operation_id, name, platform, url, notes)
+            SELECT id, operation_id, name, platform, url, notes FROM channels;
+        DROP TABLE channels;
+        ALTER TABLE channels_new RENAME TO channels;
+        CREATE INDEX idx_channels_operation ON channels(operation_id);
+
+        CREATE TABLE indicators_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            type TEXT CHECK(type IN ('technical', 'behavioral')) NOT NULL,
+            name TEXT NOT NULL,
+            weight INTEGER NOT NULL,
+            confidence TEXT CHECK(confidence IN ('High', 'Medium', 'Low')),
+            evidence TEXT,
+            source_type TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+        );
+        INSERT INTO indicators_new (id, channel_id, type, name, weight, confidence, evidence, source_type, timestamp)
+            SELECT id, channel_id, type, name, weight, confidence, evidence, source_type, timestamp FROM indicators;
+        DROP TABLE indicators;
+        ALTER TABLE indicators_new RENAME TO indicators;
+        CREATE INDEX idx_indicators_channel ON indicators(channel_id);
+
+        CREATE TABLE channel_links_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation_id INTEGER NOT NULL,
+            from_channel_id INTEGER NOT NULL,
+            to_channel_id INTEGER NOT NULL,
+            link_type TEXT,
+            confidence TEXT,
+            evidence TEXT,
+            FOREIGN KEY (operation_id) REFERENCES operations(id) ON DELETE CASCADE,
+            FOREIGN KEY (from_channel_id) REFERENCES channels(id) ON DELETE CASCADE,
+            FOREIGN KEY (to_channel_id) REFERENCES channels(id) ON DELETE CASCADE
+        );
+        INSERT INTO channel_links_new (id, operation_id, from_channel_id, to_channel_id, link_type, confidence, evidence)
+            SELECT id, operation_id, from_channel_id, to_channel_id, link_type, confidence, evidence FROM channel_links;
+        DROP TABLE channel_links;
+        ALTER TABLE channel_links_new RENAME TO channel_links;
+        CREATE INDEX idx_channel_links_operation ON channel_links(operation_id);
+        CREATE INDEX idx_channel_links_from ON channel_links(from_channel_id);
+        CREATE INDEX idx_channel_links_to ON channel_links(to_channel_id);
+
+        CREATE TABLE channel_classification_new (
+            channel_id INTEGER PRIMARY KEY,
+            operation_id INTEGER NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            high INTEGER NOT NULL DEFAULT 0,
+            medium INTEGER NOT NULL DEFAULT 0,
+            low INTEGER NOT NULL DEFAULT 0,
+            technical INTEGER NOT NULL DEFAULT 0,
+            behavioral INTEGER NOT NULL DEFAULT 0,
+            flags INTEGER NOT NULL DEFAULT 0,
+            justification TEXT NOT NULL DEFAULT '[]',
+            FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+        );
+        INSERT INTO channel_classification_new
+            SELECT channel_id, operation_id, score, high, medium, low, technical, behavioral, flags, justification
+            FROM channel_classification;
+        DROP TABLE channel_classification;
+        ALTER TABLE channel_classification_new RENAME TO channel_classification;
+        CREATE INDEX idx_channel_classification_operation ON channel_classification(operation_id, channel_id);
+    """),
+
+    (3, "add report_jobs for background LLM report generation", """
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation_id INTEGER NOT NULL,
+            analyst_comments TEXT,
+            model TEXT NOT NULL,
+            status TEXT CHECK(status IN ('queued', 'running', 'done', 'failed')) NOT NULL DEFAULT 'queued',
+            report TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (operation_id) REFERENCES operations(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs(status, id);
+        CREATE INDEX IF NOT EXISTS idx_report_jobs_operation ON report_jobs(operation_id);
+    """),
+
+    (4, "add report_cache and mark report jobs served from it", """
+        CREATE TABLE IF NOT EXISTS report_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            report TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_report_cache_last_used ON report_cache(last_used_at);
+        ALTER TABLE report_jobs ADD COLUMN cached INTEGER NOT NULL DEFAULT 0;
+    """),
+
+    (5, "group report jobs into batches and record their duration", """
+        ALTER TABLE report_jobs ADD COLUMN batch_id TEXT;
+        ALTER TABLE report_jobs ADD COLUMN duration_ms REAL;
+        CREATE INDEX IF NOT EXISTS idx_report_jobs_batch ON report_jobs(batch_id);
+    """),
+
+    (6, "index operations by creation date for keyset pagination", """
+        -- A NULL sort key would drop the row from every page after the first
+        UPDATE operations SET date_created = CURRENT_TIMESTAMP WHERE date_created IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_operations_created ON operations(date_created, id);
+    """),
+
+    (7, "add per-operation revision numbers for ETags", """
+        ALTER TABLE operations ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    """),
+
+    # One FTS row per searchable entity, rowid = id * 4 + kind (0 operation, 1 channel, 2 indicator), and
+    # scope = 'op<operation id>' so a search within one operation is an index lookup; see search.py
+    (8, "add the search_index full-text table, kept in sync by triggers", """
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            operation_id UNINDEXED, channel_id UNINDEXED, scope, name, content, url,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+
+        CREATE TRIGGER search_operations_insert AFTER INSERT ON operations BEGIN
+            INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            VALUES (new.id * 4, new.id, NULL, 'op' || new.id, new.name, new.description, NULL);
+        END;
+        CREATE TRIGGER search_operations_update AFTER UPDATE OF name, description ON operations BEGIN
+            UPDATE search_index SET name = new.name, content = new.description WHERE rowid = new.id * 4;
+        END;
+        CREATE TRIGGER search_operations_delete AFTER DELETE ON operations BEGIN
+            DELETE FROM search_index WHERE rowid = old.id * 4;
+        END;
+
+        CREATE TRIGGER search_channels_insert AFTER INSERT ON channels BEGIN
+            INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            VALUES (new.id * 4 + 1, new.operation_id, new.id, 'op' || new.operation_id, new.name, new.notes, new.url);
+        END;
+        CREATE TRIGGER search_channels_update AFTER UPDATE OF operation_id, name, notes, url ON channels BEGIN
+            UPDATE search_index SET operation_id = new.operation_id, scope = 'op' || new.operation_id,
+                name = new.name, content = new.notes, url = new.url
+            WHERE rowid = new.id * 4 + 1;
+        END;
+        CREATE TRIGGER search_channels_delete AFTER DELETE ON channels BEGIN
+            DELETE FROM search_index WHERE rowid = old.id * 4 + 1;
+        END;
+
+        CREATE TRIGGER search_indicators_insert AFTER INSERT ON indicators BEGIN
+            INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            SELECT new.id * 4 + 2, operation_id, new.channel_id, 'op' || operation_id, new.name, new.evidence, NULL
+            FROM channels WHERE id = new.channel_id;
+        END;
+        CREATE TRIGGER search_indicators_update AFTER UPDATE OF channel_id, name, evidence ON indicators BEGIN
+            UPDATE search_index SET operation_id = (SELECT operation_id FROM channels WHERE id = new.channel_id),
+                scope = 'op' || (SELECT operation_id FROM channels WHERE id = new.channel_id),
+                channel_id = new.channel_id, name = new.name, content = new.evidence
+            WHERE rowid = new.id * 4 + 2;
+        END;
+        CREATE TRIGGER search_indicators_delete AFTER DELETE ON indicators BEGIN
+            DELETE FROM search_index WHERE rowid = old.id * 4 + 2;
+        END;
+
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            SELECT id * 4, id, NULL, 'op' || id, name, description, NULL FROM operations;
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            SELECT id * 4 + 1, operation_id, id, 'op' || operation_id, name, notes, url FROM channels;
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+            SELECT i.id * 4 + 2, c.operation_id, i.channel_id, 'op' || c.operation_id, i.name, i.evidence, NULL
+            FROM indicators i JOIN channels c ON c.id = i.channel_id;
+    """),
+
+    # Extraction is done in Python, so init_db() fills the new tables with artifacts.rebuild()
+    (9, "add the artifacts inverted index for shared-infrastructure overlaps", """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL CHECK(kind IN ('domain', 'ip', 'wallet', 'asn')),
+            value TEXT NOT NULL,
+            UNIQUE (kind, value)
+        );
+        CREATE TABLE IF NOT EXISTS artifact_refs (
+            artifact_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            indicator_id INTEGER,
+            FOREIGN KEY (artifact_id) REFERENCES artifacts(id) ON DELETE CASCADE,
+            FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE,
+            FOREIGN KEY (indicator_id) REFERENCES indicators(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_artifact_refs_artifact ON artifact_refs(artifact_id, channel_id);
+        CREATE INDEX IF NOT EXISTS idx_artifact_refs_channel ON artifact_refs(channel_id, artifact_id);
+        CREATE INDEX IF NOT EXISTS idx_artifact_refs_indicator ON artifact_refs(indicator_id);
+    """),
+
+    # Names resolve like RuleEngine.type_id(): case-insensitively, to the lowest id among equal subtypes.
+    # Indicators named after a category (or anything else) stay unlinked and are classified by name.
+    (10, "link indicators to indicator_types by id", """
+        ALTER TABLE indicators ADD COLUMN indicator_type_id INTEGER
+            REFERENCES indicator_types(id) ON DELETE SET NULL;
+        UPDATE indicators SET indicator_type_id = (
+            SELECT MIN(t.id) FROM indicator_types t WHERE lower(t.subtype) = lower(indicators.name)
+        );
+        CREATE INDEX IF NOT EXISTS idx_indicators_type ON indicators(indicator_type_id);
+    """),
+
+    # Folded in Python, so init_db() fills it with channel_classification.rebuild_timeline()
+    (11, "add channel_timeline prefix sums of the classification aggregates over time", """
+        CREATE TABLE IF NOT EXISTS channel_timeline (
+            channel_id INTEGER NOT NULL,
+            at TEXT NOT NULL,
+            operation_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            high INTEGER NOT NULL,
+            medium INTEGER NOT NULL,
+            low INTEGER NOT NULL,
+            technical INTEGER NOT NULL,
+            behavioral INTEGER NOT NULL,
+            flags INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, at),
+            FOREIGN KEY (channel_id) REFERENCES channels(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_channel_timeline_operation ON channel_timeline(operation_id, at);
+    """),
+
+    # Every process caches the catalog; classification.get_engine() compares this to notice other writers
+    (12, "add a catalog revision bumped by triggers on indicator_types", """
+        CREATE TABLE IF NOT EXISTS catalog_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            revision INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO catalog_revision (id, revision) VALUES (1, 0);
+
+        CREATE TRIGGER catalog_revision_insert AFTER INSERT ON indicator_types BEGIN
+            UPDATE catalog_revision SET revision = revision + 1;
+        END;
+        CREATE TRIGGER catalog_revision_update AFTER UPDATE ON indicator_types BEGIN
+            UPDATE catalog_revision SET revision = revision + 1;
+        END;
+        CREATE TRIGGER catalog_revision_delete AFTER DELETE ON indicator_types BEGIN
+            UPDATE catalog_revision SET revision = revision + 1;
+        END;
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations; return the list of versions applied."""
+    applied = []
+    current = schema_version(conn)
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    if not pending:
+        return applied
+
+    conn.commit()
+    # Table rebuilds must not trigger cascades; foreign_keys is a no-op inside a transaction
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for version, description, script in pending:
+            try:
+                conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};")
+            except Exception:
+                conn.rollback()
+                raise
+            problems = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if problems:
+                conn.rollback()
+                raise RuntimeError(f"Migration {version} left dangling references: {[tuple(p) for p in problems[:5]]}")
+            conn.commit()
+            log.info("Applied migration %s: %s", version, description)
+            applied.append(version)
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    return applied
+
+
+# Hot queries and the index each one is expected to use
+QUERY_PLANS = [
+    ("SELECT * FROM channels WHERE operation_id = ?", "idx_channels_operation"),
+    ("SELECT * FROM indicators WHERE channel_id = ?", "idx_indicators_channel"),
+    ("SELECT * FROM channel_links WHERE operation_id = ?", "idx_channel_links_operation"),
+    ("SELECT * FROM channel_links WHERE from_channel_id = ? OR to_channel_id = ?", "idx_channel_links_from"),
+    ("SELECT * FROM channel_links WHERE from_channel_id = ? OR to_channel_id = ?", "idx_channel_links_to"),
+    ("SELECT * FROM channel_classification WHERE operation_id = ?", "idx_channel_classification_operation"),
+    ("SELECT id FROM report_jobs WHERE status = ? ORDER BY id", "idx_report_jobs_status"),
+    ("SELECT * FROM report_jobs WHERE batch_id = ?", "idx_report_jobs_batch"),
+    ("SELECT id FROM operations WHERE (date_created, id) < (?, ?) ORDER BY date_created DESC, id DESC",
+     "idx_operations_created"),
+    ("SELECT id FROM channels WHERE operation_id = ? AND id > ? ORDER BY id", "idx_channels_operation"),
+    ("""SELECT c.id, i.id FROM channels c LEFT JOIN indicators i ON i.channel_id = c.id
+        WHERE c.operation_id = ? ORDER BY c.id, i.id""", "idx_indicators_channel"),
+    ("SELECT id FROM indicators WHERE indicator_type_id = ?", "idx_indicators_type"),
+    ("SELECT artifact_id FROM artifact_refs WHERE channel_id = ?", "idx_artifact_refs_channel"),
+    ("SELECT channel_id FROM artifact_refs WHERE artifact_id IN (SELECT artifact_id FROM artifact_refs WHERE channel_id = ?)",
+     "idx_artifact_refs_artifact"),
+    ("SELECT channel_id, at FROM channel_timeline WHERE operation_id = ? AND at > ? AND at <= ? ORDER BY at",
+     "idx_channel_timeline_operation"),
+    ("UPDATE channel_timeline SET score = score + ? WHERE channel_id = ? AND at >= ?", "PRIMARY KEY"),
+]
+
+
+def explain(conn, sql):
+    params = (None,) * sql.count("?")
+    return " / ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def check_query_plans(conn):
+    """Return (sql, index, plan) for every hot query that does not use its index."""
+    failures = []
+    for sql, index in QUERY_PLANS:
+        plan = explain(conn, sql)
+        if index not in plan:
+            failures.append((" ".join(sql.split()), index, plan))
+    return failures
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Apply schema migrations.")
+    parser.add_argument('--explain', action='store_true', help="verify query plans use the expected indexes")
+    args = parser.parse_args()
+
+    conn = get_db()
+    migrate(conn)
+    print(f"Schema version {schema_version(conn)} (latest {LATEST_VERSION}).")
+    if args.explain:
+        failures = check_query_plans(conn)
+        for sql, index, plan in failures:
+            print(f"FAIL {sql}\n     expected {index}, got: {plan}")
+        print(f"{len(QUERY_PLANS) - len(failures)}/{len(QUERY_PLANS)} query plans use their index.")
+        conn.close()
+        sys.exit(1 if failures else 0)
+    conn.close()
@@ -0,0 +1,152 @@
+"""
+Keyset pagination, field projection and filters for the list endpoints.
+
+    GET /operations?limit=50&fields=id,name,region&region=Baltics
+    GET /operations?limit=50&cursor=<X-Next-Cursor of the previous page>
+
+A cursor encodes the sort key of the last row of the previous page, so the
+next page is an index range scan starting right after it rather than an
+OFFSET that reads and discards every earlier row. The cursor for the next
+page is returned in the X-Next-Cursor header; it is absent on the last page.
+"""
+
+import base64
+import binascii
+import json
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageError(ValueError):
+    """A malformed limit, cursor, field list or filter; reported to the client as 400."""
+
+
+class Listing:
+    """
+    One paginated view of a table. `columns` are the fields a client may
+    request, `order` the unique sort key the cursor is built from, and
+    `filters` maps query parameters to SQL conditions whose placeholders all
+    take the parameter's value.
+    """
+
+    def __init__(self, table, columns, order=("id",), descending=False, filters=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.order = tuple(order)
+        self.descending = descending
+        self.filters = filters or {}
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise PageError("Invalid cursor") from None
+    if (not isinstance(values, list) or len(values) != size
+            or not all(isinstance(v, (int, float, str)) for v in values)):
+        raise PageError("Invalid cursor")
+    return values
+
+
+def parse_fields(listing, value):
+    if not value:
+        return listing.columns
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in listing.columns]
+    if unknown or not fields:
+        raise PageError(f"Unknown fields {unknown}; available: {', '.join(listing.columns)}")
+    return fields
+
+
+def parse_limit(value):
+    if value is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PageError("limit must be an integer") from None
+    if limit < 1:
+        raise PageError("limit must be positive")
+    return min(limit, MAX_LIMIT)
+
+
+def fetch_page(conn, listing, args, where=None, params=()):
+    """
+    Return (items, next_cursor) for the page described by the request `args`
+    (limit, cursor, fields and the listing's filters). `where` and `params`
+    add a fixed condition, e.g. the parent operation.
+    """
+    fields = parse_fields(listing, args.get("fields"))
+    limit = parse_limit(args.get("limit"))
+
+    conditions, values = ([where], list(params)) if where else ([], [])
+    for name, condition in listing.filters.items():
+        value = args.get(name)
+        if value is not None and value != "":
+            conditions.append(condition)
+            values.extend([value] * condition.count("?"))
+
+    cursor = args.get("cursor")
+    if cursor:
+        key = decode_cursor(cursor, len(listing.order))
+        comparison = "<" if listing.descending else ">"
+        if len(key) == 1:
+            conditions.append(f"{listing.order[0]} {comparison} ?")
+        else:
+            conditions.append(f"({', '.join(listing.order)}) {comparison} ({', '.join('?' * len(key))})")
+        values.extend(key)
+
+    # The sort key is always selected so the next cursor can be built, even if not requested
+    selected = fields + tuple(c for c in listing.order if c not in fields)
+    direction = " DESC" if listing.descending else ""
+    sql = (f"SELECT {', '.join(selected)} FROM {listing.table}"
+           + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+           + f" ORDER BY {', '.join(c + direction for c in listing.order)} LIMIT ?")
+
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(sql, values + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        positions = [selected.index(c) for c in listing.order]
+        next_cursor = encode_cursor([rows[-1][p] for p in positions])
+    n = len(fields)
+    return [dict(zip(fields, row[:n])) for row in rows], next_cursor
+
+
+# ------------------------
+# LISTINGS
+# ------------------------
+
+OPERATION_COLUMNS = ("id", "name", "description", "suspected_actor", "region", "time_range", "date_created",
+                     "revision")
+OPERATION_FILTERS = {
+    "region": "region = ?",
+    "suspected_actor": "suspected_actor = ?",
+    "created_after": "date_created >= ?",
+    "created_before": "date_created < ?",
+}
+
+# Newest first, as the operation dropdown has always listed them
+OPERATIONS_BY_DATE = Listing("operations", OPERATION_COLUMNS, order=("date_created", "id"), descending=True,
+                             filters=OPERATION_FILTERS)
+OPERATIONS_BY_ID = Listing("operations", OPERATION_COLUMNS, filters=OPERATION_FILTERS)
+
+CHANNELS = Listing("channels", ("id", "operation_id", "name", "platform", "url", "notes"),
+                   filters={"platform": "platform = ?"})
+
+LINKS = Listing("channel_links",
+                ("id", "operation_id", "from_channel_id", "to_channel_id", "link_type", "confidence", "evidence"),
+                filters={
+                    "link_type": "link_type = ?",
+                    "confidence": "confidence = ?",
+                    "channel_id": "(from_channel_id = ? OR to_channel_id = ?)",
+                })
@@ -0,0 +1,246 @@
+"""
+Token-budgeted prompt building for LLM reports.
+
+An operation is loaded with a single join and rendered channel by channel.
+If the whole prompt fits the budget the model gets one request, as before.
+Otherwise channels are packed into chunks that each fit, every chunk is
+summarized in parallel (map), and a final call writes the report from the
+chunk summaries (reduce), condensing the summaries first if even they do
+not fit. Budgets come from the "prompt" section of config.json; token
+counts are estimated from character counts.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+
+DEFAULT_MAX_PROMPT_TOKENS = 12000
+DEFAULT_CHARS_PER_TOKEN = 4
+DEFAULT_SUMMARY_TOKENS = 800
+DEFAULT_MAX_PARALLEL = 4
+
+SYSTEM_MESSAGE = """
+You are an expert in disinformation analysis and threat operations.
+Based on the information provided, generate a detailed report focusing on:
+1. Identifying the state actor involved.
+2. Analyzing the channels, including their relevance and connection to the suspected actor.
+3. Weighing the behavioral and technical indicators (mentioning their confidence levels - high, medium, low).
+4. Providing actionable recommendations for further steps (e.g., countermeasures).
+Focus on attribution and evidence. Provide specific recommendations based on the indicators' confidence and relevance to the suspected state actor.
+"""
+
+SUMMARY_MESSAGE = """
+You are an expert in disinformation analysis and threat operations.
+You are given one part of the channels of a larger operation. Summarize, for each channel, the evidence linking it
+to the suspected actor: the strongest technical and behavioral indicators with their confidence levels, and any
+connections between channels. Be factual and concise; a later step will merge the summaries into a full report.
+"""
+
+CONDENSE_MESSAGE = """
+You are an expert in disinformation analysis and threat operations.
+Merge the following partial summaries of one operation into a single shorter summary. Keep every channel name,
+the strongest indicators with their confidence levels and any attribution evidence.
+"""
+
+
+def prompt_config():
+    return settings.get_config().get("prompt", {})
+
+
+def estimate_tokens(text):
+    return len(text) // prompt_config().get("chars_per_token", DEFAULT_CHARS_PER_TOKEN) + 1
+
+
+# ------------------------
+# LOADING
+# ------------------------
+
+def load_operation(conn, operation_id):
+    """
+    Return (operation, channels), or None if the operation does not exist.
+    Each channel carries its indicators as (type, name, confidence, weight,
+    evidence, source_type) tuples.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None  # plain tuples; sqlite3.Row costs more than the query on large operations
+    rows = cur.execute("""
+        SELECT o.name, o.description, o.suspected_actor, o.region, o.time_range,
+               c.id, c.name, c.platform, c.url, c.notes,
+               i.id, i.type, i.name, i.confidence, i.weight, i.evidence, i.source_type
+        FROM operations o
+        LEFT JOIN channels c ON c.operation_id = o.id
+        LEFT JOIN indicators i ON i.channel_id = c.id
+        WHERE o.id = ?
+        ORDER BY c.id, i.id
+    """, (operation_id,)).fetchall()
+    if not rows:
+        return None
+
+    op = dict(zip(("name", "description", "suspected_actor", "region", "time_range"), rows[0][:5]))
+    channels = []
+    for row in rows:
+        channel_id = row[5]
+        if channel_id is None:
+            continue
+        if not channels or channels[-1]["id"] != channel_id:
+            channels.append({"id": channel_id, "name": row[6], "platform": row[7], "url": row[8],
+                             "notes": row[9], "indicators": []})
+        if row[10] is not None:
+            channels[-1]["indicators"].append(row[11:])
+    return op, channels
+
+
+# ------------------------
+# RENDERING
+# ------------------------
+
+def overview_text(op, analyst_comments):
+    return "\n".join([
+        "**Operation Overview**:",
+        f"- Operation Name: {op['name']}",
+        f"- Description: {op['description']}",
+        f"- Suspected Actor: {op['suspected_actor']}",
+        f"- Region: {op['region']}",
+        f"- Time Range: {op['time_range']}",
+        "",
+        f"**Analyst Comments**: {analyst_comments}",
+    ])
+
+
+def channel_lines(ch):
+    """The channel header and one entry per indicator, as separate pieces so long channels can be split."""
+    header = "\n".join([
+        f"- Channel: {ch['name']} ({ch['platform']})",
+        f"- URL: {ch['url']}",
+        f"- Notes: {ch['notes']}",
+        "Indicators:",
+    ])
+    entries = []
+    for group_type, name, confidence, weight, evidence, source_type in ch["indicators"]:
+        entry = (f"  - [{group_type}] {name} (Confidence: {confidence}, Weight: {weight})\n"
+                 f"    Evidence: {evidence}")
+        if source_type:
+            entry += f"\n    Source: {source_type}"
+        entries.append(entry)
+    return header, entries
+
+
+def render_channels(channels):
+    """Render every channel once; returns (header, entries, block) per channel."""
+    rendered = []
+    for ch in channels:
+        header, entries = channel_lines(ch)
+        rendered.append((header, entries, "\n".join([header] + entries)))
+    return rendered
+
+
+def chunk_channels(rendered, budget):
+    """Pack rendered channels into text chunks of at most `budget` estimated tokens."""
+    chunks, current, used = [], [], 0
+
+    def close():
+        nonlocal current, used
+        if current:
+            chunks.append("\n\n".join(current))
+        current, used = [], 0
+
+    for header, entries, block in rendered:
+        cost = estimate_tokens(block)
+        if cost <= budget:
+            if used + cost > budget:
+                close()
+            current.append(block)
+            used += cost
+            continue
+
+        # A channel that alone exceeds the budget is split across chunks, repeating its header
+        close()
+        part, part_cost = [header], estimate_tokens(header)
+        for entry in entries:
+            entry_cost = estimate_tokens(entry)
+            if part_cost + entry_cost > budget and len(part) > 1:
+                chunks.append("\n".join(part))
+                part, part_cost = [header + " (continued)"], estimate_tokens(header)
+            part.append(entry)
+            part_cost += entry_cost
+        current, used = ["\n".join(part)], part_cost
+    close()
+    return chunks
+
+
+def build_plan(op, channels, analyst_comments):
+    """
+    Return {"messages": [...]} when the operation fits one request, otherwise
+    {"overview": ..., "map": [messages, ...]} with one summary request per chunk.
+    """
+    config = prompt_config()
+    budget = config.get("max_prompt_tokens", DEFAULT_MAX_PROMPT_TOKENS)
+    overview = overview_text(op, analyst_comments)
+
+    rendered = render_channels(channels)
+    body = "\n\n".join(block for _, _, block in rendered)
+    prompt = "\n\n".join([overview, "**Channels and Indicators**:", body])
+    if estimate_tokens(SYSTEM_MESSAGE) + estimate_tokens(prompt) <= budget:
+        return {"messages": [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": prompt}]}
+
+    chunk_budget = budget - estimate_tokens(SUMMARY_MESSAGE) - estimate_tokens(overview) - 50
+    chunks = chunk_channels(rendered, max(chunk_budget, 500))
+    return {
+        "overview": overview,
+        "map": [[{"role": "system", "content": SUMMARY_MESSAGE},
+                 {"role": "user", "content": "\n\n".join([
+                     overview, f"**Channels and Indicators (part {n} of {len(chunks)})**:", chunk])}]
+                for n, chunk in enumerate(chunks, 1)]
+    }
+
+
+def synthesis_messages(overview, summaries):
+    parts = [overview, "**Channel Summaries**:"]
+    parts.extend(f"### Part {n}\n{summary}" for n, summary in enumerate(summaries, 1))
+    return [{"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": "\n\n".join(parts)}]
+
+
+# ------------------------
+# EXECUTION
+# ------------------------
+
+def run_plan(plan, complete, on_token=None):
+    """
+    Produce the report for a plan from build_plan. complete(messages,
+    max_tokens=None, on_token=None) performs one chat completion and returns
+    its text; only the final call is streamed to on_token.
+    """
+    if "messages" in plan:
+        return complete(plan["messages"], on_token=on_token)
+
+    config = prompt_config()
+    budget = config.get("max_prompt_tokens", DEFAULT_MAX_PROMPT_TOKENS)
+    summary_tokens = config.get("summary_tokens", DEFAULT_SUMMARY_TOKENS)
+    parallel = config.get("max_parallel", DEFAULT_MAX_PARALLEL)
+
+    def summarize_all(requests):
+        with ThreadPoolExecutor(max_workers=min(parallel, len(requests))) as pool:
+            return list(pool.map(lambda messages: complete(messages, max_tokens=summary_tokens), requests))
+
+    summaries = summarize_all(plan["map"])
+    messages = synthesis_messages(plan["overview"], summaries)
+
+    # Condense groups of summaries until the synthesis request fits
+    while estimate_tokens(messages[1]["content"]) > budget and len(summaries) > 1:
+        group_budget = budget - estimate_tokens(CONDENSE_MESSAGE)
+        groups, current, used = [], [], 0
+        for summary in summaries:
+            cost = estimate_tokens(summary)
+            if current and used + cost > group_budget:
+                groups.append(current)
+                current, used = [], 0
+            current.append(summary)
+            used += cost
+        groups.append(current)
+        if len(groups) == len(summaries):
+            break
+        summaries = summarize_all([[{"role": "system", "content": CONDENSE_MESSAGE},
+                                    {"role": "user", "content": "\n\n".join(group)}] for group in groups])
+        messages = synthesis_messages(plan["overview"], summaries)
+
+    return complete(messages, on_token=on_token)
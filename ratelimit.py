@@ -0,0 +1,119 @@
+"""
+Client-side rate limiting and retries for calls to the model API.
+
+Every completion goes through call(): it waits for room in the
+requests-per-minute and tokens-per-minute budgets from the "reports"
+section of config.json, then retries transient failures with exponential
+backoff and jitter, honouring Retry-After when the server sends one.
+Limits are per process.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+
+import settings
+
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_RETRY_BACKOFF = 1.0
+MAX_RETRY_DELAY = 60
+
+log = logging.getLogger("fimi")
+
+
+class RateLimiter:
+    """
+    Sliding one-minute window over recent requests and their estimated
+    tokens. A request counts against the window from the moment it is
+    admitted until a minute after it completes, so however long it took to
+    reach the server, no 60 second span there ever exceeds either limit. A
+    limit of None or 0 disables that check.
+    """
+
+    WINDOW = 60.0
+
+    def __init__(self, rpm=None, tpm=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._sent = []  # [completed_at or inf while in flight, tokens]
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """Block until one request of `tokens` estimated tokens fits both limits; pass the result to release()."""
+        # A request larger than the whole budget waits for an empty window instead of forever
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._sent = [entry for entry in self._sent if entry[0] > now - self.WINDOW]
+                entries = sorted(self._sent)
+                wait = 0.0
+                if self.rpm and len(entries) >= self.rpm:
+                    wait = entries[len(entries) - self.rpm][0] + self.WINDOW - now
+                if self.tpm:
+                    # Wait until enough of the oldest requests have left the window
+                    excess = sum(used for _, used in entries) + tokens - self.tpm
+                    for stamp, used in entries:
+                        if excess <= 0:
+                            break
+                        excess -= used
+                        wait = max(wait, stamp + self.WINDOW - now)
+                if wait <= 0:
+                    entry = [math.inf, tokens]
+                    self._sent.append(entry)
+                    return entry
+            time.sleep(min(wait, 1.0))
+
+    def release(self, entry):
+        with self._lock:
+            entry[0] = time.monotonic()
+
+
+_state = {"limits": None, "limiter": None}
+_state_lock = threading.Lock()
+
+
+def get_limiter():
+    """The process-wide limiter, rebuilt when the configured limits change."""
+    config = settings.get_config().get("reports", {})
+    limits = (config.get("requests_per_minute"), config.get("tokens_per_minute"))
+    with _state_lock:
+        if _state["limits"] != limits:
+            _state["limits"] = limits
+            _state["limiter"] = RateLimiter(*limits)
+        return _state["limiter"]
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(value), MAX_RETRY_DELAY) if value else None
+    except ValueError:
+        return None
+
+
+def call(fn, tokens, retry_on):
+    """Run fn() within the rate limits, retrying exceptions of the `retry_on` types."""
+    config = settings.get_config().get("reports", {})
+    max_retries = config.get("max_retries", DEFAULT_MAX_RETRIES)
+    backoff = config.get("retry_backoff", DEFAULT_RETRY_BACKOFF)
+    limiter = get_limiter()
+
+    for attempt in range(max_retries + 1):
+        slot = limiter.acquire(tokens)
+        try:
+            return fn()
+        except retry_on as e:
+            error = e
+        finally:
+            limiter.release(slot)
+
+        if attempt == max_retries:
+            raise error
+        delay = retry_after(error) or min(backoff * 2 ** attempt * (1 + random.random()), MAX_RETRY_DELAY)
+        log.warning("LLM request failed (%s), retry %d/%d in %.1fs", error.__class__.__name__, attempt + 1,
+                    max_retries, delay)
+        time.sleep(delay)
@@ -0,0 +1,103 @@
+"""
+Content-addressed cache of generated reports.
+
+The key is a SHA-256 over the exact requests craft_prompt plans to send to
+the model (see prompts.build_plan) plus the model name, so any change to
+the operation's data, the analyst comments, the prompt wording or the token
+budget is a miss by construction and nothing needs to be invalidated
+explicitly. Entries live in the report_cache table and are
+evicted by age and, least recently used first, by total size; limits come
+from the "report_cache" section of config.json.
+
+    python report_cache.py [--evict] [--clear]
+"""
+
+import hashlib
+import json
+import time
+
+import settings
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def cache_config():
+    return settings.get_config().get("report_cache", {})
+
+
+def enabled():
+    return cache_config().get("enabled", True)
+
+
+def cache_key(plan, model):
+    payload = json.dumps({"model": model, "plan": plan}, sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _max_age_seconds():
+    return cache_config().get("max_age_days", DEFAULT_MAX_AGE_DAYS) * 86400
+
+
+def get(conn, key):
+    """Return the cached row (report, model, created_at, hits) or None; counts the hit."""
+    row = conn.execute("SELECT * FROM report_cache WHERE key = ? AND created_at >= ?",
+                       (key, time.time() - _max_age_seconds())).fetchone()
+    if row is None:
+        return None
+    conn.execute("UPDATE report_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?", (time.time(), key))
+    return row
+
+
+def put(conn, key, model, report):
+    now = time.time()
+    data = report.encode("utf-8")
+    conn.execute("""
+        INSERT OR REPLACE INTO report_cache (key, model, report, size, created_at, last_used_at, hits)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    """, (key, model, report, len(data), now, now))
+    evict(conn)
+
+
+def evict(conn):
+    """Drop expired entries, then least recently used ones until under max_bytes; return rows removed."""
+    removed = conn.execute("DELETE FROM report_cache WHERE created_at < ?",
+                           (time.time() - _max_age_seconds(),)).rowcount
+    max_bytes = cache_config().get("max_bytes", DEFAULT_MAX_BYTES)
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM report_cache").fetchone()[0]
+    if total <= max_bytes:
+        return removed
+
+    doomed = []
+    for key, size in conn.execute("SELECT key, size FROM report_cache ORDER BY last_used_at"):
+        if total <= max_bytes:
+            break
+        doomed.append((key,))
+        total -= size
+    conn.executemany("DELETE FROM report_cache WHERE key = ?", doomed)
+    return removed + len(doomed)
+
+
+def stats(conn):
+    row = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM report_cache").fetchone()
+    return {"entries": row[0], "bytes": row[1], "hits": row[2]}
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Inspect or trim the report cache.")
+    parser.add_argument('--evict', action='store_true', help="apply the age and size limits now")
+    parser.add_argument('--clear', action='store_true', help="remove every entry")
+    args = parser.parse_args()
+
+    conn = get_db()
+    if args.clear:
+        conn.execute("DELETE FROM report_cache")
+    elif args.evict:
+        print(f"Evicted {evict(conn)} entries.")
+    conn.commit()
+    print(json.dumps(stats(conn)))
+    conn.close()
@@ -0,0 +1,238 @@
+"""
+Background LLM report jobs.
+
+POST /generate_report/<id> only inserts a row into report_jobs and hands the
+job id to a bounded thread pool, so a slow model call never ties up a Flask
+worker. The pool size caps how many requests run against BASE_URL at once
+and max_pending caps the backlog; both, and the per-request timeout, come
+from the "reports" section of config.json. Tokens of running jobs are kept in memory so GET
+/reports/<job_id>?stream=1 can follow them live; the finished report and
+any error end up in the table.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 50
+DEFAULT_TIMEOUT = 120
+
+log = logging.getLogger("fimi")
+
+
+class QueueFull(Exception):
+    pass
+
+
+def reports_config():
+    return settings.get_config().get("reports", {})
+
+
+class Progress:
+    """Tokens received so far for a running job."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.cond = threading.Condition()
+
+    def append(self, text):
+        with self.cond:
+            self.chunks.append(text)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def text(self):
+        with self.cond:
+            return "".join(self.chunks)
+
+    def follow(self, timeout=None):
+        """Yield chunks as they arrive, starting from the first one, until the job ends."""
+        sent = 0
+        while True:
+            with self.cond:
+                while sent == len(self.chunks) and not self.done:
+                    if not self.cond.wait(timeout):
+                        return
+                chunks = self.chunks[sent:]
+                done = self.done
+            sent += len(chunks)
+            if chunks:
+                yield "".join(chunks)
+            if done:
+                return
+
+
+class JobQueue:
+    def __init__(self, connect, generate, workers=None, max_pending=None):
+        """
+        connect() returns a database connection; generate(operation_id,
+        analyst_comments, model, on_token) returns the report text or raises.
+        """
+        config = reports_config()
+        self.connect = connect
+        self.generate = generate
+        self.workers = workers or config.get("workers", DEFAULT_WORKERS)
+        self.max_pending = max_pending or config.get("max_pending", DEFAULT_MAX_PENDING)
+        self._executor = None
+        self._live = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Create the pool and pick up jobs a previous process left unfinished."""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report")
+        conn = self.connect()
+        conn.execute("UPDATE report_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        conn.commit()
+        leftover = [r[0] for r in conn.execute("SELECT id FROM report_jobs WHERE status = 'queued' ORDER BY id")]
+        conn.close()
+        for job_id in leftover:
+            self._dispatch(job_id)
+
+    def _track(self, job_id):
+        with self._lock:
+            self._live[job_id] = Progress()
+
+    def _dispatch(self, job_id):
+        if job_id not in self._live:
+            self._track(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def pending(self):
+        with self._lock:
+            return len(self._live)
+
+    def add_listener(self, fn):
+        """Call fn(job_id) from the worker thread whenever a job finishes."""
+        self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        self._listeners.remove(fn)
+
+    # ------------------------
+    # API
+    # ------------------------
+
+    def reserve(self, count):
+        """Raise QueueFull unless `count` more jobs fit the backlog."""
+        if self.pending() + count > self.max_pending:
+            raise QueueFull(f"{self.pending()} report jobs already pending, at most {self.max_pending}")
+
+    def submit(self, operation_id, analyst_comments, model, batch_id=None):
+        self._start()
+        self.reserve(1)
+        conn = self.connect()
+        cur = conn.execute(
+            "INSERT INTO report_jobs (operation_id, analyst_comments, model, batch_id) VALUES (?, ?, ?, ?)",
+            (operation_id, analyst_comments, model, batch_id))
+        job_id = cur.lastrowid
+        # Track before committing so a client polling the new id never misses its tokens
+        self._track(job_id)
+        conn.commit()
+        conn.close()
+        self._dispatch(job_id)
+        return job_id
+
+    def record_cached(self, operation_id, analyst_comments, model, report, batch_id=None):
+        """Store a job that was answered from the report cache and never hits the pool."""
+        conn = self.connect()
+        cur = conn.execute("""
+            INSERT INTO report_jobs (operation_id, analyst_comments, model, status, report, cached, batch_id,
+                                     started_at, finished_at, duration_ms)
+            VALUES (?, ?, ?, 'done', ?, 1, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 0)
+        """, (operation_id, analyst_comments, model, report, batch_id))
+        job_id = cur.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+
+    def get(self, job_id):
+        conn = self.connect()
+        row = conn.execute("SELECT * FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        progress = self._live.get(job_id)
+        if progress is not None and job["status"] == "running":
+            job["partial"] = progress.text()
+        return job
+
+    def follow(self, job_id, timeout=None):
+        """Yield report text as it is generated; finished jobs yield their stored report."""
+        progress = self._live.get(job_id)
+        if progress is not None:
+            yield from progress.follow(timeout)
+            return
+        job = self.get(job_id)
+        if job and job["report"]:
+            yield job["report"]
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job finishes (used by CLIs and benchmarks); return the job row."""
+        for _ in self.follow(job_id, timeout):
+            pass
+        return self.get(job_id)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    # ------------------------
+    # WORKER
+    # ------------------------
+
+    def _run(self, job_id):
+        progress = self._live[job_id]
+        conn = self.connect()
+        job = conn.execute("SELECT * FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] != "queued":
+            conn.close()
+            self._finish(job_id, progress)
+            return
+        conn.execute("UPDATE report_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?",
+                     (job_id,))
+        conn.commit()
+        # Don't hold a pooled connection for the length of the model call
+        conn.close()
+
+        start = time.perf_counter()
+        try:
+            report = self.generate(job["operation_id"], job["analyst_comments"], job["model"], progress.append)
+            status, error = "done", None
+        except Exception as e:
+            log.error("Report job %s failed: %s", job_id, e)
+            report, status, error = None, "failed", str(e)
+
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        conn = self.connect()
+        conn.execute("""
+            UPDATE report_jobs SET status = ?, report = ?, error = ?, finished_at = CURRENT_TIMESTAMP, duration_ms = ?
+            WHERE id = ?
+        """, (status, report, error, duration_ms, job_id))
+        conn.commit()
+        conn.close()
+
+        self._finish(job_id, progress)
+
+    def _finish(self, job_id, progress):
+        progress.finish()
+        with self._lock:
+            self._live.pop(job_id, None)
+        for listener in list(self._listeners):
+            listener(job_id)
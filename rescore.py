@@ -0,0 +1,236 @@
+"""
+Offline rescoring of every channel after catalog weights or config.json
+thresholds change.
+
+Indicators are loaded as integer columns (channel index, weight, group
+code, confidence code, signal mask), per-channel aggregates are computed
+with segmented NumPy reductions, the compiled rule table is applied to all
+channels at once and the aggregates are written back to
+channel_classification with bulk updates. Changed indicator weights also
+change channel_timeline, which is then refolded. The rescored operations'
+revisions are bumped in the same transaction, so cached responses and
+ETags from before the rescore go stale.
+
+    python rescore.py [--operation ID] [--catalog-weights] [--dry-run]
+"""
+
+import time
+from collections import Counter
+
+import numpy as np
+
+import channel_classification
+import revisions
+from classification import UNCLASSIFIED, SIGNAL_BITS, get_engine
+
+FETCH_CHUNK = 100_000
+
+TECHNICAL, BEHAVIORAL = 0, 1
+HIGH, MEDIUM, LOW = 0, 1, 2
+
+
+def _load_type_table(conn, engine):
+    """
+    Resolve every distinct (type, indicator_type_id) pair once, into a temp
+    table SQLite can join on. Unlinked indicators (no type id) are resolved
+    by name, so their rows carry the name; linked ones have name = ''.
+    """
+    pairs = conn.execute("""
+        SELECT DISTINCT type, indicator_type_id, CASE WHEN indicator_type_id IS NULL THEN name ELSE '' END
+        FROM indicators
+    """).fetchall()
+    conn.execute("DROP TABLE IF EXISTS temp.rescore_types")
+    conn.execute("""
+        CREATE TEMP TABLE rescore_types (
+            type TEXT, type_id INTEGER, name TEXT, mask INTEGER,
+            PRIMARY KEY (type, type_id, name)
+        )
+    """)
+    conn.executemany("INSERT INTO temp.rescore_types VALUES (?, ?, ?, ?)",
+                     [(group_type, type_id, name, engine.linked_mask(group_type, type_id, name))
+                      for group_type, type_id, name in pairs])
+
+
+def apply_catalog_weights(conn, operation_id=None):
+    """Copy indicator_types.default_weight onto every indicator linked to a type."""
+    scope, params = "", ()
+    if operation_id is not None:
+        scope = "AND channel_id IN (SELECT id FROM channels WHERE operation_id = ?)"
+        params = (operation_id,)
+    cur = conn.execute(f"""
+        UPDATE indicators SET weight = (SELECT default_weight FROM indicator_types WHERE id = indicator_type_id)
+        WHERE weight != (SELECT default_weight FROM indicator_types WHERE id = indicator_type_id) {scope}
+    """, params)
+    return cur.rowcount
+
+
+def load_columns(conn, operation_id=None):
+    """Return (channels, columns) where columns are aligned int64 arrays, one entry per indicator."""
+    scope, params = "", ()
+    if operation_id is not None:
+        scope, params = "WHERE c.operation_id = ?", (operation_id,)
+
+    channels = conn.execute(f"SELECT c.id, c.notes FROM channels c {scope} ORDER BY c.id", params).fetchall()
+
+    total = conn.execute(f"""
+        SELECT COUNT(*) FROM indicators i JOIN channels c ON c.id = i.channel_id {scope}
+    """, params).fetchone()[0]
+    data = np.empty((total, 5), dtype=np.int64)
+
+    # Plain tuples: sqlite3.Row objects are several times slower to copy into arrays
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(f"""
+        SELECT i.channel_id,
+               i.weight,
+               CASE i.type WHEN 'technical' THEN {TECHNICAL} ELSE {BEHAVIORAL} END,
+               CASE i.confidence WHEN 'High' THEN {HIGH} WHEN 'Medium' THEN {MEDIUM} ELSE {LOW} END,
+               t.mask
+        FROM indicators i
+        JOIN channels c ON c.id = i.channel_id
+        JOIN temp.rescore_types t ON t.type = i.type AND t.type_id IS i.indicator_type_id
+             AND t.name = CASE WHEN i.indicator_type_id IS NULL THEN i.name ELSE '' END
+        {scope}
+    """, params)
+    filled = 0
+    while True:
+        chunk = cur.fetchmany(FETCH_CHUNK)
+        if not chunk:
+            break
+        data[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+    # Sorting here is cheaper than an ORDER BY over the whole indicators table
+    data = data[:filled]
+    data = data[np.argsort(data[:, 0], kind='stable')]
+
+    channel_ids = np.fromiter((c[0] for c in channels), dtype=np.int64, count=len(channels))
+    return channels, {
+        "channel_ids": channel_ids,
+        "channel_index": np.searchsorted(channel_ids, data[:, 0]),
+        "weight": data[:, 1],
+        "group": data[:, 2],
+        "confidence": data[:, 3],
+        "mask": data[:, 4],
+    }
+
+
+def aggregate(columns):
+    """Segmented per-channel reductions over the indicator columns."""
+    n = len(columns["channel_ids"])
+    idx = columns["channel_index"]
+    group = columns["group"]
+    conf = columns["confidence"]
+
+    def count(selector):
+        return np.bincount(idx[selector], minlength=n)
+
+    flags = np.zeros(n, dtype=np.int64)
+    if len(idx):
+        # Rows are sorted by channel, so each channel is one contiguous segment
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        flags[idx[starts]] = np.bitwise_or.reduceat(columns["mask"], starts)
+
+    return {
+        "score": np.bincount(idx, weights=columns["weight"], minlength=n).astype(np.int64),
+        "high": count(conf == HIGH),
+        "medium": count(conf == MEDIUM),
+        "low": count(conf == LOW),
+        "technical": count(group == TECHNICAL),
+        "behavioral": count(group == BEHAVIORAL),
+        "flags": flags,
+    }
+
+
+def evaluate(engine, agg, notes):
+    """Apply the engine's ordered rule table to every channel at once."""
+    n = len(agg["score"])
+    state_media = np.fromiter((bool(x) and "state media" in x.lower() for x in notes), dtype=bool, count=n)
+    mask = agg["flags"] | np.where(state_media, SIGNAL_BITS["state media"], 0)
+
+    categories = np.full(n, UNCLASSIFIED, dtype=object)
+    short_circuit = np.zeros(n, dtype=bool)
+    pending = np.ones(n, dtype=bool)
+    for category, all_mask, any_mask, min_high, min_medium, min_score, is_short in engine.rules:
+        hit = pending & ((mask & all_mask) == all_mask)
+        if any_mask:
+            hit &= (mask & any_mask) != 0
+        hit &= (agg["high"] >= min_high) & (agg["medium"] >= min_medium) & (agg["score"] >= min_score)
+        categories[hit] = category
+        short_circuit[hit] = is_short
+        pending &= ~hit
+
+    high_conf = (agg["technical"] >= engine.high_tech) & (agg["behavioral"] >= engine.high_beh)
+    medium_conf = agg["behavioral"] >= engine.medium_beh
+    confidence = np.where(high_conf | short_circuit, "High", np.where(medium_conf, "Medium", "Low"))
+    return categories, confidence
+
+
+def write_back(conn, channel_ids, agg):
+    rows = zip(*(agg[k].tolist() for k in ("score", "high", "medium", "low", "technical", "behavioral", "flags")),
+               channel_ids.tolist())
+    cur = conn.executemany("""
+        UPDATE channel_classification SET
+            score = ?, high = ?, medium = ?, low = ?, technical = ?, behavioral = ?, flags = ?
+        WHERE channel_id = ?
+    """, rows)
+    return cur.rowcount
+
+
+def rescore(conn, operation_id=None, catalog_weights=False, write=True):
+    """Rescore all channels (or one operation's) and return throughput statistics."""
+    started = time.perf_counter()
+    engine = get_engine(conn)
+    _load_type_table(conn, engine)
+
+    updated_weights = apply_catalog_weights(conn, operation_id) if catalog_weights else 0
+    channels, columns = load_columns(conn, operation_id)
+    loaded = time.perf_counter()
+
+    agg = aggregate(columns)
+    categories, _ = evaluate(engine, agg, [c[1] for c in channels])
+    computed = time.perf_counter()
+
+    written = write_back(conn, columns["channel_ids"], agg) if write else 0
+    if write and updated_weights:
+        channel_classification.rebuild_timeline(conn, operation_id)
+    if write:
+        operation_ids = [operation_id] if operation_id is not None else [
+            row[0] for row in conn.execute("SELECT id FROM operations")]
+        revisions.bump_operations(conn, operation_ids)
+    conn.execute("DROP TABLE temp.rescore_types")
+    finished = time.perf_counter()
+
+    rows = len(columns["weight"])
+    return {
+        "indicators": rows,
+        "channels": len(channels),
+        "weights_updated": updated_weights,
+        "channels_written": written,
+        "categories": dict(Counter(engine.label(c) for c in categories.tolist())),
+        "load_seconds": round(loaded - started, 3),
+        "compute_seconds": round(computed - loaded, 3),
+        "write_seconds": round(finished - computed, 3),
+        "rows_per_second": round(rows / max(finished - started, 1e-9)),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Rescore channel classifications in bulk.")
+    parser.add_argument('--operation', type=int, help="limit to a single operation id")
+    parser.add_argument('--catalog-weights', action='store_true',
+                        help="first copy indicator_types.default_weight onto linked indicators")
+    parser.add_argument('--dry-run', action='store_true', help="compute and report without writing")
+    args = parser.parse_args()
+
+    conn = get_db()
+    stats = rescore(conn, args.operation, catalog_weights=args.catalog_weights, write=not args.dry_run)
+    if args.dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    conn.close()
+    print(json.dumps(stats, indent=2))
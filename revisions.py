@@ -0,0 +1,107 @@
+"""
+Per-operation revision numbers and a cache of serialized read responses.
+
+Every route that changes an operation, its channels, indicators or links
+bumps operations.revision in the same transaction. Read endpoints derive a
+strong ETag from (route, operation, revision, variant), so a conditional
+GET is answered with 304 after reading that one row, and the serialized
+body of a full response is kept in an in-process LRU cache under the same
+key. A bump makes every older entry unreachable; the LRU ages them out.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import settings
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def current(conn, operation_id):
+    """The operation's revision, or None if it does not exist."""
+    row = conn.execute("SELECT revision FROM operations WHERE id = ?", (operation_id,)).fetchone()
+    return row[0] if row else None
+
+
+def bump(conn, operation_id):
+    conn.execute("UPDATE operations SET revision = revision + 1 WHERE id = ?", (operation_id,))
+
+
+def bump_operations(conn, operation_ids):
+    conn.execute("UPDATE operations SET revision = revision + 1 WHERE id IN (SELECT value FROM json_each(?))",
+                 (json.dumps(sorted(set(operation_ids))),))
+
+
+def bump_for_channels(conn, channel_ids):
+    """Bump the operations owning the given channels."""
+    conn.execute("""
+        UPDATE operations SET revision = revision + 1
+        WHERE id IN (SELECT operation_id FROM channels WHERE id IN (SELECT value FROM json_each(?)))
+    """, (json.dumps(sorted(set(channel_ids))),))
+
+
+def bump_for_link(conn, link_id):
+    conn.execute("""
+        UPDATE operations SET revision = revision + 1
+        WHERE id = (SELECT operation_id FROM channel_links WHERE id = ?)
+    """, (link_id,))
+
+
+def etag(route, operation_id, revision, variant=""):
+    """Strong ETag value (unquoted); `variant` covers anything else the body depends on, e.g. query args."""
+    tag = f"{route}-{operation_id}-{revision}"
+    if variant:
+        tag += "-" + hashlib.sha1(variant.encode()).hexdigest()[:12]
+    return tag
+
+
+class ResponseCache:
+    """Thread-safe LRU of (body, headers) for serialized responses, bounded by total body size."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def limit(self):
+        if self.max_bytes is not None:
+            return self.max_bytes
+        return settings.get_config().get("response_cache", {}).get("max_bytes", DEFAULT_MAX_BYTES)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers=()):
+        limit = self.limit()
+        if len(body) > limit:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (body, tuple(headers))
+            self.size += len(body)
+            while self.size > limit:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
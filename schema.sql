@@ -58,3 +58,20 @@ CREATE TABLE IF NOT EXISTS indicator_types (
 );
 
 
+-- Running classification aggregates per channel, kept in step with indicators
+CREATE TABLE IF NOT EXISTS channel_classification (
+    channel_id INTEGER PRIMARY KEY,
+    operation_id INTEGER NOT NULL,
+    score INTEGER NOT NULL DEFAULT 0,
+    high INTEGER NOT NULL DEFAULT 0,
+    medium INTEGER NOT NULL DEFAULT 0,
+    low INTEGER NOT NULL DEFAULT 0,
+    technical INTEGER NOT NULL DEFAULT 0,
+    behavioral INTEGER NOT NULL DEFAULT 0,
+    flags INTEGER NOT NULL DEFAULT 0,
+    justification TEXT NOT NULL DEFAULT '[]',
+    FOREIGN KEY (channel_id) REFERENCES channels(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_channel_classification_operation
+    ON channel_classification(operation_id, channel_id);
@@ -0,0 +1,172 @@
+"""
+Full-text search over operations, channels and indicators.
+
+search_index (migration 8) is an FTS5 table with one row per operation
+(name, description), channel (name, notes, url) and indicator (name,
+evidence), kept in step with the source tables by triggers. The rowid
+encodes the source row as id * 4 + kind; the indexed scope column holds
+an 'op<id>' token, so searching within one operation intersects with its
+(short) token list instead of filtering every match.
+
+Results are ranked by bm25 when there are at most RANKED_MATCHES matches.
+Broader queries (a common word over millions of rows) would spend seconds
+scoring everything, so they are returned newest first, with no score.
+
+Queries are plain text: every whitespace-separated term must match, a term
+with punctuation inside (example.com, 10.0.0.1, a wallet address) matches
+its parts as a phrase, and a trailing * makes a term a prefix.
+
+    python search.py QUERY [--operation ID] [--limit 20]
+    python search.py --rebuild    # repopulate the index from the source tables
+    python search.py --check      # FTS integrity check and row counts
+"""
+
+import html
+
+KINDS = ("operation", "channel", "indicator")
+
+# bm25 weight per column: operation_id, channel_id (unindexed), scope, name, content, url
+RANK = "bm25(search_index, 0.0, 0.0, 0.0, 2.0, 1.0, 1.0)"
+RANKED_MATCHES = 20000
+SNIPPET_TOKENS = 16
+MARK_START, MARK_END = "\x02", "\x03"  # char(2) and char(3) in the SQL
+
+
+class SearchError(ValueError):
+    """An empty query or unknown kind; reported to the client as 400."""
+
+
+def match_expression(query):
+    """Quote every term so user input is never parsed as FTS5 query syntax."""
+    terms = []
+    for term in (query or "").split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    if not terms:
+        raise SearchError("Empty search query")
+    return "{name content url} : (" + " AND ".join(terms) + ")"
+
+
+def marked(text):
+    """HTML-escape a highlighted value and turn the match markers into <mark> tags."""
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def search(conn, query, operation_id=None, kinds=None, limit=20, offset=0):
+    """
+    Return up to `limit` results, best first, and whether more follow. Each
+    result names its source row and carries the highlighted name and the
+    best matching snippet of any column.
+    """
+    match = match_expression(query)
+    if operation_id is not None:
+        match += f' AND scope : "op{int(operation_id)}"'
+    conditions, params = ["search_index MATCH ?"], [match]
+    if kinds:
+        unknown = [k for k in kinds if k not in KINDS]
+        if unknown:
+            raise SearchError(f"Unknown kinds {unknown}; available: {', '.join(KINDS)}")
+        conditions.append(f"rowid % 4 IN ({', '.join(str(KINDS.index(k)) for k in kinds)})")
+
+    where = " AND ".join(conditions)
+    cur = conn.cursor()
+    cur.row_factory = None
+    # Counting stops at the cap, so this costs at most RANKED_MATCHES doclist entries
+    matches = cur.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM search_index WHERE {where} LIMIT ?)",
+                          params + [RANKED_MATCHES + 1]).fetchone()[0]
+    ranked = matches <= RANKED_MATCHES
+    rows = cur.execute(f"""
+        SELECT rowid, operation_id, channel_id,
+               highlight(search_index, 3, char(2), char(3)),
+               snippet(search_index, -1, char(2), char(3), '...', {SNIPPET_TOKENS}),
+               {RANK if ranked else "NULL"}
+        FROM search_index
+        WHERE {where}
+        ORDER BY {RANK if ranked else "rowid DESC"}
+        LIMIT ? OFFSET ?
+    """, params + [limit + 1, offset]).fetchall()
+
+    results = [{
+        "kind": KINDS[rowid % 4],
+        "id": rowid // 4,
+        "operation_id": op_id,
+        "channel_id": channel_id,
+        "name": marked(name),
+        "snippet": marked(snippet),
+        "score": round(-rank, 4) if ranked else None,
+    } for rowid, op_id, channel_id, name, snippet, rank in rows[:limit]]
+    return results, len(rows) > limit
+
+
+def rebuild(conn):
+    """Repopulate search_index from the source tables; returns the number of rows indexed."""
+    conn.execute("DELETE FROM search_index")
+    conn.execute("""
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+        SELECT id * 4, id, NULL, 'op' || id, name, description, NULL FROM operations
+    """)
+    conn.execute("""
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+        SELECT id * 4 + 1, operation_id, id, 'op' || operation_id, name, notes, url FROM channels
+    """)
+    conn.execute("""
+        INSERT INTO search_index (rowid, operation_id, channel_id, scope, name, content, url)
+        SELECT i.id * 4 + 2, c.operation_id, i.channel_id, 'op' || c.operation_id, i.name, i.evidence, NULL
+        FROM indicators i JOIN channels c ON c.id = i.channel_id
+    """)
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    return conn.execute("SELECT COUNT(*) FROM search_index").fetchone()[0]
+
+
+def check(conn):
+    """Return (kind, indexed, expected) for every kind whose row count is off; raises if the index is corrupt."""
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('integrity-check')")
+    expected = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("operations", "channels", "indicators")]
+    indexed = dict(conn.execute("SELECT rowid % 4, COUNT(*) FROM search_index GROUP BY rowid % 4").fetchall())
+    return [(kind, indexed.get(n, 0), expected[n]) for n, kind in enumerate(KINDS) if indexed.get(n, 0) != expected[n]]
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Full-text search over evidence, notes and descriptions.")
+    parser.add_argument('query', nargs='?')
+    parser.add_argument('--operation', type=int)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--rebuild', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    conn = get_db()
+    if args.rebuild:
+        start = time.perf_counter()
+        count = rebuild(conn)
+        conn.commit()
+        print(f"Indexed {count} rows in {time.perf_counter() - start:.1f}s.")
+    if args.check:
+        problems = check(conn)
+        for kind, indexed, expected in problems:
+            print(f"{kind}: {indexed} indexed, {expected} in the table")
+        print("Search index OK." if not problems else "Search index out of sync; run with --rebuild.")
+    if args.query:
+        start = time.perf_counter()
+        results, more = search(conn, args.query, args.operation, limit=args.limit)
+        elapsed = time.perf_counter() - start
+        for r in results:
+            # No score when there were more than RANKED_MATCHES matches
+            score = r['score'] if r['score'] is not None else '-'
+            print(f"{score:>8} {r['kind']:<9} {r['id']:>8}  op {r['operation_id']}: {r['name']}\n"
+                  f"{'':>28}{r['snippet']}")
+        print(f"{len(results)} results{' (more available)' if more else ''} in {elapsed * 1000:.1f} ms")
+    conn.close()
+    if args.check and problems:
+        sys.exit(1)
@@ -0,0 +1,64 @@
+"""
+Fast JSON for the operation read endpoints.
+
+Result sets are serialized by SQLite itself: rows_json() wraps a query in
+json_group_array(json_object(...)), so rows come back as one JSON text
+instead of being copied into dicts and encoded again in Python. compose()
+splices such fragments (Raw) into the response object, and dumps()
+encodes everything else with orjson when it is installed, the standard
+library otherwise.
+"""
+
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_columns = {}
+_columns_lock = threading.Lock()
+
+
+class Raw(bytes):
+    """Already serialized JSON, copied verbatim by compose()."""
+
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def compose(obj):
+    """dumps() for dicts whose values may be Raw fragments."""
+    if isinstance(obj, Raw):
+        return bytes(obj)
+    if isinstance(obj, dict):
+        return b"{" + b",".join(dumps(str(k)) + b":" + compose(v) for k, v in obj.items()) + b"}"
+    return dumps(obj)
+
+
+def _query_columns(conn, sql, params):
+    columns = _columns.get(sql)
+    if columns is None:
+        columns = tuple(d[0] for d in conn.execute(f"SELECT * FROM ({sql}) LIMIT 0", params).description)
+        with _columns_lock:
+            _columns[sql] = columns
+    return columns
+
+
+def rows_json(conn, sql, params=()):
+    """The rows of `sql` as a JSON array of objects keyed by column name, built by SQLite."""
+    pairs = ", ".join(f"'{name}', \"{name}\"" for name in _query_columns(conn, sql, params))
+    # An aggregate over a subquery sees the rows in the subquery's ORDER BY
+    text = conn.execute(f"SELECT json_group_array(json_object({pairs})) FROM ({sql})", params).fetchone()[0]
+    return Raw(text.encode())
+
+
+def row_json(conn, sql, params=()):
+    """The first row of `sql` as a JSON object, or None."""
+    pairs = ", ".join(f"'{name}', \"{name}\"" for name in _query_columns(conn, sql, params))
+    row = conn.execute(f"SELECT json_object({pairs}) FROM ({sql}) LIMIT 1", params).fetchone()
+    return Raw(row[0].encode()) if row else None
@@ -0,0 +1,55 @@
+"""
+Shared access to config.json.
+
+The file is parsed once and shared by every module; its modification time
+is checked at most once every CHECK_INTERVAL seconds and the file re-read
+only when it changed, so edits are picked up without restarting the
+process. reload() forces the check.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+CONFIG_FILE = 'config.json'
+CHECK_INTERVAL = 1.0
+
+log = logging.getLogger("fimi")
+
+_lock = threading.Lock()
+_state = {"mtime": None, "config": {}, "checked": None}
+
+
+def reload():
+    _state["checked"] = None
+    return get_config()
+
+
+def get_config():
+    now = time.monotonic()
+    checked = _state["checked"]
+    if checked is not None and now - checked < CHECK_INTERVAL:
+        return _state["config"]
+    _state["checked"] = now
+    try:
+        mtime = os.stat(CONFIG_FILE).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if mtime != _state["mtime"]:
+        with _lock:
+            if mtime != _state["mtime"]:
+                try:
+                    config = {}
+                    if mtime is not None:
+                        with open(CONFIG_FILE) as f:
+                            config = json.load(f)
+                except ValueError as e:
+                    # Half-written or broken file: keep serving the last good config
+                    log.warning("Ignoring invalid %s: %s", CONFIG_FILE, e)
+                    return _state["config"]
+                _state["config"] = config
+                _state["mtime"] = mtime
+    return _state["config"]
@@ -0,0 +1,400 @@
+"""
+What-if classification: hypothetical thresholds, indicator weights and
+indicator additions/removals, evaluated without touching stored data.
+
+A scenario starts from the materialized channel_classification aggregates.
+Only the channels it changes read their indicators: weight overrides are
+summed per channel and indicator type in SQL, and removals refold the
+flags of their channels. Every channel is then reduced to its outcome
+under the rules before the score thresholds (short circuits and
+exposure_rules, which thresholds cannot change) and its score. A sweep
+point only has to place the distinct scores of the channels that fall
+through to the thresholds, so grids of thousands of points over every
+operation stay interactive.
+
+POST /api/simulate takes, all optional:
+
+    {"operation_id": 3,                                  # default: all operations
+     "thresholds": {"State-Linked": 5},                  # merged into classification_thresholds
+     "weights": {"Self-attribution": 1, "12": 4},        # every linked indicator of a type, by subtype or id
+     "add_indicators": [{"channel_id": 7, "name": "Self-attribution", "confidence": "High"}],
+     "remove_indicators": [41, 42],
+     "sweep": {"State-Linked": [4, 5, 6, 7], "State-Aligned": [2, 3]}}
+
+It returns the category counts before and after, how many channels moved
+and between which categories, the moved channels, and the same summary
+for every point of the sweep grid (applied on top of "thresholds"). Only
+categories are simulated, not confidence levels.
+
+    python simulation.py [--operation ID] [--threshold CATEGORY=N ...] [--sweep CATEGORY=N,N,... ...]
+"""
+
+import itertools
+import json
+import math
+from collections import Counter
+
+import settings
+from classification import UNCLASSIFIED, get_engine, indicator_types
+
+DEFAULT_MAX_GRID_POINTS = 10000
+CONFIDENCE_LEVELS = ("High", "Medium", "Low")
+
+CHANNEL_COLUMNS = ("channel_id", "operation_id", "channel_name", "notes", "flags",
+                   "score", "high", "medium", "technical", "behavioral")
+
+
+class SimulationError(ValueError):
+    """A malformed scenario; reported to the client as 400."""
+
+
+def simulation_config():
+    return settings.get_config().get("simulation", {})
+
+
+def _number(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise SimulationError(f"{what} must be a number")
+    return value
+
+
+def _text(value, what):
+    if value is not None and not isinstance(value, str):
+        raise SimulationError(f"{what} must be a string")
+    return value
+
+
+def _ids(values, what):
+    if not isinstance(values, list) or any(isinstance(v, bool) or not isinstance(v, int) for v in values):
+        raise SimulationError(f"{what} must be a list of ids")
+    return sorted(set(values))
+
+
+# ------------------------
+# SCENARIO
+# ------------------------
+
+def merged_thresholds(engine, overrides):
+    """The engine's thresholds with `overrides` applied; categories it does not have go last."""
+    if not isinstance(overrides or {}, dict):
+        raise SimulationError("thresholds must be an object")
+    thresholds = dict(engine.thresholds)
+    for category, value in (overrides or {}).items():
+        thresholds[category] = _number(value, f"Threshold for '{category}'")
+    return thresholds
+
+
+def resolve_weights(engine, weights):
+    """{indicator type id: weight} from keys that are type ids or subtype names."""
+    if not isinstance(weights or {}, dict):
+        raise SimulationError("weights must be an object")
+    resolved = {}
+    for key, weight in (weights or {}).items():
+        type_id = int(key) if str(key).isdigit() else engine.type_id(key)
+        if type_id not in engine.type_weights:
+            raise SimulationError(f"Unknown indicator type '{key}'")
+        resolved[type_id] = _number(weight, f"Weight for '{key}'")
+    return resolved
+
+
+def sweep_grid(thresholds, sweep):
+    """Threshold overrides for every point of the sweep grid, in row-major order."""
+    if not sweep:
+        return []
+    if not isinstance(sweep, dict):
+        raise SimulationError("sweep must be an object")
+    axes = []
+    for category, values in sweep.items():
+        if not isinstance(values, list) or not values:
+            raise SimulationError(f"Sweep values for '{category}' must be a non-empty list")
+        axes.append([(category, _number(v, f"Sweep value for '{category}'")) for v in values])
+    points = math.prod(len(axis) for axis in axes)
+    limit = simulation_config().get("max_grid_points", DEFAULT_MAX_GRID_POINTS)
+    if points > limit:
+        raise SimulationError(f"Sweep has {points} points; at most {limit} are allowed")
+    return [dict(point) for point in itertools.product(*axes)]
+
+
+def load_channels(conn, operation_id=None):
+    """{channel id: stored aggregate} for one operation or all of them, without the justification lines."""
+    where, params = "", ()
+    if operation_id is not None:
+        where, params = "WHERE cc.operation_id = ?", (operation_id,)
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(f"""
+        SELECT cc.channel_id, cc.operation_id, c.name, c.notes, cc.flags, cc.score, cc.high, cc.medium,
+               cc.technical, cc.behavioral
+        FROM channel_classification cc
+        JOIN channels c ON c.id = cc.channel_id
+        {where}
+        ORDER BY cc.channel_id
+    """, params)
+    return {row[0]: dict(zip(CHANNEL_COLUMNS, row)) for row in cur}
+
+
+def _changed(channels, changed, channel_id, what):
+    """The hypothetical copy of a channel's aggregate, made on first change."""
+    state = changed.get(channel_id)
+    if state is None:
+        if channel_id not in channels:
+            raise SimulationError(f"{what}: channel {channel_id} is not in the simulated operations")
+        state = changed[channel_id] = dict(channels[channel_id])
+    return state
+
+
+def _fold(state, group_type, weight, confidence, sign):
+    state["score"] += sign * weight
+    if confidence in ("High", "Medium"):
+        state[confidence.lower()] += sign
+    if group_type in ("technical", "behavioral"):
+        state[group_type] += sign
+
+
+def apply_weights(conn, channels, changed, weights, operation_id=None):
+    """Rescore the channels holding indicators of a reweighted type."""
+    if not weights:
+        return
+    where, params = "", [json.dumps(list(weights))]
+    if operation_id is not None:
+        where = "AND c.operation_id = ?"
+        params.append(operation_id)
+    for channel_id, type_id, count, total in conn.execute(f"""
+        SELECT i.channel_id, i.indicator_type_id, COUNT(*), SUM(i.weight)
+        FROM indicators i
+        JOIN channels c ON c.id = i.channel_id
+        WHERE i.indicator_type_id IN (SELECT value FROM json_each(?)) {where}
+        GROUP BY i.channel_id, i.indicator_type_id
+    """, params):
+        _changed(channels, changed, channel_id, "weights")["score"] += count * weights[type_id] - total
+
+
+def remove_indicators(conn, engine, channels, changed, indicator_ids, weights):
+    if not indicator_ids:
+        return
+    rows = conn.execute("""
+        SELECT id, channel_id, type, indicator_type_id, weight, confidence FROM indicators
+        WHERE id IN (SELECT value FROM json_each(?))
+    """, (json.dumps(indicator_ids),)).fetchall()
+    missing = set(indicator_ids) - {row[0] for row in rows}
+    if missing:
+        raise SimulationError(f"Unknown indicators {sorted(missing)}")
+    for indicator_id, channel_id, group_type, type_id, weight, confidence in rows:
+        state = _changed(channels, changed, channel_id, f"Indicator {indicator_id}")
+        _fold(state, group_type, weights.get(type_id, weight), confidence, -1)
+
+    # Flags cannot be subtracted, so refold what is left of these channels
+    refold = sorted({row[1] for row in rows})
+    for channel_id in refold:
+        changed[channel_id]["flags"] = 0
+    for channel_id, group_type, type_id, name in conn.execute("""
+        SELECT channel_id, type, indicator_type_id, name FROM indicators
+        WHERE channel_id IN (SELECT value FROM json_each(?)) AND id NOT IN (SELECT value FROM json_each(?))
+    """, (json.dumps(refold), json.dumps(indicator_ids))):
+        changed[channel_id]["flags"] |= engine.linked_mask(group_type, type_id, name)
+
+
+def add_indicators(conn, engine, channels, changed, additions, weights):
+    """
+    Fold hypothetical indicators in. Each names its channel_id and its type
+    by indicator_type_id or a catalog subtype as name (or a free-text name
+    and a group "type"); weight and confidence default to the type's
+    reweighted or default values.
+    """
+    if not additions:
+        return
+    if not isinstance(additions, list):
+        raise SimulationError("add_indicators must be a list")
+    types = {t["id"]: t for t in indicator_types(conn)}
+    for n, indicator in enumerate(additions):
+        what = f"add_indicators[{n}]"
+        if not isinstance(indicator, dict) or not isinstance(indicator.get("channel_id"), int):
+            raise SimulationError(f"{what} needs a channel_id")
+        name = _text(indicator.get("name"), f"{what}: name")
+        group_type = _text(indicator.get("type"), f"{what}: type")
+        type_id = indicator.get("indicator_type_id")
+        if type_id is not None and (isinstance(type_id, bool) or not isinstance(type_id, int)):
+            raise SimulationError(f"{what}: indicator_type_id must be an id")
+        type_id = type_id or engine.type_id(name)
+        catalog = types.get(type_id)
+        if type_id is not None and catalog is None:
+            raise SimulationError(f"{what}: unknown indicator type {type_id}")
+        if catalog is None and not group_type:
+            raise SimulationError(f"{what} needs an indicator_type_id, a catalog subtype as name, or a type")
+
+        group_type = group_type or catalog["group_type"]
+        weight = indicator.get("weight")
+        if weight is None and catalog is not None:
+            weight = weights.get(type_id, catalog["default_weight"])
+        confidence = indicator.get("confidence") or (catalog["default_confidence"] if catalog else "Low")
+        if confidence not in CONFIDENCE_LEVELS:
+            raise SimulationError(f"{what}: confidence must be one of {', '.join(CONFIDENCE_LEVELS)}")
+
+        state = _changed(channels, changed, indicator["channel_id"], what)
+        _fold(state, group_type, _number(weight, f"{what}: weight"), confidence, 1)
+        state["flags"] |= engine.linked_mask(group_type, type_id, name or catalog["subtype"])
+
+
+# ------------------------
+# EVALUATION
+# ------------------------
+
+def threshold_category(thresholds, score):
+    """First category of `thresholds` (category, threshold) pairs that `score` reaches."""
+    for category, threshold in thresholds:
+        if score >= threshold:
+            return category
+    return UNCLASSIFIED
+
+
+def _outcome(engine, state):
+    mask = engine.channel_mask(state["flags"], state["notes"])
+    return engine.fixed_category(mask, state["score"], state["high"], state["medium"]), state["score"]
+
+
+def tally(fixed):
+    """(counts, transitions) of the channels settled before the thresholds, {(category, baseline): n}."""
+    counts, transitions = Counter(), Counter()
+    for (category, baseline), n in fixed.items():
+        counts[category] += n
+        if category != baseline:
+            transitions[baseline, category] += n
+    return counts, transitions
+
+
+def summarize(engine, fixed, scored, thresholds):
+    """
+    Category counts and moves under `thresholds`, from the tally() of the
+    channels settled before them and the ones they place by score,
+    {(score, baseline): n}.
+    """
+    thresholds = tuple(thresholds.items())
+    counts, transitions = fixed[0].copy(), fixed[1].copy()
+    by_score = {}
+    for (score, baseline), n in scored.items():
+        category = by_score.get(score)
+        if category is None:
+            category = by_score[score] = threshold_category(thresholds, score)
+        counts[category] += n
+        if category != baseline:
+            transitions[baseline, category] += n
+    return {
+        "counts": labelled(engine, counts),
+        "moved": sum(transitions.values()),
+        "transitions": [{"from": engine.label(a), "to": engine.label(b), "channels": n}
+                        for (a, b), n in transitions.most_common()],
+    }
+
+
+def labelled(engine, counts):
+    """Counts by display label, with a zero for every category the rules can produce."""
+    categories = dict.fromkeys([rule[0] for rule in engine.rules] + list(counts) + [UNCLASSIFIED])
+    result = {}
+    for category in categories:
+        label = engine.label(category)
+        result[label] = result.get(label, 0) + counts.get(category, 0)
+    return result
+
+
+def simulate(conn, scenario):
+    """Evaluate a scenario (see the module docstring); raises LookupError for an unknown operation."""
+    if not isinstance(scenario, dict):
+        raise SimulationError("The scenario must be a JSON object")
+    engine = get_engine(conn)
+    operation_id = scenario.get("operation_id")
+    if operation_id is not None:
+        if isinstance(operation_id, bool) or not isinstance(operation_id, int):
+            raise SimulationError("operation_id must be an integer")
+        if conn.execute("SELECT 1 FROM operations WHERE id = ?", (operation_id,)).fetchone() is None:
+            raise LookupError(f"Operation with ID {operation_id} not found.")
+
+    thresholds = merged_thresholds(engine, scenario.get("thresholds"))
+    weights = resolve_weights(engine, scenario.get("weights"))
+    grid = sweep_grid(thresholds, scenario.get("sweep"))
+
+    channels = load_channels(conn, operation_id)
+    changed = {}
+    apply_weights(conn, channels, changed, weights, operation_id)
+    remove_indicators(conn, engine, channels, changed,
+                      _ids(scenario.get("remove_indicators", []), "remove_indicators"), weights)
+    add_indicators(conn, engine, channels, changed, scenario.get("add_indicators"), weights)
+
+    # Baseline is what /classify shows; the thresholds only place the channels no earlier rule settled
+    current = tuple(engine.thresholds.items())
+    outcomes = {}
+    fixed, scored = Counter(), Counter()
+    for channel_id, state in channels.items():
+        category, score = _outcome(engine, state)
+        baseline = category or threshold_category(current, score)
+        if channel_id in changed:
+            category, score = _outcome(engine, changed[channel_id])
+        outcomes[channel_id] = (category, score, baseline)
+        if category is None:
+            scored[score, baseline] += 1
+        else:
+            fixed[category, baseline] += 1
+
+    changes = []
+    pairs = tuple(thresholds.items())
+    for channel_id, (category, score, baseline) in outcomes.items():
+        category = category or threshold_category(pairs, score)
+        if category != baseline:
+            state = channels[channel_id]
+            changes.append({
+                "channel_id": channel_id,
+                "operation_id": state["operation_id"],
+                "channel_name": state["channel_name"],
+                "from": engine.label(baseline),
+                "to": engine.label(category),
+                "baseline_score": state["score"],
+                "score": score,
+            })
+
+    result = {
+        "operation_id": operation_id,
+        "channels": len(channels),
+        "thresholds": thresholds,
+        "baseline": labelled(engine, Counter(baseline for _, _, baseline in outcomes.values())),
+    }
+    fixed = tally(fixed)
+    result.update(summarize(engine, fixed, scored, thresholds))
+    result["changes"] = changes
+    result["sweep"] = [dict(thresholds=point, **summarize(engine, fixed, scored, {**thresholds, **point}))
+                       for point in grid]
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import get_db
+
+    def assignment(text):
+        category, sep, values = text.rpartition("=")
+        if not sep or not category:
+            raise argparse.ArgumentTypeError(f"expected CATEGORY=VALUE, got '{text}'")
+        try:
+            return category, [float(v) if "." in v else int(v) for v in values.split(",")]
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"not a number in '{text}'") from None
+
+    parser = argparse.ArgumentParser(description="Simulate classification under other thresholds.")
+    parser.add_argument('--operation', type=int, help="limit to a single operation id")
+    parser.add_argument('--threshold', type=assignment, action='append', default=[], metavar='CATEGORY=N',
+                        help="hypothetical threshold (repeatable)")
+    parser.add_argument('--sweep', type=assignment, action='append', default=[], metavar='CATEGORY=N,N,...',
+                        help="threshold values to sweep (repeatable; the grid is their product)")
+    args = parser.parse_args()
+
+    conn = get_db()
+    result = simulate(conn, {
+        "operation_id": args.operation,
+        "thresholds": {category: values[-1] for category, values in args.threshold},
+        "sweep": dict(args.sweep),
+    })
+    conn.close()
+
+    print(f"{result['channels']} channels, thresholds {json.dumps(result['thresholds'])}")
+    print(f"{'baseline':<28} " + ", ".join(f"{k}: {v}" for k, v in result["baseline"].items()))
+    for point in [result] + result["sweep"]:
+        name = json.dumps(point["thresholds"]) if point is not result else "scenario"
+        print(f"{name:<28} moved {point['moved']:>6}; " + ", ".join(f"{k}: {v}" for k, v in point["counts"].items()))
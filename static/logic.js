@@ -2,47 +2,73 @@ let currentOperationId = null;
 let channels = [];
 let indicatorTypes = [];
 let heatmapChart = null;
+// Live updates for the selected operation (GET /operations/<id>/events), and what is on screen
+let operationEvents = null;
+let shownChannelId = null;
+let matrixState = null;  // {classification: Map, indicators: Map, links: Map} once the matrix is rendered
 
 
-// Load operations on page load
+// Load the indicator types and the first page of operations in one request on page load
 window.onload = () => {
-  loadOperationList();
-
-  // Fetch structured indicator types
-  fetch('/indicator_types')
+  const sel = clearOperationList();
+  fetch(`/api/bootstrap?fields=${OPERATION_FIELDS}&limit=200`)
     .then(res => res.json())
     .then(data => {
-      indicatorTypes = data;
+      indicatorTypes = data.indicator_types;
       document.getElementById('ind_group').addEventListener('change', updateCategories);
       document.getElementById('ind_category').addEventListener('change', updateSubtypes);
       document.getElementById('ind_subtype').addEventListener('change', updateDefaults);
-    });
+      appendOperations(sel, data.operations);
+      if (data.next_cursor) {
+        return fetchPages(`/operations?fields=${OPERATION_FIELDS}`, ops => appendOperations(sel, ops), 200,
+                          data.next_cursor);
+      }
+    })
+    .catch(err => console.error('Error during bootstrap:', err));
 };
 
+// Fetch a paginated list endpoint page by page, following X-Next-Cursor (from `cursor` if given);
+// onPage receives each page's rows (and the response body) as they arrive
+async function fetchPages(url, onPage, pageSize = 200, cursor = null) {
+  do {
+    const sep = url.includes('?') ? '&' : '?';
+    const res = await fetch(`${url}${sep}limit=${pageSize}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''));
+    const body = await res.json();
+    onPage(Array.isArray(body) ? body : body.channels, body);
+    cursor = res.headers.get('X-Next-Cursor');
+  } while (cursor);
+}
+
+const OPERATION_FIELDS = 'id,name,region';
+
+function clearOperationList() {
+  const sel = document.getElementById('op_select');
+  sel.innerHTML = '<option value="">-- Select Operation --</option>';  // Clear dropdown
+  return sel;
+}
+
+function appendOperations(sel, ops) {
+  ops.forEach(op => {
+    const opt = document.createElement('option');
+    opt.value = op.id;
+    opt.textContent = `${op.name} (${op.region})`;
+    sel.appendChild(opt);
+  });
+}
+
 // Function to load the operation list into the dropdown
 function loadOperationList() {
-  fetch('/operations')
-    .then(res => res.json())
-    .then(ops => {
-      const sel = document.getElementById('op_select');
-      sel.innerHTML = '<option value="">-- Select Operation --</option>';  // Clear dropdown
-      ops.forEach(op => {
-        const opt = document.createElement('option');
-        opt.value = op.id;
-        opt.textContent = `${op.name} (${op.region})`;
-        sel.appendChild(opt);
-      });
-
-      // Do not automatically select an operation. Leave it as default.
-      // Removing this line:
-      // if (ops.length > 0) {
-      //   document.getElementById('op_select').value = ops[0].id;
-      //   loadOperation();  // Automatically load the first operation
-      // }
-    })
+  const sel = clearOperationList();
+  // Options are appended page by page, so the first operations show up right away
+  fetchPages(`/operations?fields=${OPERATION_FIELDS}`, ops => appendOperations(sel, ops))
     .catch(err => console.error('Error fetching operations:', err));  // Debugging
 }
 
+// The operation with its channels, indicators, links and classification, in one (compressed) response
+function fetchBootstrap(opId) {
+  return fetch(`/api/bootstrap/${opId}`).then(res => res.json());
+}
+
 
 
 // This function loads the selected operation's data and updates the UI
@@ -51,6 +77,9 @@ function loadOperation() {
   if (!opId) return;
 
   currentOperationId = parseInt(opId);
+  subscribeOperation(currentOperationId);
+  matrixState = null;
+  shownChannelId = null;
 
   // Clear previous content
   document.getElementById('classification_results').innerHTML = '';
@@ -59,6 +88,16 @@ function loadOperation() {
   document.getElementById('channel_link_graph').innerHTML = '';  // Clear the network graph
   document.getElementById('link_view').innerHTML = ''; 
   document.getElementById('llm_rendered_output').innerHTML = '';  // Clear the report content
+
+  channels = [];
+  renderChannelList();
+  renderChannelDropdowns();
+  fetchBootstrap(currentOperationId).then(data => {
+    if (parseInt(opId) !== currentOperationId) return;  // another operation was selected meanwhile
+    channels = data.channels;
+    renderChannelList();
+    renderChannelDropdowns();
+  }).catch(err => console.error('Error fetching channels:', err));
 }
 
 
@@ -110,7 +149,7 @@ function addChannel() {
     body: JSON.stringify(data)
   }).then(() => {
     notify("Channel added.");
-    loadOperation();
+    if (!liveUpdates()) loadOperation();
   });
 }
 
@@ -166,7 +205,7 @@ function addIndicator() {
     body: JSON.stringify(data)
   }).then(() => {
     notify("Indicator added.");
-    loadChannelIndicators(data.channel_id);
+    if (!liveUpdates() || shownChannelId !== data.channel_id) loadChannelIndicators(data.channel_id);
   });
 }
 
@@ -176,15 +215,18 @@ function loadChannelIndicators(channelId) {
     .then(res => res.json())
     .then(data => {
       const box = document.getElementById('indicators_view');
-      box.innerHTML = `<h3>Indicators for ${data.channel.name}</h3>` + data.indicators.map(i =>
-        `<p id="indicator-${i.id}">
-          <span class="delete-btn" onclick="deleteIndicator(${i.id}, ${data.channel.id})">&times;</span>
-          [${i.type}] <strong>${i.name}</strong> (Weight ${i.weight}, ${i.confidence})<br>${i.evidence}
-        </p>`
-      ).join(''); 
+      shownChannelId = data.channel.id;
+      box.innerHTML = `<h3>Indicators for ${data.channel.name}</h3>` + data.indicators.map(renderIndicator).join('');
     });
 }
 
+function renderIndicator(i) {
+  return `<p id="indicator-${i.id}">
+          <span class="delete-btn" onclick="deleteIndicator(${i.id}, ${i.channel_id})">&times;</span>
+          [${i.type}] <strong>${i.name}</strong> (Weight ${i.weight}, ${i.confidence})<br>${i.evidence}
+        </p>`;
+}
+
 // Add relationship between channels
 function addLink() {
   const data = {
@@ -201,7 +243,7 @@ function addLink() {
     body: JSON.stringify(data)
   }).then(() => {
     notify("Link added.");
-    loadOperation();
+    if (!liveUpdates()) loadOperation();
   });
 }
 
@@ -260,20 +302,31 @@ function runClassification() {
     return;
   }
 
-  fetch(`/classify/${currentOperationId}`)
-    .then(res => res.json())
-    .then(data => {
-
-      const box = document.getElementById('classification_results');
-      if (!data.length) {
-        box.innerHTML = "<p>No channels or indicators to classify.</p>";
-        return;
-      }
+  const opId = currentOperationId;
+  fetchBootstrap(opId).then(data => {
+    if (opId !== currentOperationId) return;
+    matrixState = {
+      classification: new Map(data.classification.map(res => [res.channel_id, res])),
+      indicators: new Map(data.indicators.map(i => [i.id, i])),
+      links: new Map(data.channel_links.map(l => [l.id, l]))
+    };
+    renderClassification();
+    renderOperationCharts();
+  }).catch(err => console.error("Error in classification fetch:", err));
+}
 
-      // === TEXT OUTPUT ===
-      box.innerHTML = '<h3>Classification Results</h3>' + data.map(res => {
-        return `
-          <div class="result-card">
+// Categories of the exposure matrix, in display order; anything else goes to Unclassified
+const MATRIX_CATEGORIES = [
+  "State Official Channel",
+  "State-Controlled Outlet",
+  "State-Linked Channel",
+  "State-Aligned Channel",
+  "Unclassified"
+];
+
+function renderResultCard(res) {
+  return `
+          <div class="result-card" id="result-${res.channel_id}">
             <h4>${res.channel_name} <span class="delete-btn" onclick="deleteChannel(${res.channel_id})">&times;</span></h4>
             <p><strong>Classification:</strong> ${res.classification}</p>
             <p><strong>Score:</strong> ${res.score}</p>
@@ -284,78 +337,182 @@ function runClassification() {
             </details>
           </div>
         `;
-      }).join('');
-
-      // === VISUAL MATRIX OUTPUT ===
-      const grouped = {
-        "State Official Channel": [],
-        "State-Controlled Outlet": [],
-        "State-Linked Channel": [],
-        "State-Aligned Channel": [],
-        "Unclassified": []
-      };
-
-      data.forEach(item => {
-        if (!grouped[item.classification]) {
-          grouped["Unclassified"].push(item);
-        } else {
-          grouped[item.classification].push(item);
-        }
-      });
-
-      const grid = document.getElementById('matrix_grid');
-      grid.innerHTML = '';
+}
 
-      Object.entries(grouped).forEach(([category, items]) => {
-        const box = document.createElement('div');
-        box.className = 'matrix-box';
-        box.innerHTML = `<h4>${category}</h4>` + items.map(ch => {
-          let confClass = 'matrix-low';
-          if (ch.confidence.High >= 2) confClass = 'matrix-high';
-          else if (ch.confidence.Medium >= 2) confClass = 'matrix-medium';
+function renderMatrixItem(ch) {
+  let confClass = 'matrix-low';
+  if (ch.confidence.High >= 2) confClass = 'matrix-high';
+  else if (ch.confidence.Medium >= 2) confClass = 'matrix-medium';
 
-          return `<div class="matrix-item ${confClass}">
+  return `<div class="matrix-item ${confClass}" id="matrix-item-${ch.channel_id}">
             ${ch.channel_name} (Score: ${ch.score})
           </div>`;
-        }).join('');
-        grid.appendChild(box);
-      });
-      
-
-      // === OPERATIONAL DATA FETCH FOR VISUALIZATIONS ===
-      fetch(`/api/operations_data/${currentOperationId}`)
-        .then(res => res.json())
-        .then(opData => {
-
-          const indicators = opData.indicators || [];
-          const chs = opData.channels || [];
-          const linksRaw = opData.channel_links || [];
-
-          if (indicators.length > 0) {
-            const idToName = {};
-            chs.forEach(c => idToName[c.id] = c.name);
-            indicators.forEach(ind => ind.channel_name = idToName[ind.channel_id] || `Channel ${ind.channel_id}`);
-            renderHeatmap(indicators);
-            } else {
-            console.warn("No indicators found for heatmap.");
-          }
-
-          if (linksRaw.length > 0 && chs.length > 0) {
-            const links = linksRaw.map(link => ({
-              source: link.from_channel_id,
-              target: link.to_channel_id,
-              link_type: link.link_type,
-              confidence: link.confidence,
-              evidence: link.evidence
-            }));
-            renderChannelLinkGraph(links, chs);
-          } else {
-            console.warn("No links or channels available for graph.");
-          }
-        })
-        .catch(err => console.error("Error fetching operational data:", err));
-    })
-    .catch(err => console.error("Error in classification fetch:", err));
+}
+
+function matrixCategory(res) {
+  return MATRIX_CATEGORIES.includes(res.classification) ? res.classification : "Unclassified";
+}
+
+// === TEXT AND MATRIX OUTPUT, from matrixState ===
+function renderClassification() {
+  const data = [...matrixState.classification.values()];
+  const box = document.getElementById('classification_results');
+  if (!data.length) {
+    box.innerHTML = "<p>No channels or indicators to classify.</p>";
+    document.getElementById('matrix_grid').innerHTML = '';
+    return;
+  }
+  box.innerHTML = '<h3>Classification Results</h3>' + data.map(renderResultCard).join('');
+
+  const grid = document.getElementById('matrix_grid');
+  grid.innerHTML = '';
+  MATRIX_CATEGORIES.forEach(category => {
+    const items = data.filter(item => matrixCategory(item) === category);
+    const column = document.createElement('div');
+    column.className = 'matrix-box';
+    column.dataset.category = category;
+    column.innerHTML = `<h4>${category}</h4>` + items.map(renderMatrixItem).join('');
+    grid.appendChild(column);
+  });
+}
+
+// Replace or add one channel's result card and move its matrix item to its current category column
+function updateClassification(res) {
+  const card = document.getElementById(`result-${res.channel_id}`);
+  const item = document.getElementById(`matrix-item-${res.channel_id}`);
+  const column = document.querySelector(`#matrix_grid .matrix-box[data-category="${matrixCategory(res)}"]`);
+  if (!column) {
+    renderClassification();
+    return;
+  }
+  if (card) card.outerHTML = renderResultCard(res);
+  else document.getElementById('classification_results').insertAdjacentHTML('beforeend', renderResultCard(res));
+  item?.remove();
+  column.insertAdjacentHTML('beforeend', renderMatrixItem(res));
+}
+
+// === OPERATIONAL DATA VISUALIZATIONS, from matrixState ===
+function renderOperationCharts() {
+  const indicators = [...matrixState.indicators.values()];
+  const linksRaw = [...matrixState.links.values()];
+
+  if (indicators.length > 0) {
+    indicators.forEach(ind => ind.channel_name = getChannelName(ind.channel_id));
+    renderHeatmap(indicators);
+  } else {
+    console.warn("No indicators found for heatmap.");
+  }
+
+  if (linksRaw.length > 0 && channels.length > 0) {
+    const links = linksRaw.map(link => ({
+      source: link.from_channel_id,
+      target: link.to_channel_id,
+      link_type: link.link_type,
+      confidence: link.confidence,
+      evidence: link.evidence
+    }));
+    // d3 adds positions to the nodes, so it gets its own copies of the channels
+    renderChannelLinkGraph(links, channels.map(c => ({ ...c })));
+  } else {
+    d3.select("#channel_link_graph").selectAll("*").remove();
+    console.warn("No links or channels available for graph.");
+  }
+}
+
+// === LIVE UPDATES ===
+
+function liveUpdates() {
+  return operationEvents !== null && operationEvents.readyState === EventSource.OPEN;
+}
+
+function subscribeOperation(opId) {
+  if (operationEvents && operationEvents.opId === opId) return;
+  if (operationEvents) operationEvents.close();
+  operationEvents = null;
+  if (!window.EventSource) return;
+
+  operationEvents = new EventSource(`/operations/${opId}/events`);
+  operationEvents.opId = opId;
+  operationEvents.addEventListener('delta', e => applyDelta(JSON.parse(e.data)));
+  // Bulk imports, catalog changes or missed events: reload what is shown
+  operationEvents.addEventListener('resync', () => {
+    if (opId !== currentOperationId) return;
+    const matrixShown = matrixState !== null;
+    const channelShown = shownChannelId;
+    loadOperation();
+    if (matrixShown) runClassification();
+    if (channelShown) loadChannelIndicators(channelShown);
+  });
+  operationEvents.addEventListener('deleted', () => {
+    if (opId !== currentOperationId) return;
+    notify("Operation deleted.");
+    clearOperation();
+    loadOperationList();
+  });
+}
+
+function upsertById(list, row) {
+  const index = list.findIndex(item => item.id === row.id);
+  if (index >= 0) list[index] = row;
+  else list.push(row);
+}
+
+// Apply one "delta" event: only the channels, indicators, links and classifications it names change
+function applyDelta(delta) {
+  if (delta.operation_id !== currentOperationId) return;
+  const removedChannels = new Set(delta.removed_channels);
+
+  if (delta.operation) {
+    const opt = document.querySelector(`#op_select option[value="${delta.operation_id}"]`);
+    if (opt) opt.textContent = `${delta.operation.name} (${delta.operation.region})`;
+  }
+
+  if (delta.channels.length || removedChannels.size) {
+    channels = channels.filter(c => !removedChannels.has(c.id));
+    delta.channels.forEach(ch => upsertById(channels, ch));
+    renderChannelList();
+    renderChannelDropdowns();
+  }
+
+  if (shownChannelId !== null) {
+    const box = document.getElementById('indicators_view');
+    if (removedChannels.has(shownChannelId)) {
+      box.innerHTML = '';
+      shownChannelId = null;
+    } else {
+      delta.removed_indicators.forEach(id => document.getElementById(`indicator-${id}`)?.remove());
+      delta.indicators
+        .filter(i => i.channel_id === shownChannelId && !document.getElementById(`indicator-${i.id}`))
+        .forEach(i => box.insertAdjacentHTML('beforeend', renderIndicator(i)));
+    }
+  }
+
+  if (!matrixState) return;
+
+  let chartsChanged = delta.channels.length > 0 || removedChannels.size > 0;
+  delta.indicators.forEach(i => matrixState.indicators.set(i.id, i));
+  delta.links.forEach(l => matrixState.links.set(l.id, l));
+  delta.removed_indicators.forEach(id => matrixState.indicators.delete(id));
+  delta.removed_links.forEach(id => matrixState.links.delete(id));
+  // Indicators and links of a deleted channel went with it
+  matrixState.indicators.forEach((i, id) => { if (removedChannels.has(i.channel_id)) matrixState.indicators.delete(id); });
+  matrixState.links.forEach((l, id) => {
+    if (removedChannels.has(l.from_channel_id) || removedChannels.has(l.to_channel_id)) matrixState.links.delete(id);
+  });
+  chartsChanged = chartsChanged || delta.indicators.length > 0 || delta.links.length > 0
+    || delta.removed_indicators.length > 0 || delta.removed_links.length > 0;
+
+  removedChannels.forEach(id => {
+    matrixState.classification.delete(id);
+    document.getElementById(`result-${id}`)?.remove();
+    document.getElementById(`matrix-item-${id}`)?.remove();
+  });
+  delta.classification.forEach(res => {
+    matrixState.classification.set(res.channel_id, res);
+    updateClassification(res);
+  });
+  if (!matrixState.classification.size) renderClassification();
+  if (chartsChanged) renderOperationCharts();
 }
 
 
@@ -525,7 +682,7 @@ function renderChannelLinkGraph(links, channels) {
       .then(() => {
         document.getElementById(`channel-${id}`)?.remove();
         notify("Channel deleted.");
-        loadOperation();
+        if (!liveUpdates()) loadOperation();
       });
   }
   
@@ -534,7 +691,7 @@ function renderChannelLinkGraph(links, channels) {
       .then(() => {
         document.getElementById(`indicator-${id}`)?.remove();
         notify("Indicator deleted.");
-        loadChannelIndicators(channelId);
+        if (!liveUpdates()) loadChannelIndicators(channelId);
       });
   }
   
@@ -543,16 +700,24 @@ function renderChannelLinkGraph(links, channels) {
     fetch(`/operations/${currentOperationId}`, { method: 'DELETE' })
       .then(() => {
         notify("Operation deleted.");
-        currentOperationId = null;
-        document.getElementById('op_select').value = '';
-        document.getElementById('channel_list').innerHTML = '';
-        document.getElementById('indicators_view').innerHTML = '';
-        document.getElementById('classification_results').innerHTML = '';
-        document.getElementById('matrix_grid').innerHTML = '';
+        clearOperation();
         loadOperationList();
       });
   }
 
+  function clearOperation() {
+    if (operationEvents) operationEvents.close();
+    operationEvents = null;
+    matrixState = null;
+    shownChannelId = null;
+    currentOperationId = null;
+    document.getElementById('op_select').value = '';
+    document.getElementById('channel_list').innerHTML = '';
+    document.getElementById('indicators_view').innerHTML = '';
+    document.getElementById('classification_results').innerHTML = '';
+    document.getElementById('matrix_grid').innerHTML = '';
+  }
+
 // Function to trigger report generation
 function generateReport() {
   const notes = document.getElementById("analyst_notes").value;
@@ -565,11 +730,40 @@ function generateReport() {
   })
     .then(res => res.json())
     .then(data => {
-      const rawMarkdown = data.report || "No output returned.";
-      renderMarkdownOutput(rawMarkdown);
+      if (!data.job_id) {
+        renderMarkdownOutput(data.error || "No output returned.");
+        return;
+      }
+      if (data.status === "done") {
+        renderMarkdownOutput(data.report || "No output returned.");
+        return;
+      }
+      renderMarkdownOutput("_Generating report…_");
+      followReport(data.job_id);
     });
 }
 
+// Render the report as its tokens arrive, then check how the job ended
+async function followReport(jobId) {
+  const res = await fetch(`/reports/${jobId}?stream=1`);
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let rawMarkdown = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    rawMarkdown += decoder.decode(value, { stream: true });
+    renderMarkdownOutput(rawMarkdown);
+  }
+
+  const job = await fetch(`/reports/${jobId}`).then(r => r.json());
+  if (job.status === "failed") {
+    renderMarkdownOutput(`Failed to generate the report. Error: ${job.error}`);
+  } else {
+    renderMarkdownOutput(job.report || rawMarkdown || "No output returned.");
+  }
+}
+
 
 
 function renderMarkdownOutput(raw) {
@@ -0,0 +1,223 @@
+"""
+Classification timeline: every channel's score and category over time.
+
+Reads channel_timeline, the per-channel prefix sums of the classification
+aggregates that channel_classification.py keeps up to date as indicators
+arrive. A window [start, end] is cut into buckets of a fixed size and each
+channel is evaluated as of the end of every bucket: its state at the start
+of the window is one grouped read of the last row per channel, and the
+rows inside the window are streamed once in time order. Nothing is
+refolded from the indicators table.
+
+GET /timeline/<operation_id>?start=&end=&bucket= takes ISO 8601 times
+(UTC unless they carry an offset) and a bucket size such as 30m, 6h, 1d,
+2w or a number of seconds. start and end default to the operation's first
+and last indicator timestamps, bucket to "default_bucket" in the
+"timeline" section of config.json. The response lists the bucket ends,
+category counts per bucket, each channel's score and category wherever
+they change, and every change of category.
+
+    python timeline.py OPERATION_ID [--start T] [--end T] [--bucket 1d]
+"""
+
+import math
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import settings
+from classification import UNCLASSIFIED, get_engine
+
+DEFAULT_BUCKET = "1d"
+DEFAULT_MAX_BUCKETS = 1000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # what datetime() stores in channel_timeline.at
+BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+STATE_COLUMNS = "score, high, medium, low, technical, behavioral, flags"
+
+
+class TimelineError(ValueError):
+    """A malformed window or bucket size; reported to the client as 400."""
+
+
+def timeline_config():
+    return settings.get_config().get("timeline", {})
+
+
+def parse_bucket(text):
+    """Bucket size in seconds from '90', '30m', '6h', '1d' or '2w'."""
+    match = re.fullmatch(r"\s*(\d+)\s*([smhdw]?)\s*", str(text))
+    if not match or int(match.group(1)) == 0:
+        raise TimelineError(f"Invalid bucket size '{text}'; use e.g. 30m, 6h, 1d or 2w")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2) or "s"]
+
+
+def parse_time(text, name):
+    """A naive UTC datetime, like the CURRENT_TIMESTAMP values indicators carry."""
+    try:
+        value = datetime.fromisoformat(text.strip())
+    except ValueError:
+        raise TimelineError(f"Invalid {name} '{text}'; use an ISO 8601 date or time") from None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=0)
+
+
+class Window:
+    """The bucket ends of a timeline request, as channel_timeline.at strings."""
+
+    def __init__(self, start, size, count):
+        self.start = start
+        self.size = size
+        self.ends = [(start + timedelta(seconds=size * n)).strftime(TIME_FORMAT) for n in range(1, count + 1)]
+
+    @property
+    def key(self):
+        """Identifies the window, e.g. in the ETag of a timeline response."""
+        return f"{self.start:{TIME_FORMAT}}/{self.size}/{len(self.ends)}"
+
+
+def window(conn, operation_id, start=None, end=None, bucket=None):
+    """
+    Resolve request arguments to a Window. Missing bounds come from the
+    operation's first and last timestamped indicator; the last bucket ends
+    at or after `end`.
+    """
+    size = parse_bucket(bucket or timeline_config().get("default_bucket", DEFAULT_BUCKET))
+    start = parse_time(start, "start") if start else None
+    end = parse_time(end, "end") if end else None
+    if start is None or end is None:
+        first = conn.execute("SELECT MIN(at) FROM channel_timeline WHERE operation_id = ? AND at > ''",
+                             (operation_id,)).fetchone()[0]
+        last = conn.execute("SELECT MAX(at) FROM channel_timeline WHERE operation_id = ?",
+                            (operation_id,)).fetchone()[0]
+        if end is None:
+            end = datetime.strptime(last, TIME_FORMAT) if last else datetime.now(timezone.utc).replace(
+                tzinfo=None, microsecond=0)
+        if start is None:
+            # The first bucket ends at the first indicator
+            start = datetime.strptime(first, TIME_FORMAT) - timedelta(seconds=size) if first else end
+    if end < start:
+        raise TimelineError("end is before start")
+
+    count = max(1, math.ceil((end - start).total_seconds() / size))
+    limit = timeline_config().get("max_buckets", DEFAULT_MAX_BUCKETS)
+    if count > limit:
+        raise TimelineError(f"{count} buckets requested; at most {limit} are allowed, use a larger bucket")
+    return Window(start, size, count)
+
+
+def timeline(conn, operation_id, window):
+    """Scores and categories of the operation's channels at the end of every bucket of `window`."""
+    engine = get_engine(conn)
+    start, ends = window.start.strftime(TIME_FORMAT), window.ends
+    channels = conn.execute("SELECT id, name, notes FROM channels WHERE operation_id = ? ORDER BY id",
+                            (operation_id,)).fetchall()
+
+    names = {channel_id: name for channel_id, name, _ in channels}
+    # Signals from the channel itself (state media in the notes)
+    channel_masks = {channel_id: engine.channel_mask(0, notes) for channel_id, _, notes in channels}
+    categories = {}
+
+    def category(channel_id, state):
+        """Category of a (score, high, medium, low, technical, behavioral, flags) state."""
+        score, high, medium, _, technical, behavioral, flags = state
+        key = (flags | channel_masks[channel_id], score, high, medium, technical, behavioral)
+        result = categories.get(key)
+        if result is None:
+            result = categories[key] = engine.evaluate(*key)[0]
+        return result
+
+    state = dict.fromkeys(names, (0,) * 7)
+    # Each channel's last row at or before the start; SQLite takes the bare columns from the MAX(at) row
+    for row in conn.execute(f"""
+        SELECT channel_id, MAX(at), {STATE_COLUMNS} FROM channel_timeline
+        WHERE operation_id = ? AND at <= ?
+        GROUP BY channel_id
+    """, (operation_id, start)):
+        state[row[0]] = tuple(row[2:])
+
+    current = {channel_id: category(channel_id, s) for channel_id, s in state.items()}
+    counts = Counter(current.values())
+    series = {channel_id: [] for channel_id in names}
+    shown = {}
+    transitions = []
+    count_series = {}
+    changed = set(names)
+
+    def close_bucket(index):
+        """Record the state of the channels that changed during bucket `index`."""
+        for channel_id in sorted(changed):
+            score = state[channel_id][0]
+            after = category(channel_id, state[channel_id])
+            before = current[channel_id]
+            if after != before:
+                counts[before] -= 1
+                counts[after] += 1
+                current[channel_id] = after
+                transitions.append({"channel_id": channel_id, "channel_name": names[channel_id], "at": ends[index],
+                                    "from": engine.label(before), "to": engine.label(after), "score": score})
+            point = (score, engine.label(after))
+            if shown.get(channel_id) != point:
+                shown[channel_id] = point
+                series[channel_id].append([index, *point])
+        changed.clear()
+        for name in set(count_series) | set(counts):
+            count_series.setdefault(name, [0] * len(ends))[index] = counts[name]
+
+    index = 0
+    for channel_id, at, *row in conn.execute(f"""
+        SELECT channel_id, at, {STATE_COLUMNS} FROM channel_timeline
+        WHERE operation_id = ? AND at > ? AND at <= ?
+        ORDER BY at
+    """, (operation_id, start, ends[-1])):
+        while at > ends[index]:
+            close_bucket(index)
+            index += 1
+        state[channel_id] = tuple(row)
+        changed.add(channel_id)
+    while index < len(ends):
+        close_bucket(index)
+        index += 1
+
+    labels = dict.fromkeys([rule[0] for rule in engine.rules] + [UNCLASSIFIED])
+    labels.update(dict.fromkeys(count_series))
+    return {
+        "operation_id": operation_id,
+        "start": start,
+        "end": ends[-1],
+        "bucket_seconds": window.size,
+        "buckets": ends,
+        "counts": {engine.label(c): count_series.get(c, [0] * len(ends)) for c in labels},
+        "channels": [{"channel_id": channel_id, "channel_name": names[channel_id], "series": series[channel_id]}
+                     for channel_id in names],
+        "transitions": transitions,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    from app import get_db
+
+    parser = argparse.ArgumentParser(description="Print the category counts of an operation over time.")
+    parser.add_argument('operation_id', type=int)
+    parser.add_argument('--start', help="ISO 8601 time (default: first indicator)")
+    parser.add_argument('--end', help="ISO 8601 time (default: last indicator)")
+    parser.add_argument('--bucket', help=f"bucket size, e.g. 6h or 1d (default {DEFAULT_BUCKET})")
+    args = parser.parse_args()
+
+    conn = get_db()
+    try:
+        result = timeline(conn, args.operation_id, window(conn, args.operation_id, args.start, args.end, args.bucket))
+    except TimelineError as e:
+        raise SystemExit(str(e))
+    finally:
+        conn.close()
+
+    names = list(result["counts"])
+    print(f"{'bucket end':<20} " + " ".join(f"{name[:16]:>16}" for name in names))
+    for n, end in enumerate(result["buckets"]):
+        print(f"{end:<20} " + " ".join(f"{result['counts'][name][n]:>16}" for name in names))
+    print(f"\n{len(result['transitions'])} category changes")
+    for t in result["transitions"][-20:]:
+        print(f"{t['at']}  {t['channel_name']}: {t['from']} -> {t['to']} (score {t['score']})")